@@ -0,0 +1,240 @@
+"""
+This module contains the admission control of the query routes: an estimate
+of the cost of a request, per-client token buckets and a global budget for
+the cost of the requests in flight.
+
+The cost of a request is one token plus one token per rows_per_token rows
+SQLite is estimated to examine, from the table's row count and whether the
+filters and ordering can use an index. A client spends tokens from its
+bucket, which refills at a fixed rate; a request that finds the bucket empty
+is rejected with 429, and one that would push the cost in flight over the
+global budget with 503, both with a Retry-After header instead of queueing.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+from index_advisor import EQUALITY_OPERATORS, RANGE_OPERATORS
+
+
+# Fraction of a table a range filter on an indexed column is assumed to match
+RANGE_SELECTIVITY = 0.25
+
+
+class RateLimited(Exception):
+    """
+    Raised when a client has spent the tokens of its bucket
+    """
+    def __init__(self, message : str, retry_after : float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """
+    Raised when admitting a request would exceed the budget for the cost in flight
+    """
+    def __init__(self, message : str, retry_after : float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def index_columns(table : Table) -> Dict[str, bool]:
+    """
+    Returns the columns leading an index of a reflected table, including the
+    primary key, mapped to whether that index is unique.
+    """
+    columns = {}
+    primary_key = list(table.primary_key.columns)
+    if primary_key:
+        columns[primary_key[0].name] = len(primary_key) == 1
+    for index in table.indexes:
+        leading = list(index.columns)
+        if leading:
+            name = leading[0].name
+            columns[name] = columns.get(name, False) or bool(index.unique and len(leading) == 1)
+    return columns
+
+
+def estimate_rows(
+    table : Table,
+    table_rows : int,
+    filters : Dict[str, Dict],
+    order_by : Optional[str] = None,
+    page_size : Optional[int] = None,
+    expand : int = 0,
+) -> int:
+    """
+    Returns the estimated number of rows SQLite examines for a query of
+    table with normalized filters.
+
+    Equality on a unique indexed column matches one row, on another indexed
+    column the square root of the table's rows per value, and a range on an
+    indexed column RANGE_SELECTIVITY of the table; otherwise the table is
+    scanned. A page ordered by an index, without filters the index cannot
+    serve, stops after page_size rows. Every expanded relation adds as many
+    rows again.
+    """
+    indexed = index_columns(table)
+    matched = table_rows
+    unindexed_filters = False
+    for column, operators in filters.items():
+        if column not in indexed:
+            unindexed_filters = True
+            continue
+        if any(op in EQUALITY_OPERATORS for op in operators):
+            values = len(operators['in']) if isinstance(operators.get('in'), list) else 1
+            per_value = 1 if indexed[column] else math.sqrt(table_rows)
+            matched = min(matched, values * per_value)
+        elif any(op in RANGE_OPERATORS for op in operators):
+            matched = min(matched, table_rows * RANGE_SELECTIVITY)
+        else:
+            unindexed_filters = True
+    ordered_by_index = order_by is None or order_by in indexed
+    examined = matched
+    if page_size is not None and ordered_by_index and not unindexed_filters:
+        examined = min(examined, page_size)
+    return int(math.ceil(examined * (1 + expand)))
+
+
+class RowCounts:
+    """
+    Estimated row counts of the tables of one database, read on a dedicated
+    connection outside the pool and kept until the data version changes.
+
+    For rowid tables the count is estimated as max(rowid), which SQLite reads
+    from the end of the table's b-tree without scanning it. Other databases
+    than SQLite are not estimated.
+    """
+    def __init__(self, engine : Engine):
+        self.engine = engine
+        self.enabled = engine.dialect.name == 'sqlite'
+        self._connection = None
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._version = None
+
+    def count(self, table : str, version : Optional[int]) -> Optional[int]:
+        """
+        Returns the estimated row count of a table, or None for databases other than SQLite.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if version != self._version:
+                self._counts.clear()
+                self._version = version
+            if table not in self._counts:
+                self._counts[table] = self._read(table)
+            return self._counts[table]
+
+    def _read(self, table : str) -> int:
+        if self._connection is None:
+            cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+            self._connection = self.engine.dialect.connect(*cargs, **cparams)
+        quoted = self.engine.dialect.identifier_preparer.quote(table)
+        cursor = self._connection.cursor()
+        try:
+            try:
+                cursor.execute(f'SELECT max(rowid) FROM {quoted}')
+            except Exception:
+                # WITHOUT ROWID tables have no rowid to estimate from
+                cursor.execute(f'SELECT count(*) FROM {quoted}')
+            return cursor.fetchone()[0] or 0
+        finally:
+            cursor.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class TokenBucket:
+    """
+    Tokens refilled at rate per second up to burst.
+    """
+    def __init__(self, rate : float, burst : float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost : float) -> float:
+        """
+        Spends cost tokens and returns 0, or returns the seconds until enough
+        tokens are available. A request costing more than burst is admitted
+        once the bucket is full and leaves it in debt.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = min(cost, self.burst)
+        if self.tokens < needed:
+            return (needed - self.tokens) / self.rate if self.rate > 0 else math.inf
+        self.tokens -= cost
+        return 0.0
+
+
+class AdmissionController:
+    """
+    Admits requests by cost against a token bucket per client and a global
+    budget for the cost of the requests in flight. Buckets are kept for the
+    max_clients most recent clients.
+    """
+    def __init__(self, rate : float, burst : float, max_inflight_cost : float, max_clients : int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_inflight_cost = max_inflight_cost
+        self.max_clients = max_clients
+        self.inflight_cost = 0.0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def admit(self, client : str, cost : float) -> float:
+        """
+        Admits a request of client and returns its cost, to be passed to
+        release when the request is done. Raises RateLimited or Overloaded.
+        """
+        with self._lock:
+            if self.inflight_cost > 0 and self.inflight_cost + cost > self.max_inflight_cost:
+                self.overloaded += 1
+                raise Overloaded(
+                    f'The server is at its query budget ({self.inflight_cost:.0f} of {self.max_inflight_cost:.0f} '
+                    'cost units in flight)', 1.0,
+                )
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            wait = bucket.take(cost)
+            if wait:
+                self.rate_limited += 1
+                raise RateLimited(f'Rate limit exceeded, the request costs {cost:.1f} tokens', wait)
+            self.inflight_cost += cost
+            self.admitted += 1
+            return cost
+
+    def release(self, cost : float) -> None:
+        with self._lock:
+            self.inflight_cost = max(0.0, self.inflight_cost - cost)
+
+    def stats(self) -> dict:
+        return {
+            'admitted': self.admitted,
+            'rate_limited': self.rate_limited,
+            'overloaded': self.overloaded,
+            'inflight_cost': self.inflight_cost,
+            'max_inflight_cost': self.max_inflight_cost,
+            'clients': len(self._buckets),
+        }
@@ -0,0 +1,110 @@
+"""
+This module contains the aggregate functions accepted by /aggregate/ and the statements built for them.
+
+An aggregation groups the filtered rows of one table by zero or more columns
+and computes aggregates per group inside the database:
+
+    {
+        "table": "Invoice",
+        "group_by": ["BillingCountry"],
+        "aggregates": [
+            {"function": "sum", "column": "Total", "alias": "revenue"},
+            {"function": "count"}
+        ],
+        "order_by": "revenue",
+        "descending": true
+    }
+"""
+from decimal import Decimal
+from typing import List, Optional, Tuple
+from sqlalchemy import Column, Table, bindparam, distinct, func, select
+
+
+AGGREGATE_FUNCTIONS = ('count', 'count_distinct', 'sum', 'avg', 'min', 'max')
+# Functions that only make sense on numeric columns
+NUMERIC_FUNCTIONS = ('sum', 'avg')
+
+
+def table_column(table: Table, name: str) -> Column:
+    """
+    Returns a column of a reflected table. Raises ValueError for unknown columns.
+    """
+    if name not in table.c:
+        raise ValueError(f'Unknown column "{name}" in table "{table.name}"')
+    return table.c[name]
+
+
+def aggregate_alias(function: str, column: Optional[str], alias: Optional[str]) -> str:
+    """
+    Returns the output name of an aggregate: its alias, or the function and column joined by an underscore.
+    """
+    if alias:
+        return alias
+    return function if column is None else f'{function}_{column}'
+
+
+def _aggregate_expression(table: Table, function: str, column_name: Optional[str]):
+    if function not in AGGREGATE_FUNCTIONS:
+        raise ValueError(f'Unknown aggregate function "{function}", expected one of {list(AGGREGATE_FUNCTIONS)}')
+    if column_name is None:
+        if function != 'count':
+            raise ValueError(f'Aggregate function "{function}" requires a column')
+        return func.count()
+    column = table_column(table, column_name)
+    if function in NUMERIC_FUNCTIONS:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = None
+        if python_type is None or not issubclass(python_type, (int, float, Decimal)):
+            raise ValueError(f'Aggregate function "{function}" requires a numeric column, "{column_name}" is {column.type}')
+    if function == 'count':
+        return func.count(column)
+    if function == 'count_distinct':
+        return func.count(distinct(column))
+    return getattr(func, function)(column)
+
+
+def build_aggregate_statement(
+    table: Table,
+    group_by: Tuple[str, ...],
+    aggregates: Tuple[Tuple[str, Optional[str], str], ...],
+    conditions: List,
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    has_limit: bool = False,
+):
+    """
+    Returns the select statement grouping table by the group_by columns with
+    one labelled expression per (function, column, alias) aggregate.
+
+    Rows are ordered by order_by, which names a group_by column or an
+    aggregate alias, or else by the group_by columns. With has_limit the
+    number of groups is bound to the limit parameter.
+    """
+    if not aggregates:
+        raise ValueError('At least one aggregate is required')
+    group_columns = [table_column(table, name) for name in group_by]
+    outputs = dict(zip(group_by, group_columns))
+    expressions = []
+    for function, column_name, alias in aggregates:
+        if alias in outputs:
+            raise ValueError(f'Duplicate output name "{alias}", give the aggregate another alias')
+        expression = _aggregate_expression(table, function, column_name).label(alias)
+        outputs[alias] = expression
+        expressions.append(expression)
+
+    # count(*) alone refers to no column, so the table is named explicitly
+    stmt = select(*group_columns, *expressions).select_from(table).group_by(*group_columns)
+    if conditions:
+        stmt = stmt.where(*conditions)
+    if order_by is not None:
+        if order_by not in outputs:
+            raise ValueError(f'Cannot order by "{order_by}", expected a group_by column or aggregate alias')
+        order = outputs[order_by]
+        stmt = stmt.order_by(order.desc() if descending else order.asc())
+    elif group_columns:
+        stmt = stmt.order_by(*group_columns)
+    if has_limit:
+        stmt = stmt.limit(bindparam('limit'))
+    return stmt
@@ -1,12 +1,23 @@
 """
 This application is a sample API using the FastAPI framework. We tested this using the chinook database by default; however, you can change this for any database that is compatible with SQlite using config.py.
 """
+import math
 import os
 import sys
-from fastapi import FastAPI, Body, HTTPException
-from fastapi.responses import HTMLResponse
+from typing import Callable, Optional
+import anyio
+from fastapi import FastAPI, Body, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, Response, StreamingResponse
 import models
+from admission import AdmissionController, Overloaded, RateLimited
 from db_interface import DBInterface
+from executor import DBExecutor, ExecutorSaturated, ExecutorTimeout
+from exports import ExportManager, ExportsSaturated
+import encoders
+import columnar
+import http_cache
+from metrics import Metrics, MetricsMiddleware
+from query_timing import QueryTimer
 
 
 def is_uvicorn():
@@ -25,6 +36,24 @@ def is_uvicorn():
         return False
 
 
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that calls on_close, on a worker thread, once the
+    response is over however it ended: sent completely, failed, or given up
+    because the client disconnected before or while the body was sent.
+    """
+    def __init__(self, content, on_close : Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await anyio.to_thread.run_sync(self.on_close)
+
+
 def create_app(interface : DBInterface) -> FastAPI:
     """
     Create and configure the FastAPI application that handles database queries
@@ -34,28 +63,181 @@ def create_app(interface : DBInterface) -> FastAPI:
     - /tables/: List all tables in the database
     - /tables/info/: Get information about a specific table
     - /query/: Execute a SQL query against the database
+    - /query/stream: Stream the rows of a query as NDJSON or CSV
+    - /query/batch: Execute several queries in one request
+    - /query/explain: Show the query plan of a query without executing it
+    - /aggregate/: Group rows and compute count, sum, avg, min and max in the database
+    - /views/: List the precomputed hot views and return their results
+    - /exports/: Export query results to CSV or Parquet files in background jobs
+    - /query/advice: Report query shapes that SQLite cannot serve from an index
+    - /stats/: Report cache counters and pool statistics
+    - /metrics: Export request, pool and row metrics in the Prometheus text format
     - /: Provide a welcome message with API documentation
+
+    Database calls are dispatched through a DBExecutor configured by the
+    execution_mode setting, so they do not have to block the event loop.
+    Query requests are first admitted by their estimated cost against a
+    token bucket per client and a budget for the cost in flight.
     """
     app = FastAPI()
+    executor = DBExecutor(
+        mode=interface.execution_mode,
+        max_workers=interface.max_workers,
+        max_queue=interface.max_queue,
+        timeout=interface.request_timeout,
+    )
+    app.state.executor = executor
+    admission = None
+    if interface.admission_enabled:
+        admission = AdmissionController(
+            interface.admission_rate,
+            interface.admission_burst,
+            interface.admission_max_inflight_cost,
+            interface.admission_max_clients,
+        )
+    app.state.admission = admission
+    app.add_event_handler('shutdown', executor.shutdown)
+    app.add_event_handler('shutdown', interface.version_probe.close)
+    exports = ExportManager(
+        interface,
+        interface.export_directory,
+        mode=interface.export_mode,
+        max_workers=interface.export_workers,
+        max_pending=interface.export_max_pending,
+        retention=interface.export_retention,
+    )
+    app.state.exports = exports
+    app.add_event_handler('shutdown', exports.close)
+    app.add_event_handler('shutdown', interface.close_views)
+    app.add_event_handler('shutdown', interface.close_databases)
+    app.add_event_handler('shutdown', interface.close_batch_pool)
+    app.add_event_handler('shutdown', interface.close_logging)
+    metrics = Metrics()
+    app.state.metrics = metrics
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    def count_rows(table : str, rows : int) -> None:
+        """
+        Counts the rows returned for a table.
+        """
+        metrics.inc('db_rows_returned_total', (('table', table),), rows)
+
+    def count_streamed_rows(table : str, chunks):
+        """
+        Counts the rows of a stream as its chunks are sent.
+        """
+        for chunk in chunks:
+            metrics.inc('db_rows_returned_total', (('table', table),), len(chunk))
+            yield chunk
+
+    def cache_headers(etag : Optional[str], vary : Optional[str] = None) -> dict:
+        """
+        Returns the Cache-Control, ETag and Vary headers of a cacheable response.
+        """
+        headers = {'Cache-Control': http_cache.cache_control(interface.cache_max_age)}
+        if etag is not None:
+            headers['ETag'] = etag
+        if vary is not None:
+            headers['Vary'] = vary
+        return headers
+
+    def not_modified(http_request : Request, etag : Optional[str], vary : Optional[str] = None) -> Optional[Response]:
+        """
+        Returns a 304 Not Modified response when the If-None-Match header of the request matches etag.
+        """
+        if etag is not None and http_cache.etag_matches(http_request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=cache_headers(etag, vary))
+        return None
+
+    def view_response(http_request : Request, table : str, snapshot, vary : Optional[str] = None) -> Response:
+        """
+        Returns the precomputed JSON body of a hot view, or 304 Not Modified when the client has it.
+        """
+        response = not_modified(http_request, snapshot.etag, vary)
+        if response is not None:
+            return response
+        http_request.state.table = table
+        count_rows(table, len(snapshot.result['result']))
+        return Response(content=snapshot.body, media_type='application/json', headers=cache_headers(snapshot.etag, vary))
+
+    async def admit(http_request : Request, request, paginate : bool = True) -> float:
+        """
+        Admits a request of the client of http_request at its estimated cost
+        and returns the cost to release when it is done, translating
+        rejections into 429 and 503 responses with a Retry-After header.
+        The cost is estimated on the executor, as it may read the database.
+        """
+        if admission is None:
+            return 0.0
+        cost = await run_db(interface.estimate_cost, interface.metadata, request, paginate)
+        client = None
+        if interface.admission_client_header:
+            client = http_request.headers.get(interface.admission_client_header)
+        if not client:
+            client = http_request.client.host if http_request.client is not None else 'unknown'
+        try:
+            return admission.admit(client, cost)
+        except (RateLimited, Overloaded) as e:
+            status_code = 429 if isinstance(e, RateLimited) else 503
+            retry_after = max(1, math.ceil(min(e.retry_after, 3600)))
+            raise HTTPException(status_code=status_code, detail=str(e), headers={'Retry-After': str(retry_after)})
+
+    def release(cost : float) -> None:
+        if admission is not None:
+            admission.release(cost)
+
+    async def run_db(func, *args):
+        """
+        Run a DBInterface call on the executor and translate saturation and
+        timeouts into HTTP errors.
+        """
+        try:
+            return await executor.run(func, *args)
+        except ExecutorSaturated as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'})
+        except ExecutorTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
 
-    @app.get('/tables/', tags=['DCL'])
-    async def get_tables() -> models.TableList:
-        results = interface.get_tables()
+    @app.get('/tables/', tags=['DCL'], response_model=models.TableList)
+    async def get_tables(http_request: Request) -> Response:
+        """
+        Returns the table names from the in-memory schema catalog.
+        """
+        etag = interface.etag('tables', data=False)
+        response = not_modified(http_request, etag)
+        if response is not None:
+            return response
+        results = await run_db(interface.schema_catalog)
         if 'error' in results:
             raise HTTPException(status_code=400, detail=results['error'])
-        results = models.TableList(**results)
-        return results
+        return Response(content=results['catalog'].tables_body, media_type='application/json', headers=cache_headers(etag))
 
-    @app.get('/tables/info/{table}', tags=['DCL'])
-    async def table_info(table: str) -> models.TableWrapper:
-        results = interface.table_info(table)
+    @app.get('/tables/info/{table}', tags=['DCL'], response_model=models.TableWrapper)
+    async def table_info(table: str, http_request: Request) -> Response:
+        """
+        Returns the column types of a table from the in-memory schema catalog.
+        """
+        etag = interface.etag('table_info', table, data=False)
+        response = not_modified(http_request, etag)
+        if response is not None:
+            return response
+        results = await run_db(interface.schema_catalog)
         if 'error' in results:
             raise HTTPException(status_code=400, detail=results['error'])
-        results = models.TableWrapper.model_validate(results)
-        return results
+        # only tables of the catalog label the metrics, so made up names add no label series
+        if table in results['catalog'].table_names:
+            http_request.state.table = table
+        return Response(
+            content=results['catalog'].table_body(table), media_type='application/json', headers=cache_headers(etag)
+        )
 
     @app.post('/query/', tags=['DML'])
-    async def query(request: models.QueryRequest = Body(...)) -> models.DBQueryResponse:
+    async def query(
+        http_request: Request,
+        http_response: Response,
+        request: models.QueryRequest = Body(...),
+        accept: str = Header(default='application/json'),
+    ) -> models.DBQueryResponse:
         """
         Accepts JSON as input, converts it to a SQL query, and returns the results.
 
@@ -68,13 +250,295 @@ def create_app(interface : DBInterface) -> FastAPI:
                     "ArtistId": 1
                 }
             }
+
+        With fast_serialization enabled the result is encoded straight to
+        JSON bytes, skipping Pydantic validation; the output is unchanged.
+
+        Analytics clients can ask for a columnar encoding with the Accept
+        header: application/vnd.columnar+json returns one array of values per
+        column, and application/vnd.apache.arrow.stream returns an Arrow IPC
+        stream (requires pyarrow) with the next cursor in the X-Next-Cursor header.
+        Column types are taken from the reflected table.
+
+        Responses carry an ETag of the database version and the request; a
+        request with a matching If-None-Match header is answered with 304 Not
+        Modified without running the query.
+
+        Requests are admitted by their estimated cost; a client that has spent
+        its tokens gets 429 and a server at its query budget 503, both with a
+        Retry-After header.
+        """
+        response_format = columnar.negotiate(accept)
+        if response_format == 'arrow' and columnar.pyarrow is None:
+            raise HTTPException(status_code=406, detail='Arrow responses require pyarrow to be installed')
+        if response_format != 'json' and request.expand:
+            raise HTTPException(status_code=400, detail='expand is not supported for columnar responses')
+        snapshot = interface.hot_views.match('query', request) if response_format == 'json' else None
+        if snapshot is not None:
+            return view_response(http_request, request.table, snapshot, vary='Accept')
+        etag = interface.etag('query', request.model_dump(), response_format, database=request.database)
+        response = not_modified(http_request, etag, vary='Accept')
+        if response is not None:
+            return response
+        cost = await admit(http_request, request)
+        timer = QueryTimer()
+        try:
+            result = await run_db(interface.query, interface.metadata, request, timer)
+        finally:
+            release(cost)
+        if 'error' in result:
+            interface.finish_query(request, timer, result)
+            raise HTTPException(status_code=400, detail=result['error'])
+        http_request.state.table = request.table
+        count_rows(request.table, len(result['result']))
+        if response_format == 'columnar':
+            columns = interface.result_columns(interface.metadata, request)
+            response = Response(
+                content=columnar.dumps_columnar_json(result, columns), media_type=columnar.COLUMNAR_JSON_MEDIA_TYPE
+            )
+        elif response_format == 'arrow':
+            columns = interface.result_columns(interface.metadata, request)
+            headers = {'X-Next-Cursor': result['next_cursor']} if result.get('next_cursor') else None
+            response = Response(
+                content=columnar.dumps_arrow(result, columns),
+                media_type=columnar.ARROW_STREAM_MEDIA_TYPE,
+                headers=headers,
+            )
+        elif interface.fast_serialization:
+            response = Response(content=encoders.dumps_json(result), media_type='application/json')
+        else:
+            response = models.DBQueryResponse(**result)
+        headers = cache_headers(etag, vary='Accept')
+        if isinstance(response, Response):
+            response.headers.update(headers)
+        else:
+            http_response.headers.update(headers)
+        timer.mark('serialize')
+        interface.finish_query(request, timer, result)
+        return response
+
+    @app.post('/aggregate/', tags=['DML'])
+    async def aggregate(
+        http_request: Request, http_response: Response, request: models.AggregateRequest = Body(...)
+    ) -> models.AggregateResponse:
+        """
+        Accepts JSON describing groups and aggregates, computes them in the
+        database and returns one row per group.
+
+        For example:
+
+            {
+                "table": "Invoice",
+                "group_by": ["BillingCountry"],
+                "aggregates": [{"function": "sum", "column": "Total", "alias": "revenue"}],
+                "order_by": "revenue",
+                "descending": true
+            }
+        """
+        snapshot = interface.hot_views.match('aggregate', request)
+        if snapshot is not None:
+            return view_response(http_request, request.table, snapshot)
+        etag = interface.etag('aggregate', request.model_dump(), database=request.database)
+        response = not_modified(http_request, etag)
+        if response is not None:
+            return response
+        cost = await admit(http_request, request, paginate=False)
+        try:
+            result = await run_db(interface.aggregate, interface.metadata, request)
+        finally:
+            release(cost)
+        if 'error' in result:
+            raise HTTPException(status_code=400, detail=result['error'])
+        http_request.state.table = request.table
+        count_rows(request.table, len(result['result']))
+        if interface.fast_serialization:
+            return Response(content=encoders.dumps_json(result), media_type='application/json', headers=cache_headers(etag))
+        http_response.headers.update(cache_headers(etag))
+        return models.AggregateResponse(**result)
+
+    @app.post('/query/explain', tags=['DML'])
+    async def query_explain(request: models.QueryRequest = Body(...)) -> models.QueryPlan:
+        """
+        Accepts the same JSON as /query/ and returns the SQL it would run with
+        SQLite's EXPLAIN QUERY PLAN, without executing the query.
+        """
+        result = await run_db(interface.explain_query, interface.metadata, request)
+        if 'error' in result:
+            raise HTTPException(status_code=400, detail=result['error'])
+        return models.QueryPlan(**result)
+
+    @app.post('/query/batch', tags=['DML'])
+    async def query_batch(
+        http_request: Request, request: models.BatchQueryRequest = Body(...)
+    ) -> models.BatchQueryResponse:
+        """
+        Accepts a list of /query/ requests and returns their results in the same order.
+
+        For example:
+
+            {
+                "queries": [
+                    {"table": "Album", "filters": {"ArtistId": 1}},
+                    {"table": "Track", "filters": {"AlbumId": 1}}
+                ]
+            }
+
+        Failed queries are reported in the "error" field of their item. The
+        batch is admitted at the summed cost of its queries.
         """
-        result = interface.query(interface.metadata, request)
+        cost = await admit(http_request, request)
+        try:
+            result = await run_db(interface.query_batch, interface.metadata, request)
+        finally:
+            release(cost)
         if 'error' in result:
             raise HTTPException(status_code=400, detail=result['error'])
-        result = models.DBQueryResponse(**result)
+        for query, item in zip(request.queries, result['results']):
+            if 'result' in item:
+                count_rows(query.table, len(item['result']))
+        if interface.fast_serialization:
+            return Response(content=encoders.dumps_json(result), media_type='application/json')
+        result = models.BatchQueryResponse(**result)
         return result
 
+    @app.post('/query/stream', tags=['DML'])
+    async def query_stream(
+        http_request: Request,
+        request: models.QueryRequest = Body(...),
+        accept: str = Header(default=encoders.NDJSON_MEDIA_TYPE),
+    ) -> StreamingResponse:
+        """
+        Accepts the same JSON as /query/ and streams every matching row without paging.
+
+        Rows are sent as newline delimited JSON, or as CSV when the Accept
+        header asks for text/csv. The admitted cost is held until the stream ends.
+        """
+        cost = await admit(http_request, request, paginate=False)
+        try:
+            result = await run_db(interface.stream_query, interface.metadata, request)
+        except BaseException:
+            release(cost)
+            raise
+        if 'error' in result:
+            release(cost)
+            raise HTTPException(status_code=400, detail=result['error'])
+        http_request.state.table = request.table
+        chunks = count_streamed_rows(request.table, result['chunks'])
+        if encoders.CSV_MEDIA_TYPE in accept:
+            media_type, content = encoders.CSV_MEDIA_TYPE, encoders.iter_csv(result['keys'], chunks)
+        else:
+            media_type, content = encoders.NDJSON_MEDIA_TYPE, encoders.iter_ndjson(result['keys'], chunks)
+
+        def close_stream() -> None:
+            """
+            Closes the row generators, returning the connection to the pool, and releases the admitted cost.
+            """
+            try:
+                content.close()
+                result['chunks'].close()
+            finally:
+                release(cost)
+
+        return ClosingStreamingResponse(content, close_stream, media_type=media_type)
+
+    @app.get('/views/', tags=['DML'])
+    def list_views():
+        """
+        Returns the hot views with their size, age and refresh statistics.
+        """
+        return interface.hot_views.stats()
+
+    @app.get('/views/{name}', tags=['DML'])
+    def get_view(name: str, http_request: Request) -> Response:
+        """
+        Returns the precomputed result of a hot view, in the format of the
+        /query/ or /aggregate/ response to its request.
+        """
+        view = interface.hot_views.get(name)
+        if view is None:
+            raise HTTPException(status_code=404, detail=f'Unknown view "{name}"')
+        snapshot = view.snapshot
+        if snapshot is None:
+            raise HTTPException(status_code=503, detail=f'View "{name}" is not computed yet: {view.error}')
+        return view_response(http_request, view.request.table, snapshot)
+
+    @app.post('/exports/', tags=['DML'], status_code=202)
+    async def create_export(
+        http_response: Response,
+        request: models.QueryRequest = Body(...),
+        export_format: str = Query(default='csv', alias='format'),
+    ) -> dict:
+        """
+        Accepts the same JSON as /query/stream and queues a job writing every
+        matching row to a gzip compressed CSV file (format=csv) or a Parquet
+        file (format=parquet, requires pyarrow). Returns the job, whose status
+        can be polled at /exports/{id} until its file can be downloaded.
+        """
+        result = await run_db(interface.check_stream, interface.metadata, request)
+        if 'error' in result:
+            raise HTTPException(status_code=400, detail=result['error'])
+        try:
+            job = exports.submit(request, export_format)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ExportsSaturated as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '10'})
+        http_response.headers['Location'] = f'/exports/{job.id}'
+        return job.describe()
+
+    @app.get('/exports/', tags=['DML'])
+    def list_exports() -> list:
+        """
+        Returns the export jobs that have not expired.
+        """
+        return exports.list()
+
+    def export_job(job_id : str):
+        job = exports.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f'Unknown export "{job_id}"')
+        return job
+
+    @app.get('/exports/{job_id}', tags=['DML'])
+    def get_export(job_id: str) -> dict:
+        """
+        Returns the status of an export job: queued, running, done, failed or cancelled.
+        """
+        return export_job(job_id).describe()
+
+    @app.get('/exports/{job_id}/file', tags=['DML'])
+    def download_export(job_id: str) -> FileResponse:
+        """
+        Returns the file of a finished export job.
+        """
+        job = export_job(job_id)
+        if job.status != 'done':
+            raise HTTPException(status_code=409, detail=f'Export "{job_id}" is {job.status}')
+        filename = f'{job.request.table}-{job.id}{job.path.name[len(job.id):]}'
+        return FileResponse(job.path, media_type=job.media_type, filename=filename)
+
+    @app.delete('/exports/{job_id}', tags=['DML'], status_code=204)
+    def delete_export(job_id: str) -> Response:
+        """
+        Cancels a queued export job or deletes a finished one with its file.
+        """
+        export_job(job_id)
+        if not exports.remove(job_id):
+            raise HTTPException(status_code=409, detail=f'Export "{job_id}" is running and cannot be cancelled')
+        return Response(status_code=204)
+
+    @app.get('/query/advice', tags=['Health'])
+    def query_advice(problems_only: bool = False):
+        """
+        Returns the query plans seen by the index advisor, with a suggested
+        index for shapes that scan a table or sort without an index.
+        """
+        advisor = interface.index_advisor
+        return {
+            'enabled': advisor is not None,
+            'shapes': advisor.advice(problems_only) if advisor is not None else [],
+        }
+
     @app.get('/', tags=['Welcome'])
     async def root():
         """
@@ -83,6 +547,60 @@ def create_app(interface : DBInterface) -> FastAPI:
         response = HTMLResponse(content=interface.docs_body, status_code=200)
         return response
 
+    @app.get('/stats/', tags=['Health'])
+    def stats():
+        """
+        Returns cache counters and connection pool statistics for the database interface.
+        """
+        return {
+            'statement_cache': interface.statement_cache.stats(),
+            'result_cache': interface.result_cache.stats(),
+            'pool': interface.pool_stats(),
+            'queries': interface.query_timings.stats(),
+            'logging': interface.logging_stats(),
+            'databases': interface.database_stats(),
+            'views': interface.hot_views.stats(),
+            'exports': exports.stats(),
+            'admission': admission.stats() if admission is not None else None,
+            'startup_seconds': interface.startup_timings,
+        }
+
+    @app.get('/metrics', tags=['Health'], response_class=PlainTextResponse)
+    def export_metrics() -> PlainTextResponse:
+        """
+        Returns request latency histograms, the in-flight request count,
+        response bytes and returned rows, with connection pool and query
+        phase statistics, in the Prometheus text exposition format.
+        """
+        pool = interface.pool_stats()
+        extra = [
+            ('db_pool_size', 'gauge', 'Connections kept in the pool.', (), pool.get('size', 0)),
+            ('db_pool_checked_out', 'gauge', 'Connections checked out of the pool.', (), pool.get('checkedout', 0)),
+            ('db_pool_overflow', 'gauge', 'Connections open beyond the pool size.', (), pool.get('overflow', 0)),
+            ('db_pool_checkouts_total', 'counter', 'Connections checked out of the pool.', (), pool['checkouts']),
+            ('db_pool_checkout_wait_seconds_total', 'counter', 'Time spent waiting for pool checkouts.', (), pool['wait_seconds']),
+            ('db_pool_checkout_wait_seconds_max', 'gauge', 'Longest wait for a pool checkout.', (), pool['max_wait_seconds']),
+            ('db_executor_pending', 'gauge', 'Database calls running or queued on the executor.', (), executor.pending),
+        ]
+        logging_stats = interface.logging_stats()
+        extra.append(('log_lines_sampled_out_total', 'counter', 'Hot path log lines left out by sampling.', (), logging_stats['sampled_out']))
+        if logging_stats['async']:
+            extra.append(('log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full.', (), logging_stats['dropped']))
+            extra.append(('log_queue_pending', 'gauge', 'Log records waiting for the background writer.', (), logging_stats['pending']))
+        if admission is not None:
+            admission_stats = admission.stats()
+            for reason in ('rate_limited', 'overloaded'):
+                extra.append((
+                    'admission_rejected_total', 'counter', 'Query requests rejected by admission control.',
+                    (('reason', reason),), admission_stats[reason],
+                ))
+            extra.append(('admission_inflight_cost', 'gauge', 'Estimated cost of the admitted requests in flight.', (), admission_stats['inflight_cost']))
+        for phase, stats in interface.query_timings.stats()['phases'].items():
+            labels = (('phase', phase),)
+            extra.append(('db_query_phase_seconds_total', 'counter', 'Time spent in each query phase.', labels, stats['seconds']))
+            extra.append(('db_query_phases_total', 'counter', 'Queries that went through each phase.', labels, stats['count']))
+        return PlainTextResponse(metrics.render(extra), media_type='text/plain; version=0.0.4')
+
     @app.get("/healthcheck", tags=["Health"])
     def health_check():
         return {"status": "ok"}
@@ -0,0 +1,136 @@
+"""
+Helpers shared by the benchmarks: DBInterface setup on any SQLite file,
+latency statistics, and JSON results that can be compared with a baseline.
+"""
+import configparser
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+REPO_DIRECTORY = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(REPO_DIRECTORY))
+
+import sqlalchemy
+from db_interface import DBInterface
+
+
+def make_interface(db_path: Optional[Path] = None, **overrides) -> DBInterface:
+    """
+    Returns a DBInterface on db_path (the chinook database by default), with
+    options of config.ini overridden as section__option=value.
+    """
+    config = configparser.ConfigParser()
+    config.read(REPO_DIRECTORY / 'config.ini')
+    if db_path is not None:
+        db_path = Path(db_path).absolute()
+        config['database']['db_directory'] = str(db_path.parent)
+        config['database']['db_filename'] = db_path.name
+        config['database']['connection_string'] = f'sqlite:///{db_path}'
+    for key, value in overrides.items():
+        section, option = key.split('__')
+        config[section][option] = str(value)
+    config_file = Path(tempfile.mkdtemp(prefix='bench_config_')) / 'config.ini'
+    with open(config_file, 'w') as file:
+        config.write(file)
+    return DBInterface(config_file)
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """
+    Returns the mean and percentiles in milliseconds of latency samples given in seconds.
+    """
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def time_calls(func: Callable[[], object], iterations: int, warmup: int = 3) -> Dict[str, float]:
+    """
+    Calls func warmup times untimed, then iterations times, and returns the
+    latency statistics with the throughput in calls per second.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    stats = latency_stats(samples)
+    stats['ops_per_sec'] = len(samples) / sum(samples)
+    return stats
+
+
+def environment(db_path: Optional[Path]) -> dict:
+    """
+    Describes the machine and database a benchmark ran on, stored with its results.
+    """
+    db_path = Path(db_path) if db_path is not None else REPO_DIRECTORY / 'db' / 'chinook.db'
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'database': str(db_path),
+        'database_bytes': db_path.stat().st_size,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[dict]:
+    """
+    Returns the results whose p50 latency is more than tolerance (a fraction)
+    above the baseline result of the same name.
+    """
+    baseline_by_name = {row['name']: row for row in baseline}
+    regressions = []
+    for row in results:
+        base = baseline_by_name.get(row['name'])
+        if base is None or not base['p50_ms']:
+            continue
+        ratio = row['p50_ms'] / base['p50_ms']
+        if ratio > 1 + tolerance:
+            regressions.append({'name': row['name'], 'baseline_p50_ms': base['p50_ms'], 'p50_ms': row['p50_ms'], 'ratio': ratio})
+    return regressions
+
+
+def report(benchmark: str, results: List[dict], env: dict, output: Optional[str], baseline: Optional[str], tolerance: float) -> int:
+    """
+    Prints a results table, writes the results as JSON to output, and
+    compares them with a baseline results file. Returns the process exit
+    status: 1 when a result regressed beyond tolerance, else 0.
+    """
+    print(f"{'name':<40}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>12}")
+    for row in results:
+        print(f"{row['name']:<40}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['ops_per_sec']:>12.1f}")
+
+    document = {'benchmark': benchmark, 'environment': env, 'results': results}
+    if output:
+        with open(output, 'w') as file:
+            json.dump(document, file, indent=2)
+        print(f'Results written to {output}')
+
+    if baseline:
+        with open(baseline) as file:
+            baseline_document = json.load(file)
+        regressions = compare(results, baseline_document['results'], tolerance)
+        for row in regressions:
+            print(f"REGRESSION {row['name']}: p50 {row['baseline_p50_ms']:.3f} ms -> {row['p50_ms']:.3f} ms ({row['ratio']:.2f}x)")
+        if regressions:
+            return 1
+        print(f'No regressions beyond {tolerance:.0%} against {baseline}')
+    return 0
@@ -0,0 +1,66 @@
+"""
+Micro-benchmarks of DBInterface.query, get_tables and table_info.
+
+Each case is called directly on a DBInterface, without HTTP, and timed per
+call. Query cases run with the result cache disabled so that every call
+reaches the database; use --result-cache to measure cached calls instead.
+
+Run from the repository root, on the chinook database or a synthetic one:
+
+    python benchmarks/bench_interface.py [--database bench.db] [--iterations 200]
+        [--output results.json] [--baseline baseline.json --tolerance 0.1]
+"""
+import argparse
+import sys
+
+from bench_common import environment, make_interface, report, time_calls
+import models
+
+
+QUERY_CASES = {
+    'query Album by ArtistId': {'table': 'Album', 'filters': {'ArtistId': 1}},
+    'query Track page of 100': {'table': 'Track', 'limit': 100},
+    'query Track page of 1000': {'table': 'Track', 'limit': 1000},
+    'query Track by Milliseconds range': {'table': 'Track', 'filters': {'Milliseconds': {'gte': 200000, 'lt': 210000}}, 'limit': 100},
+    'query Invoice ordered by InvoiceDate': {'table': 'Invoice', 'order_by': 'InvoiceDate', 'limit': 100},
+    'query InvoiceLine by InvoiceId': {'table': 'InvoiceLine', 'filters': {'InvoiceId': 7}},
+    'query InvoiceLine page of 1000': {'table': 'InvoiceLine', 'limit': 1000},
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database', help='SQLite file to benchmark, the chinook database by default')
+    parser.add_argument('--iterations', type=int, default=200, help='timed calls per case')
+    parser.add_argument('--result-cache', action='store_true', help='keep the /query/ result cache enabled')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='results file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed p50 slowdown against the baseline')
+    args = parser.parse_args()
+
+    overrides = {'logging__log_sample_rates': 'query:0'}
+    if not args.result_cache:
+        overrides['cache__result_cache_entries'] = 0
+    interface = make_interface(args.database, **overrides)
+
+    cases = {
+        'get_tables': interface.get_tables,
+        'table_info Track': lambda: interface.table_info('Track'),
+    }
+    for name, request_body in QUERY_CASES.items():
+        request = models.QueryRequest(**request_body)
+        cases[name] = lambda request=request: interface.query(interface.metadata, request)
+
+    results = []
+    for name, func in cases.items():
+        outcome = func()
+        if 'error' in outcome:
+            print(f'Skipping {name}: {outcome["error"]}')
+            continue
+        results.append({'name': name, **time_calls(func, args.iterations)})
+
+    return report('interface', results, environment(args.database), args.output, args.baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+In-process ASGI load test of the application built by create_app.
+
+Requests are sent straight to the ASGI application, without a server or
+sockets, by a number of concurrent clients on one event loop. Every
+scenario is run once per concurrency level of the sweep, and latency
+percentiles and throughput are reported for each.
+
+Run from the repository root, on the chinook database or a synthetic one:
+
+    python benchmarks/bench_load.py [--database bench.db] [--concurrency 1 4 16 64]
+        [--requests 500] [--output results.json] [--baseline baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from bench_common import environment, latency_stats, make_interface, report
+from app import create_app
+
+
+SCENARIOS = {
+    'GET /tables/': ('GET', '/tables/', None),
+    'GET /tables/info/Track': ('GET', '/tables/info/Track', None),
+    'POST /query/ Album by ArtistId': ('POST', '/query/', {'table': 'Album', 'filters': {'ArtistId': 1}}),
+    'POST /query/ Track page of 100': ('POST', '/query/', {'table': 'Track', 'limit': 100}),
+    'POST /query/ InvoiceLine by InvoiceId': ('POST', '/query/', {'table': 'InvoiceLine', 'filters': {'InvoiceId': 7}}),
+}
+
+
+async def asgi_request(app, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, bytes]:
+    """
+    Sends one HTTP request to an ASGI application and returns the status and response body.
+    """
+    payload = json.dumps(body).encode() if body is not None else b''
+    headers = [(b'host', b'bench')]
+    if body is not None:
+        headers += [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('bench', 80),
+    }
+    request_sent = False
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+async def run_load(app, method: str, path: str, body: Optional[dict], concurrency: int, total: int) -> dict:
+    """
+    Sends total requests from concurrency clients and returns latency and throughput statistics.
+    """
+    samples: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status, _ = await asgi_request(app, method, path, body)
+            samples.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stats = latency_stats(samples)
+    stats.update({'concurrency': concurrency, 'errors': errors, 'ops_per_sec': len(samples) / elapsed})
+    return stats
+
+
+async def sweep(app, concurrency_levels: List[int], total: int, warmup: int) -> List[dict]:
+    results = []
+    for name, (method, path, body) in SCENARIOS.items():
+        status, content = await asgi_request(app, method, path, body)
+        if status != 200:
+            print(f'Skipping {name}: {status} {content[:200]!r}')
+            continue
+        await run_load(app, method, path, body, concurrency=1, total=warmup)
+        for concurrency in concurrency_levels:
+            stats = await run_load(app, method, path, body, concurrency, total)
+            results.append({'name': f'{name} c={concurrency}', 'scenario': name, **stats})
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database', help='SQLite file to benchmark, the chinook database by default')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64], help='concurrent clients to sweep')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario and concurrency level')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests per scenario')
+    parser.add_argument('--result-cache', action='store_true', help='keep the /query/ result cache enabled')
+    parser.add_argument('--fast-serialization', action='store_true', help='enable the fast /query/ serialization path')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='results file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed p50 slowdown against the baseline')
+    args = parser.parse_args()
+
+    overrides = {
+        'logging__log_sample_rates': 'query:0',
+        'api__fast_serialization': str(args.fast_serialization).lower(),
+        # one client sending as fast as it can would measure the rate limit rather than the server
+        'admission__enabled': 'false',
+    }
+    if not args.result_cache:
+        overrides['cache__result_cache_entries'] = 0
+    interface = make_interface(args.database, **overrides)
+    app = create_app(interface)
+    try:
+        results = asyncio.run(sweep(app, args.concurrency, args.requests, args.warmup))
+    finally:
+        app.state.executor.shutdown()
+
+    env = dict(environment(args.database), execution_mode=interface.execution_mode, max_workers=interface.max_workers)
+    return report('load', results, env, args.output, args.baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
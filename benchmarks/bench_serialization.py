@@ -0,0 +1,91 @@
+"""
+Benchmark of the /query/ response serialization paths.
+
+Compares the default path (DBQueryResponse validation, FastAPI response model
+validation and JSONResponse rendering) with the fast_serialization path
+(encoders.dumps_json straight to bytes) on real query results.
+
+Run from the repository root:
+
+    python benchmarks/bench_serialization.py [--repeat 20] [--json]
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+import encoders
+import models
+from db_interface import DBInterface
+
+
+CASES = {
+    'Album page': {'table': 'Album', 'limit': 100},
+    'Invoice page': {'table': 'Invoice', 'limit': 1000},
+    'Customer page': {'table': 'Customer'},
+    'Track page': {'table': 'Track', 'limit': 1000},
+}
+
+response_adapter = TypeAdapter(models.DBQueryResponse)
+
+
+def pydantic_path(result: dict) -> bytes:
+    """
+    The default path: the route builds the model and FastAPI validates and serializes it again.
+    """
+    model = models.DBQueryResponse(**result)
+    content = response_adapter.dump_python(response_adapter.validate_python(model), mode='json')
+    return JSONResponse(content).body
+
+
+def fast_path(result: dict) -> bytes:
+    """
+    The fast_serialization path.
+    """
+    return Response(content=encoders.dumps_json(result), media_type='application/json').body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=20, help='calls timed per case and path')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    interface = DBInterface()
+    results = []
+    for name, request_body in CASES.items():
+        result = interface.query(interface.metadata, models.QueryRequest(**request_body))
+        assert json.loads(pydantic_path(result)) == json.loads(fast_path(result))
+        timings = {
+            path.__name__: min(timeit.repeat(lambda: path(result), number=1, repeat=args.repeat))
+            for path in (pydantic_path, fast_path)
+        }
+        results.append({
+            'case': name,
+            'rows': len(result['result']),
+            'bytes': len(fast_path(result)),
+            'pydantic_path_ms': timings['pydantic_path'] * 1000,
+            'fast_path_ms': timings['fast_path'] * 1000,
+            'speedup': timings['pydantic_path'] / timings['fast_path'],
+        })
+
+    if args.json:
+        print(json.dumps({'encoder': 'orjson' if encoders.orjson else 'json', 'results': results}, indent=2))
+        return
+
+    print(f"encoder: {'orjson' if encoders.orjson else 'json'}")
+    print(f"{'case':<16}{'rows':>6}{'bytes':>10}{'pydantic ms':>14}{'fast ms':>10}{'speedup':>9}")
+    for row in results:
+        print(
+            f"{row['case']:<16}{row['rows']:>6}{row['bytes']:>10}"
+            f"{row['pydantic_path_ms']:>14.3f}{row['fast_path_ms']:>10.3f}{row['speedup']:>8.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Generator of synthetic SQLite databases with the Chinook schema at any scale.
+
+Row counts of every table are derived from the number of InvoiceLine rows,
+and values are drawn from a seeded generator so the same arguments always
+produce the same database.
+
+Run from the repository root:
+
+    python benchmarks/synthetic_db.py bench.db --invoice-lines 10000000
+"""
+import argparse
+import datetime
+import random
+import sqlite3
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator
+
+
+SCHEMA = """
+CREATE TABLE "Artist" (
+    "ArtistId" INTEGER NOT NULL PRIMARY KEY,
+    "Name" NVARCHAR(120)
+);
+CREATE TABLE "Genre" (
+    "GenreId" INTEGER NOT NULL PRIMARY KEY,
+    "Name" NVARCHAR(120)
+);
+CREATE TABLE "MediaType" (
+    "MediaTypeId" INTEGER NOT NULL PRIMARY KEY,
+    "Name" NVARCHAR(120)
+);
+CREATE TABLE "Album" (
+    "AlbumId" INTEGER NOT NULL PRIMARY KEY,
+    "Title" NVARCHAR(160) NOT NULL,
+    "ArtistId" INTEGER NOT NULL REFERENCES "Artist" ("ArtistId")
+);
+CREATE TABLE "Track" (
+    "TrackId" INTEGER NOT NULL PRIMARY KEY,
+    "Name" NVARCHAR(200) NOT NULL,
+    "AlbumId" INTEGER REFERENCES "Album" ("AlbumId"),
+    "MediaTypeId" INTEGER NOT NULL REFERENCES "MediaType" ("MediaTypeId"),
+    "GenreId" INTEGER REFERENCES "Genre" ("GenreId"),
+    "Composer" NVARCHAR(220),
+    "Milliseconds" INTEGER NOT NULL,
+    "Bytes" INTEGER,
+    "UnitPrice" NUMERIC(10,2) NOT NULL
+);
+CREATE TABLE "Customer" (
+    "CustomerId" INTEGER NOT NULL PRIMARY KEY,
+    "FirstName" NVARCHAR(40) NOT NULL,
+    "LastName" NVARCHAR(20) NOT NULL,
+    "Country" NVARCHAR(40),
+    "Email" NVARCHAR(60) NOT NULL
+);
+CREATE TABLE "Invoice" (
+    "InvoiceId" INTEGER NOT NULL PRIMARY KEY,
+    "CustomerId" INTEGER NOT NULL REFERENCES "Customer" ("CustomerId"),
+    "InvoiceDate" DATETIME NOT NULL,
+    "BillingCountry" NVARCHAR(40),
+    "Total" NUMERIC(10,2) NOT NULL
+);
+CREATE TABLE "InvoiceLine" (
+    "InvoiceLineId" INTEGER NOT NULL PRIMARY KEY,
+    "InvoiceId" INTEGER NOT NULL REFERENCES "Invoice" ("InvoiceId"),
+    "TrackId" INTEGER NOT NULL REFERENCES "Track" ("TrackId"),
+    "UnitPrice" NUMERIC(10,2) NOT NULL,
+    "Quantity" INTEGER NOT NULL
+);
+"""
+
+# The foreign key indexes of the Chinook database, created after loading
+INDEXES = """
+CREATE INDEX "IFK_AlbumArtistId" ON "Album" ("ArtistId");
+CREATE INDEX "IFK_TrackAlbumId" ON "Track" ("AlbumId");
+CREATE INDEX "IFK_TrackGenreId" ON "Track" ("GenreId");
+CREATE INDEX "IFK_TrackMediaTypeId" ON "Track" ("MediaTypeId");
+CREATE INDEX "IFK_InvoiceCustomerId" ON "Invoice" ("CustomerId");
+CREATE INDEX "IFK_InvoiceLineInvoiceId" ON "InvoiceLine" ("InvoiceId");
+CREATE INDEX "IFK_InvoiceLineTrackId" ON "InvoiceLine" ("TrackId");
+"""
+
+GENRES = ('Rock', 'Jazz', 'Metal', 'Alternative & Punk', 'Blues', 'Latin', 'Reggae', 'Pop', 'Classical', 'Soundtrack')
+MEDIA_TYPES = ('MPEG audio file', 'Protected AAC audio file', 'Purchased AAC audio file', 'AAC audio file')
+COUNTRIES = ('USA', 'Canada', 'Brazil', 'France', 'Germany', 'United Kingdom', 'Portugal', 'India', 'Chile', 'Norway')
+WORDS = ('Blue', 'Night', 'Fire', 'Road', 'Heart', 'Rock', 'The', 'Love', 'Song', 'Dream', 'City', 'Rain', 'Gold', 'Wild')
+PRICES = (0.99, 1.99)
+BATCH_SIZE = 50000
+
+
+def row_counts(invoice_lines: int) -> Dict[str, int]:
+    """
+    Returns the number of rows of each generated table for a number of InvoiceLine rows.
+    """
+    return {
+        'Artist': max(10, invoice_lines // 8),
+        'Album': max(10, invoice_lines // 6),
+        'Track': max(100, invoice_lines // 2),
+        'Customer': max(10, invoice_lines // 40),
+        'Invoice': max(10, invoice_lines // 5),
+        'InvoiceLine': invoice_lines,
+    }
+
+
+def _title(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _rows(rng: random.Random, counts: Dict[str, int]) -> Dict[str, Iterator[tuple]]:
+    start_date = datetime.datetime(2009, 1, 1)
+    return {
+        'Genre': iter(enumerate(GENRES, 1)),
+        'MediaType': iter(enumerate(MEDIA_TYPES, 1)),
+        'Artist': ((i, _title(rng, 2)) for i in range(1, counts['Artist'] + 1)),
+        'Album': ((i, _title(rng, 3), rng.randint(1, counts['Artist'])) for i in range(1, counts['Album'] + 1)),
+        'Track': (
+            (
+                i,
+                _title(rng, 3),
+                rng.randint(1, counts['Album']),
+                rng.randint(1, len(MEDIA_TYPES)),
+                rng.randint(1, len(GENRES)),
+                None if rng.random() < 0.25 else _title(rng, 2),
+                rng.randint(60000, 600000),
+                rng.randint(1000000, 12000000),
+                rng.choice(PRICES),
+            )
+            for i in range(1, counts['Track'] + 1)
+        ),
+        'Customer': (
+            (i, rng.choice(WORDS), rng.choice(WORDS), rng.choice(COUNTRIES), f'customer{i}@example.com')
+            for i in range(1, counts['Customer'] + 1)
+        ),
+        'Invoice': (
+            (
+                i,
+                rng.randint(1, counts['Customer']),
+                (start_date + datetime.timedelta(days=rng.randint(0, 1825))).strftime('%Y-%m-%d %H:%M:%S'),
+                rng.choice(COUNTRIES),
+                round(rng.uniform(0.99, 25.86), 2),
+            )
+            for i in range(1, counts['Invoice'] + 1)
+        ),
+        'InvoiceLine': (
+            (i, rng.randint(1, counts['Invoice']), rng.randint(1, counts['Track']), rng.choice(PRICES), 1)
+            for i in range(1, counts['InvoiceLine'] + 1)
+        ),
+    }
+
+
+def _batches(rows: Iterable[tuple]) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def generate(path: Path, invoice_lines: int, seed: int = 0) -> Dict[str, int]:
+    """
+    Writes a synthetic database to path, replacing any existing file, and
+    returns the number of rows of each table.
+    """
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    counts = row_counts(invoice_lines)
+    counts.update({'Genre': len(GENRES), 'MediaType': len(MEDIA_TYPES)})
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.executescript(SCHEMA)
+        for table, rows in _rows(random.Random(seed), counts).items():
+            columns = len(conn.execute(f'PRAGMA table_info("{table}")').fetchall())
+            insert = f'INSERT INTO "{table}" VALUES ({", ".join("?" * columns)})'
+            for batch in _batches(rows):
+                conn.executemany(insert, batch)
+            conn.commit()
+        conn.executescript(INDEXES)
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('path', type=Path, help='database file to write')
+    parser.add_argument('--invoice-lines', type=int, default=1000000, help='rows of InvoiceLine; other tables scale with it')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the value generator')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.path, args.invoice_lines, args.seed)
+    elapsed = time.perf_counter() - start
+    for table, count in counts.items():
+        print(f'{table:<12}{count:>12}')
+    print(f'Wrote {args.path} ({args.path.stat().st_size / 1e6:.1f} MB) in {elapsed:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+This module contains the column-oriented encodings of /query/ results:
+column-oriented JSON and, when pyarrow is installed, Apache Arrow IPC streams.
+"""
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import types as sqltypes
+import encoders
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+COLUMNAR_JSON_MEDIA_TYPE = 'application/vnd.columnar+json'
+ARROW_STREAM_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+
+# Columns are given as (name, SQLAlchemy type, declared type) tuples
+Columns = Sequence[Tuple[str, sqltypes.TypeEngine, str]]
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Returns the response format asked for by an Accept header: 'arrow', 'columnar' or 'json'.
+    """
+    accept = accept or ''
+    if ARROW_STREAM_MEDIA_TYPE in accept:
+        return 'arrow'
+    if COLUMNAR_JSON_MEDIA_TYPE in accept:
+        return 'columnar'
+    return 'json'
+
+
+def to_columns(rows: Sequence[Dict[str, Any]], names: Sequence[str]) -> Dict[str, List[Any]]:
+    """
+    Returns one list of values per column for rows given as dicts.
+    """
+    return {name: [row[name] for row in rows] for name in names}
+
+
+def dumps_columnar_json(result: dict, columns: Columns) -> bytes:
+    """
+    Encodes a query result as column-oriented JSON: the column names, their
+    declared types and one array of values per column, so that column names
+    are not repeated for every row.
+    """
+    names = [name for name, _, _ in columns]
+    return encoders.dumps_json({
+        'query': result['query'],
+        'columns': names,
+        'types': {name: declared for name, _, declared in columns},
+        'data': to_columns(result['result'], names),
+        'next_cursor': result.get('next_cursor'),
+    })
+
+
+def arrow_type(column_type: sqltypes.TypeEngine):
+    """
+    Returns the Arrow type for a reflected column type, or None to let pyarrow infer it.
+    """
+    if isinstance(column_type, sqltypes.Boolean):
+        return pyarrow.bool_()
+    if isinstance(column_type, sqltypes.Integer):
+        return pyarrow.int64()
+    if isinstance(column_type, sqltypes.Float):
+        return pyarrow.float64()
+    if isinstance(column_type, sqltypes.Numeric):
+        if column_type.asdecimal and column_type.precision and column_type.scale is not None:
+            return pyarrow.decimal128(column_type.precision, column_type.scale)
+        return pyarrow.float64()
+    if isinstance(column_type, sqltypes.DateTime):
+        return pyarrow.timestamp('us')
+    if isinstance(column_type, sqltypes.Date):
+        return pyarrow.date32()
+    if isinstance(column_type, sqltypes.Time):
+        return pyarrow.time64('us')
+    if isinstance(column_type, sqltypes.LargeBinary):
+        return pyarrow.binary()
+    if isinstance(column_type, sqltypes.String):
+        return pyarrow.string()
+    return None
+
+
+def arrow_array(values: List[Any], column_type: Optional[sqltypes.TypeEngine] = None):
+    """
+    Returns an Arrow array of values typed from a reflected column type, or inferred without one.
+    """
+    target = arrow_type(column_type)
+    if target is not None:
+        try:
+            return pyarrow.array(values, type=target)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, OverflowError):
+            # SQLite does not enforce declared types, so fall back to the stored values
+            pass
+    if any(isinstance(value, Decimal) for value in values):
+        values = [str(value) if value is not None else None for value in values]
+    return pyarrow.array(values)
+
+
+def dumps_arrow(result: dict, columns: Columns) -> bytes:
+    """
+    Encodes a query result as an Arrow IPC stream with one record batch.
+    The SQL and next_cursor are stored in the schema metadata.
+    Raises RuntimeError when pyarrow is not installed.
+    """
+    if pyarrow is None:
+        raise RuntimeError('Arrow responses require pyarrow (pip install pyarrow)')
+    names = [name for name, _, _ in columns]
+    data = to_columns(result['result'], names)
+    arrays = [arrow_array(data[name], column_type) for name, column_type, _ in columns]
+    metadata = {'query': result['query'], 'next_cursor': result.get('next_cursor') or ''}
+    batch = pyarrow.RecordBatch.from_arrays(arrays, names=names)
+    batch = batch.replace_schema_metadata(metadata)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,172 @@
+"""
+This module contains the named databases and shard groups that requests can be routed to.
+
+Besides the [database] section, config.ini may name further databases, each
+with its own engine, pool and version probe:
+
+    [database:archive]
+    connection_string = sqlite:///db/archive.db
+
+and shard groups of databases queried together by /query/stream:
+
+    [shards:sales]
+    files = db/sales_*.db
+
+Databases whose schemas are identical share one reflected MetaData, so the
+schema is reflected once per distinct shape rather than once per file.
+"""
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Sequence
+from sqlalchemy import MetaData, text
+from sqlalchemy.engine import Engine
+from db_version import VersionProbe
+from sqlite_profile import CheckoutTimer
+
+
+# Column added to the rows of a shard group stream, naming the database each row came from
+SHARD_COLUMN = '_shard'
+
+
+class Database:
+    """
+    One database requests can be routed to: its engine, version probe and
+    the metadata shared with the databases of the same schema.
+    """
+    def __init__(
+        self,
+        name: str,
+        engine: Engine,
+        version_probe: VersionProbe,
+        metadata: MetaData,
+        checkout_timer: CheckoutTimer,
+    ):
+        self.name = name
+        self.engine = engine
+        self.version_probe = version_probe
+        self.metadata = metadata
+        self.checkout_timer = checkout_timer
+
+    def connect(self):
+        """
+        Checks a connection out of this database's pool, recording how long the checkout took.
+        """
+        start = time.perf_counter()
+        conn = self.engine.connect()
+        self.checkout_timer.record(time.perf_counter() - start)
+        return conn
+
+    def close(self) -> None:
+        """
+        Closes the version probe connection and the pooled connections.
+        """
+        self.version_probe.close()
+        self.engine.dispose()
+
+
+def schema_fingerprint(engine: Engine) -> str:
+    """
+    Returns a digest of the schema of a database. For SQLite this is the SQL
+    of every object in sqlite_master, so databases created from the same DDL
+    share a fingerprint; other databases are never considered identical.
+    """
+    if engine.dialect.name != 'sqlite':
+        return hashlib.blake2b(str(engine.url).encode(), digest_size=16).hexdigest()
+    with engine.connect() as conn:
+        rows = conn.execute(text('SELECT type, name, tbl_name, sql FROM sqlite_master ORDER BY type, name')).fetchall()
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()
+
+
+def reflect_shared(engine: Engine, schemas: dict) -> MetaData:
+    """
+    Returns the metadata for the schema of engine, reflecting it only when no
+    database with the same fingerprint was reflected into schemas before.
+    The engine and fingerprint are kept in MetaData.info.
+    """
+    fingerprint = schema_fingerprint(engine)
+    metadata = schemas.get(fingerprint)
+    if metadata is None:
+        metadata = MetaData(info={'engine': engine, 'schema_key': fingerprint})
+        metadata.reflect(bind=engine)
+        schemas[fingerprint] = metadata
+    return metadata
+
+
+def merge_streams(
+    producers: Sequence[Callable[[Callable[[list], bool]], None]],
+    max_workers: int,
+    limit: Optional[int] = None,
+    queue_size: int = 0,
+) -> Iterator[list]:
+    """
+    Runs the producers on up to max_workers threads and yields the chunks
+    they emit as they arrive, stopping after limit rows.
+
+    Each producer is called with an emit function and must stop when emit
+    returns False, which happens once the consumer has stopped. An exception
+    raised by a producer is raised to the consumer.
+    """
+    chunks = queue.Queue(maxsize=queue_size or 2 * len(producers))
+    stopped = threading.Event()
+    done = object()
+
+    def emit(item) -> bool:
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(producer) -> None:
+        try:
+            producer(emit)
+        except Exception as e:
+            emit(e)
+        finally:
+            emit(done)
+
+    pending = len(producers)
+    remaining = limit
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, pending)), thread_name_prefix='db_shard')
+    try:
+        for producer in producers:
+            pool.submit(run, producer)
+        while pending:
+            item = chunks.get()
+            if item is done:
+                pending -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            if remaining is not None:
+                item = item[:remaining]
+                remaining -= len(item)
+            if item:
+                yield item
+            if remaining == 0:
+                break
+    finally:
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pool_options(section) -> dict:
+    """
+    Returns the pool_size, max_overflow and pool_timeout set in a config section.
+    """
+    options = {}
+    if 'pool_size' in section:
+        options['pool_size'] = section.getint('pool_size')
+    if 'max_overflow' in section:
+        options['max_overflow'] = section.getint('max_overflow')
+    if 'pool_timeout' in section:
+        options['pool_timeout'] = section.getfloat('pool_timeout')
+    return options
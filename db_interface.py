@@ -1,81 +1,189 @@
 """
 This module contains a DB Interface for a FastAPI application that interacts with a database.
 """
+from glob import glob
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import logging.config
 import configparser
-from sqlalchemy import create_engine, MetaData, Table, select, and_, text
+import json
+from sqlalchemy import create_engine, inspect, MetaData, Table, select, and_, bindparam, tuple_, Integer
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import SQLAlchemyError
+from pydantic import ValidationError
 import settings
 import models
+from statement_cache import StatementCache
+from db_version import VersionProbe
+from databases import SHARD_COLUMN, Database, merge_streams, pool_options, reflect_shared
+from schema_catalog import SchemaCatalog
+from schema_snapshot import load_snapshot, save_snapshot
+from pagination import encode_cursor, decode_cursor
+from admission import RowCounts, estimate_rows
+from aggregates import aggregate_alias, build_aggregate_statement, table_column
+from expand import build_expand_statement, nest_rows, resolve_expansions
+from filters import bind_type, build_conditions, filter_params, filter_shape, is_text_date, normalize_filters, sqlite_text, value_parser
+from index_advisor import IndexAdvisor, explain_query_plan
+from query_timing import PhaseStats, QueryTimer
+from http_cache import make_etag
+from hot_views import HotView, HotViews
+from log_pipeline import LogPipeline, LogSampler, parse_sample_rates
+from result_cache import ResultCache
+from sqlite_profile import CheckoutTimer, install_pragmas, is_file_database, read_only_url, read_pragmas, set_journal_mode
+
+
+class ClosingChunks:
+    """
+    Iterator over the chunks of a stream that also closes its cursor and
+    connection when it is closed, including before the first chunk, when
+    the finally block of the chunk generator would never run.
+    """
+    def __init__(self, chunks, *resources):
+        self._chunks = chunks
+        self._resources = resources
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self) -> None:
+        try:
+            self._chunks.close()
+        finally:
+            for resource in self._resources:
+                resource.close()
 
 
 class Config:
     """
     Configuration class for app
+
+    The configuration file is read when an instance is created rather than
+    when this module is imported.
     """
     current_directory = Path(__file__).parent.absolute()
     default_config_filepath = current_directory / settings.default_config_filename
-    config = configparser.ConfigParser()
-    config.read(default_config_filepath)
-
-    # database configuration
-    db_config = config['database']
-    db_path = Path(db_config.get('db_directory').strip()) / db_config.get('db_filename').strip()
-    db_name = db_config.get('db_name').strip()
-    connection_string = db_config.get('connection_string').strip()
-
-    # logging configuration
-    logging_config = config['logging']
-    logger_name = logging_config.get('fastapi_app')
-    log_directory = current_directory / Path(logging_config.get('log_directory'))
-    log_filepath =  str(log_directory / logging_config.get('log_filename'))
-    log_config_filename = logging_config.get('log_config_filename')
-    log_filepath =  str(log_directory / logging_config.get('log_filename').strip()).replace("\\", "/")
-    log_config_file = str(current_directory / logging_config.get('log_config_filename').strip())
-    
-    # API configuration
-    api_config = config['api']
-    hostname = api_config.get('hostname')
-    port = api_config.getint('port')
-    docs_filename = api_config.get('docs_html_filename')
-    docs_path = current_directory / docs_filename
-    default_docs_body = api_config.get('default_docs_body')
 
     def __init__(self, config_file : Optional[Union[str, Path]] = None):
         """
         Constructor for Config class that can accept and alternative
         configuration file than DEFAULT_CONFIG_FILE
         """
-        if (
+        if not (
             isinstance(config_file, (str, Path))
-            and Path.is_file(config_file)
+            and Path(config_file).is_file()
         ):
-            self.config = configparser.ConfigParser()
-            self.config.read(config_file)
-
-            # database configuration
-            self.db_config = self.config['database']
-            self.db_path = Path(self.db_config.get('db_directory')) / self.db_config.get('db_filename')
-            self.db_name = self.db_config.get('db_name')
-            self.connection_string = self.db_config.get('connection_string').strip()
-
-            # logging configuration
-            self.logging_config = self.config['logging']
-            self.logger_name = self.logging_config.get('fastapi_app')
-            self.log_directory = self.current_directory / self.logging_config.get('log_directory').strip()
-            self.log_filepath =  str(self.log_directory / self.logging_config.get('log_filename').strip()).replace("\\", "/")
-            self.log_config_file = str(self.current_directory / self.logging_config.get('log_config_filename').strip())
-
-            # API configuration
-            self.api_config = self.config['api']
-            self.hostname = self.api_config.get('hostname')
-            self.port = self.api_config.getint('port')
-            self.docs_filename = self.api_config.get('docs_html_filename')
-            self.docs_path = self.current_directory / self.docs_filename
-            self.default_docs_body = self.api_config.get('default_docs_body')
+            config_file = self.default_config_filepath
+        self.config_file = Path(config_file)
+        self.config = configparser.ConfigParser()
+        self.config.read(self.config_file)
+
+        # database configuration
+        self.db_config = self.config['database']
+        self.db_path = Path(self.db_config.get('db_directory').strip()) / self.db_config.get('db_filename').strip()
+        self.db_name = self.db_config.get('db_name').strip()
+        self.connection_string = self.db_config.get('connection_string').strip()
+        self.execution_mode = self.db_config.get('execution_mode', 'inline').strip()
+        self.max_workers = self.db_config.getint('max_workers', 8)
+        self.max_queue = self.db_config.getint('max_queue', 32)
+        self.request_timeout = self.db_config.getfloat('request_timeout', 0)
+        self.read_only = self.db_config.getboolean('read_only', False)
+        self.immutable = self.db_config.getboolean('immutable', False)
+        self.journal_mode = self.db_config.get('journal_mode', '').strip()
+        self.sqlite_pragmas = read_pragmas(self.db_config)
+        self.pool_size = self.db_config.getint('pool_size', 0)
+        self.max_overflow = self.db_config.getint('max_overflow', 10)
+        self.pool_timeout = self.db_config.getfloat('pool_timeout', 30)
+        self.reflection = self.db_config.get('reflection', 'eager').strip()
+        schema_snapshot = self.db_config.get('schema_snapshot', '').strip()
+        self.schema_snapshot = self.current_directory / schema_snapshot if schema_snapshot else None
+        self.max_shard_workers = self.db_config.getint('max_shard_workers', 8)
+
+        # named databases ([database:<name>]) and shard groups ([shards:<name>])
+        self.database_configs = {
+            section.split(':', 1)[1].strip(): self.config[section]
+            for section in self.config.sections() if section.startswith('database:')
+        }
+        self.shard_configs = {
+            section.split(':', 1)[1].strip(): self.config[section]
+            for section in self.config.sections() if section.startswith('shards:')
+        }
+
+        # cache configuration
+        self.cache_config = self.section('cache')
+        self.statement_cache_size = self.cache_config.getint('statement_cache_size', fallback=256)
+        self.version_check_interval = self.cache_config.getfloat('version_check_interval', fallback=1.0)
+        self.result_cache_entries = self.cache_config.getint('result_cache_entries', fallback=1024)
+        self.result_cache_bytes = self.cache_config.getint('result_cache_bytes', fallback=64 * 1024 * 1024)
+        self.result_cache_ttl = self.cache_config.getfloat('result_cache_ttl', fallback=0)
+        self.view_refresh_interval = self.cache_config.getfloat('view_refresh_interval', fallback=1.0)
+        # hot views ([view:<name>]) precomputed at startup
+        self.view_configs = {
+            section.split(':', 1)[1].strip(): self.config[section]
+            for section in self.config.sections() if section.startswith('view:')
+        }
+
+        # logging configuration
+        self.logging_config = self.config['logging']
+        self.logger_name = self.logging_config.get('fastapi_app')
+        self.log_directory = self.current_directory / self.logging_config.get('log_directory').strip()
+        self.log_filepath =  str(self.log_directory / self.logging_config.get('log_filename').strip()).replace("\\", "/")
+        self.log_config_file = str(self.current_directory / self.logging_config.get('log_config_filename').strip())
+        self.slow_query_seconds = self.logging_config.getfloat('slow_query_seconds', 0)
+        self.async_logging = self.logging_config.getboolean('async_logging', False)
+        self.log_queue_size = self.logging_config.getint('log_queue_size', 10000)
+        self.log_sample_rates = parse_sample_rates(self.logging_config.get('log_sample_rates', ''))
+
+        # export configuration
+        self.exports_config = self.section('exports')
+        self.export_directory = self.current_directory / self.exports_config.get('directory', fallback='exports').strip()
+        self.export_mode = self.exports_config.get('mode', fallback='process').strip()
+        self.export_workers = self.exports_config.getint('workers', fallback=2)
+        self.export_max_pending = self.exports_config.getint('max_pending', fallback=16)
+        self.export_retention = self.exports_config.getfloat('retention_seconds', fallback=3600)
+
+        # admission control configuration
+        self.admission_config = self.section('admission')
+        self.admission_enabled = self.admission_config.getboolean('enabled', fallback=True)
+        self.admission_rate = self.admission_config.getfloat('rate', fallback=100)
+        self.admission_burst = self.admission_config.getfloat('burst', fallback=500)
+        self.admission_max_inflight_cost = self.admission_config.getfloat('max_inflight_cost', fallback=1000)
+        self.admission_rows_per_token = self.admission_config.getint('rows_per_token', fallback=1000)
+        self.admission_client_header = self.admission_config.get('client_header', fallback='').strip()
+        self.admission_max_clients = self.admission_config.getint('max_clients', fallback=10000)
+
+        # API configuration
+        self.api_config = self.config['api']
+        self.hostname = self.api_config.get('hostname')
+        self.port = self.api_config.getint('port')
+        self.docs_filename = self.api_config.get('docs_html_filename')
+        self.docs_path = self.current_directory / self.docs_filename
+        self.default_docs_body = self.api_config.get('default_docs_body')
+        self.max_page_size = self.api_config.getint('max_page_size', 1000)
+        self.stream_chunk_size = self.api_config.getint('stream_chunk_size', 1000)
+        self.fast_serialization = self.api_config.getboolean('fast_serialization', False)
+        self.max_batch_size = self.api_config.getint('max_batch_size', 50)
+        self.index_advisor_enabled = self.api_config.getboolean('index_advisor', False)
+        self.max_expand_depth = self.api_config.getint('max_expand_depth', 2)
+        self.max_expand_children = self.api_config.getint('max_expand_children', 100)
+        self.max_expand_rows = self.api_config.getint('max_expand_rows', 10000)
+        self.etags_enabled = self.api_config.getboolean('etags', True)
+        self.cache_max_age = self.api_config.getint('cache_max_age', 0)
+
+    def section(self, name : str) -> configparser.SectionProxy:
+        """
+        Returns a section of the config file, added empty when the file
+        predates it, so that its options fall back to their defaults.
+        """
+        if not self.config.has_section(name):
+            self.config.add_section(name)
+        return self.config[name]
 
 
 class Setup(Config):
@@ -84,11 +192,20 @@ class Setup(Config):
     This accepts SQL input, validates it against prohibited keywords,
     queries the configured database and returns the result
     """
+    reflection_modes = ('eager', 'lazy')
+
     def __init__(self, config_file : Optional[Union[str, Path]] = None):
         """
         Constructor for the FastAPI app
+
+        The duration of each startup phase is kept in startup_timings.
         """
+        self.startup_timings = {}
+        phase_start = time.perf_counter()
         super().__init__(config_file)
+        if self.reflection not in self.reflection_modes:
+            raise ValueError(f'Unknown reflection mode "{self.reflection}", expected one of {self.reflection_modes}')
+        phase_start = self.record_phase('config', phase_start)
 
         # Set up logging
         if self.log_directory.is_dir() is False:
@@ -100,25 +217,32 @@ class Setup(Config):
             defaults={'logfilename': self.log_filepath}
         )
         self.logger = logging.getLogger()
+        self.log_pipeline = None
+        if self.async_logging:
+            self.log_pipeline = LogPipeline(self.logger, self.log_queue_size)
+        self.log_sampler = LogSampler(self.log_sample_rates)
         self.logger.info('FastAPI App Setup Complete')
+        phase_start = self.record_phase('logging', phase_start)
 
         # Setup database
         try:
-            self.engine = create_engine(self.connection_string)
+            self.engine = self.build_engine()
         except SQLAlchemyError as e:
             self.logger.error(f"Error creating SQLAlchemy engine: {e}")
             raise RuntimeError(f"Database connection failed: {e}")
         except Exception as e:
             self.logger.error(f"Unexpected error creating engine: {e}")
             raise RuntimeError(f"Unexpected error: {e}")
+        self.version_probe = VersionProbe(self.engine, self.version_check_interval)
+        phase_start = self.record_phase('engine', phase_start)
 
-        self.metadata = MetaData()
+        self.snapshot = None
         try:
-            self.metadata.reflect(bind=self.engine)
-            self.logger.info(f"Reflected metadata for database: {self.db_name}")
+            self.metadata = self.load_metadata()
         except SQLAlchemyError as e:
             self.logger.error(f"Error reflecting metadata: {e}")
             raise RuntimeError(f"Metadata reflection failed: {e}")
+        phase_start = self.record_phase('reflection', phase_start)
 
         # Setup documentation
         if not Path(self.docs_path).is_file():
@@ -128,65 +252,440 @@ class Setup(Config):
             with open(self.docs_path, 'r') as file:
                 self.docs_body = file.read()
                 self.logger.info(f'Created documentation body from file: {self.docs_path}')
+        self.record_phase('docs', phase_start)
+
+    def record_phase(self, phase : str, phase_start : float) -> float:
+        """
+        Records the duration of a startup phase and returns the start time of the next one.
+        """
+        now = time.perf_counter()
+        self.startup_timings[phase] = now - phase_start
+        return now
+
+    def log_sampled(self, route : str, msg : str, *args) -> None:
+        """
+        Logs an INFO line of a hot path route when the sampler selects it.
+        The message is %-formatted with args only when a handler writes it.
+        """
+        if self.log_sampler.sample(route) and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, *args, stacklevel=2)
+
+    def logging_stats(self) -> dict:
+        """
+        Returns the hot path log lines left out by sampling and, in async
+        mode, the records queued, dropped and waiting to be written.
+        """
+        stats = {'async': self.log_pipeline is not None, 'sampled_out': self.log_sampler.sampled_out}
+        if self.log_pipeline is not None:
+            stats.update(self.log_pipeline.stats())
+        return stats
+
+    def close_logging(self) -> None:
+        """
+        Writes any queued log records and stops the background writer.
+        """
+        if self.log_pipeline is not None:
+            self.log_pipeline.close()
+
+    def load_metadata(self) -> MetaData:
+        """
+        Returns the metadata used to build queries, in a single reflection pass.
+
+        In eager mode every table is reflected, unless the schema snapshot was
+        taken at the current PRAGMA schema_version, in which case it is loaded
+        instead. In lazy mode the metadata starts empty and each table is
+        reflected the first time a query uses it.
+        """
+        if self.reflection == 'lazy':
+            self.logger.info(f'Tables of database {self.db_name} will be reflected on first use')
+            return MetaData()
+
+        if self.schema_snapshot is not None:
+            try:
+                self.snapshot = load_snapshot(
+                    self.schema_snapshot, self.connection_string, self.version_probe.schema_version()
+                )
+            except Exception as e:
+                self.logger.warning(f'Could not load schema snapshot {self.schema_snapshot}: {e}')
+            if self.snapshot is not None:
+                self.logger.info(f'Loaded schema snapshot for database {self.db_name} from {self.schema_snapshot}')
+                return self.snapshot['metadata']
+
+        metadata = MetaData()
+        metadata.reflect(bind=self.engine)
+        self.logger.info(f"Reflected metadata for database: {self.db_name}")
+        return metadata
+
+    def build_engine(self, connection_string : Optional[str] = None, pool_overrides : Optional[dict] = None):
+        """
+        Creates the SQLAlchemy engine with the configured pool and, for
+        SQLite database files, the read profile: read-only or immutable URI
+        mode, the journal mode and the PRAGMAs set on each connection.
+        The pool size defaults to the number of executor workers.
+
+        Named databases pass their own connection string and may override
+        pool_size, max_overflow and pool_timeout.
+        """
+        url = make_url(connection_string or self.connection_string)
+        is_sqlite = url.get_backend_name() == 'sqlite'
+        engine_options = {}
+        if not is_sqlite or is_file_database(url):
+            engine_options = {
+                'pool_size': self.pool_size or self.max_workers,
+                'max_overflow': self.max_overflow,
+                'pool_timeout': self.pool_timeout,
+            }
+            engine_options.update(pool_overrides or {})
+        if is_sqlite and is_file_database(url):
+            if self.journal_mode:
+                try:
+                    mode = set_journal_mode(url, self.journal_mode)
+                    self.logger.info(f'SQLite journal mode is {mode}')
+                except Exception as e:
+                    self.logger.warning(f'Could not set journal mode {self.journal_mode}: {e}')
+            if self.read_only or self.immutable:
+                url = read_only_url(url, self.immutable)
+
+        engine = create_engine(url, **engine_options)
+        if is_sqlite:
+            install_pragmas(engine, self.sqlite_pragmas)
+        return engine
 
 
 class DBInterface(Setup):
     """
     This class provides an interface to interact with the database.
     It allows querying tables, getting table information, and executing SQL queries.
+
+    With views set to False the [view:*] sections are ignored, so nothing is
+    precomputed or refreshed, as in the export worker processes.
     """
-    def __init__(self, config_file: Optional[Union[str, Path]] = None):
+    def __init__(self, config_file: Optional[Union[str, Path]] = None, views : bool = True):
         super().__init__(config_file)
-        self.metadata = MetaData()
-        self.metadata.reflect(bind=self.engine)
-        self.logger.info('Database Interface Initialized')
+        phase_start = time.perf_counter()
+        self.statement_cache = StatementCache(self.statement_cache_size)
+        self.result_cache = ResultCache(self.result_cache_entries, self.result_cache_bytes, self.result_cache_ttl)
+        self._schema_lock = threading.Lock()
+        self._reflect_lock = threading.RLock()
+        self._batch_pool = None
+        self._batch_pool_lock = threading.Lock()
+        self.checkout_timer = CheckoutTimer()
+        self.query_timings = PhaseStats()
+        self.index_advisor = None
+        if self.index_advisor_enabled and self.engine.dialect.name == 'sqlite':
+            self.index_advisor = IndexAdvisor()
+        self.catalog = self.load_catalog(self.metadata, self.version_probe.schema_version(), self.snapshot)
+        phase_start = self.record_phase('catalog', phase_start)
+        self.default_database = Database(
+            self.db_name, self.engine, self.version_probe, self.metadata, self.checkout_timer
+        )
+        self.databases = {}
+        self.shard_groups = {}
+        self.load_databases()
+        self.row_counts = {}
+        self._row_counts_lock = threading.Lock()
+        phase_start = self.record_phase('databases', phase_start)
+        self.hot_views = self.load_views(views)
+        self.hot_views.refresh_all(force=True)
+        self.hot_views.start()
+        self.record_phase('views', phase_start)
+        total = sum(self.startup_timings.values())
+        phases = ', '.join(f'{phase}={seconds * 1000:.1f}ms' for phase, seconds in self.startup_timings.items())
+        self.logger.info(f'Database Interface Initialized in {total * 1000:.1f} ms ({phases})')
 
-    def get_tables(self) -> dict:
+    def load_databases(self) -> None:
         """
-        Returns a list of table names in the database.
+        Builds the engines of the named databases and of the shard group
+        members, each with its own pool and version probe.
+
+        A [database:<name>] section sets connection_string and may override
+        pool_size, max_overflow and pool_timeout. A [shards:<name>] section
+        lists named databases in databases and/or SQLite files matching the
+        glob pattern in files, relative to the application directory; files
+        become databases named <group>/<file stem>. Databases with the same
+        schema share one reflected MetaData.
+        """
+        schemas = {}
+
+        def add(name : str, connection_string : str, section) -> None:
+            if name == self.db_name or name in self.databases or name in self.shard_configs:
+                raise ValueError(f'Database "{name}" is configured more than once')
+            engine = self.build_engine(connection_string, pool_options(section))
+            metadata = reflect_shared(engine, schemas)
+            self.databases[name] = Database(
+                name, engine, VersionProbe(engine, self.version_check_interval), metadata, self.checkout_timer
+            )
+
+        for name, section in self.database_configs.items():
+            add(name, section.get('connection_string', '').strip(), section)
+        for group, section in self.shard_configs.items():
+            members = [name.strip() for name in section.get('databases', '').split(',') if name.strip()]
+            unknown = [name for name in members if name not in self.databases]
+            if unknown:
+                raise ValueError(f'Shard group "{group}" lists unknown databases {unknown}')
+            pattern = section.get('files', '').strip()
+            for path in sorted(glob(str(self.current_directory / pattern))) if pattern else []:
+                name = f'{group}/{Path(path).stem}'
+                add(name, f'sqlite:///{path}', section)
+                members.append(name)
+            if not members:
+                raise ValueError(f'Shard group "{group}" has no databases')
+            self.shard_groups[group] = members
+        if self.databases:
+            self.logger.info(
+                f'Loaded {len(self.databases)} named databases with {len(schemas)} distinct schemas '
+                f'and {len(self.shard_groups)} shard groups'
+            )
+
+    def load_views(self, enabled : bool = True) -> HotViews:
+        """
+        Returns the hot views of the [view:<name>] sections, or no views when
+        not enabled. Each section has a type, query or aggregate, and the JSON
+        body of the /query/ or /aggregate/ request to precompute.
+        """
+        views = []
+        for name, section in self.view_configs.items() if enabled else ():
+            view_type = section.get('type', 'query').strip()
+            request_model = models.AggregateRequest if view_type == 'aggregate' else models.QueryRequest
+            try:
+                request = request_model.model_validate_json(section.get('request', ''))
+            except ValidationError as e:
+                raise ValueError(f'Invalid request of view "{name}": {e}')
+            views.append(HotView(name, view_type, request))
+        return HotViews(
+            views,
+            self.compute_view,
+            lambda view: self.database(view.request.database).version_probe.data_version(),
+            self.view_refresh_interval,
+            self.logger,
+            self.etags_enabled,
+        )
+
+    def compute_view(self, view : HotView) -> dict:
+        """
+        Computes the result of a hot view on the database, bypassing the result cache.
+        """
+        if view.type == 'aggregate':
+            metadata, database = self.route(self.metadata, view.request.database)
+            return self._execute_aggregate(metadata, database, view.request)
+        return self._execute_query(self.metadata, view.request, route='view')
+
+    def close_views(self) -> None:
+        """
+        Stops refreshing the hot views.
+        """
+        self.hot_views.close()
+
+    def database(self, name : Optional[str]) -> Database:
+        """
+        Returns the database a request is routed to: the [database] section
+        when name is None or its db_name, or else a named database.
+        Raises ValueError for shard groups and unknown names.
+        """
+        if name is None or name == self.db_name:
+            return self.default_database
+        if name in self.databases:
+            return self.databases[name]
+        if name in self.shard_groups:
+            raise ValueError(f'"{name}" is a shard group, which can only be queried with /query/stream')
+        raise ValueError(f'Unknown database "{name}"')
+
+    def route(self, metadata : MetaData, name : Optional[str]) -> Tuple[MetaData, Database]:
         """
-        results = {'table_names': []}
-        if self.connection_string.startswith('sqlite'):
+        Returns the metadata and database for a request routed to name. The
+        given metadata is kept for the default database.
+        """
+        database = self.database(name)
+        if database is self.default_database:
+            return metadata, database
+        return database.metadata, database
+
+    def database_stats(self) -> dict:
+        """
+        Returns the named databases with their schema fingerprint and pool occupancy, and the shard groups.
+        """
+        return {
+            'databases': {
+                name: {
+                    'schema': database.metadata.info['schema_key'],
+                    'checked_out': database.engine.pool.checkedout() if hasattr(database.engine.pool, 'checkedout') else None,
+                }
+                for name, database in self.databases.items()
+            },
+            'shard_groups': self.shard_groups,
+        }
+
+    def close_databases(self) -> None:
+        """
+        Closes the engines and version probes of the named databases, and the row count connections.
+        """
+        for database in self.databases.values():
+            database.close()
+        for row_counts in self.row_counts.values():
+            row_counts.close()
+
+    def close_batch_pool(self) -> None:
+        """
+        Shuts down the thread pool of the parallel batches, if one was started.
+        """
+        with self._batch_pool_lock:
+            batch_pool, self._batch_pool = self._batch_pool, None
+        if batch_pool is not None:
+            batch_pool.shutdown()
+
+    def estimate_cost(self, metadata : MetaData, request, paginate : bool = True) -> float:
+        """
+        Returns the admission cost of a query, batch or aggregate request: one
+        token plus one per rows_per_token rows SQLite is estimated to examine,
+        from the row counts of the table and the indexes its filters and
+        ordering can use. A shard group costs the sum over its databases and
+        a batch the sum over its queries. Reading row counts and reflecting
+        tables touches the database, so this runs on the request executor.
+
+        Requests whose cost cannot be estimated, such as ones naming unknown
+        tables, cost one token and fail when they are executed.
+        """
+        if isinstance(request, models.BatchQueryRequest):
+            return sum(self.estimate_cost(metadata, query) for query in request.queries)
+        try:
+            if request.database in self.shard_groups:
+                targets = [self.databases[name] for name in self.shard_groups[request.database]]
+            else:
+                targets = [self.database(request.database)]
+            filters = normalize_filters(request.filters)
+            order_by, expand, page_size = None, 0, None
+            if isinstance(request, models.QueryRequest):
+                order_by, expand = request.order_by, len(request.expand or ())
+                page_size = min(request.limit or self.max_page_size, self.max_page_size) if paginate else request.limit
+            rows = 0
+            for database in targets:
+                with self._row_counts_lock:
+                    if database.name not in self.row_counts:
+                        self.row_counts[database.name] = RowCounts(database.engine)
+                    row_counts = self.row_counts[database.name]
+                table_rows = row_counts.count(request.table, database.version_probe.data_version())
+                if table_rows is None:
+                    return 1.0
+                table_metadata = metadata if database is self.default_database else database.metadata
+                table = self.reflect_table(table_metadata, request.table)
+                rows += estimate_rows(table, table_rows, filters, order_by, page_size, expand)
+        except Exception:
+            return 1.0
+        return 1.0 + rows / self.admission_rows_per_token
+
+    def load_catalog(self, metadata : MetaData, schema_version : Optional[int], snapshot : Optional[dict] = None) -> SchemaCatalog:
+        """
+        Builds the schema catalog for metadata loaded by load_metadata.
+
+        In eager mode the column types of every table are loaded up front,
+        from the snapshot when there is one, and a new snapshot is written if
+        a snapshot file is configured. In lazy mode only the table names are
+        read and column types are loaded per table on first use.
+        """
+        if self.reflection == 'lazy':
+            table_names = inspect(self.engine).get_table_names()
+            return SchemaCatalog(self.engine, metadata, schema_version, table_names=table_names)
+
+        columns = snapshot['columns'] if snapshot is not None else None
+        catalog = SchemaCatalog(self.engine, metadata, schema_version, columns=columns).build()
+        if self.schema_snapshot is not None and snapshot is None:
             try:
-                with self.engine.connect() as conn:
-                    query = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';"
-                    query = text(query)
-                    data = conn.execute(query).fetchall()
-                    table_names = [row[0] for row in data if row and 'sqlite' not in row[0]]
-                    results['table_names'] = table_names
-                    self.logger.info(f'Found {len(table_names)} tables in the {self.db_name} database')
-            except SQLAlchemyError as e:
-                self.logger.error(f"SQLAlchemy error: {e}")
-                results['error'] = str(e)
+                if save_snapshot(self.schema_snapshot, self.connection_string, schema_version, metadata, catalog.columns):
+                    self.logger.info(f'Saved schema snapshot to {self.schema_snapshot}')
             except Exception as e:
-                self.logger.error(f'Unknown error: {e}')
-                results['error'] = str(e)
-        else:
-            results['error'] = 'This endpoint supports only SQLite databases'
-            self.logger.error('This endpoint supports only SQLite databases')
+                self.logger.warning(f'Could not save schema snapshot {self.schema_snapshot}: {e}')
+        return catalog
+
+    def connect(self):
+        """
+        Checks a connection out of the pool, recording how long the checkout took.
+        """
+        start = time.perf_counter()
+        conn = self.engine.connect()
+        self.checkout_timer.record(time.perf_counter() - start)
+        return conn
+
+    def etag(self, *parts, data : bool = True, database : Optional[str] = None) -> Optional[str]:
+        """
+        Returns the ETag of a response identified by parts at the current
+        PRAGMA schema_version and, with data, PRAGMA data_version of the
+        database a request is routed to. Returns None when ETags are disabled,
+        the database has no version counters or cannot be routed to.
+
+        The versions are read through the version probe, so a change may take
+        up to version_check_interval seconds to produce a new ETag.
+        """
+        try:
+            target = self.database(database)
+        except ValueError:
+            return None
+        if not self.etags_enabled or not target.version_probe.enabled:
+            return None
+        data_version = target.version_probe.data_version() if data else None
+        return make_etag(target.name, target.version_probe.schema_version(), data_version, *parts)
+
+    def pool_stats(self) -> dict:
+        """
+        Returns the connection pool occupancy and checkout wait times.
+        """
+        pool = self.engine.pool
+        stats = {}
+        for name in ('size', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if method is not None:
+                stats[name] = method()
+        stats.update(self.checkout_timer.stats())
+        return stats
+
+    def schema_catalog(self) -> dict:
+        """
+        Returns the in-memory schema catalog.
+
+        When SQLite reports a new PRAGMA schema_version the schema is reflected
+        again, the statement cache is cleared and the catalog is rebuilt.
+        """
+        results = {}
+        try:
+            schema_version = self.version_probe.schema_version()
+            if schema_version != self.catalog.schema_version:
+                with self._schema_lock:
+                    if schema_version != self.catalog.schema_version:
+                        self.logger.info(f'Schema version changed to {schema_version}, rebuilding schema catalog')
+                        metadata = MetaData()
+                        if self.reflection == 'eager':
+                            metadata.reflect(bind=self.engine)
+                        self.metadata = metadata
+                        self.statement_cache.clear()
+                        self.result_cache.clear()
+                        self.catalog = self.load_catalog(metadata, schema_version)
+            results['catalog'] = self.catalog
+        except SQLAlchemyError as e:
+            self.logger.error(f"SQLAlchemy error: {e}")
+            results['error'] = str(e)
+        except Exception as e:
+            self.logger.error(f'Unknown error: {e}')
+            results['error'] = str(e)
         return results
 
+    def get_tables(self) -> dict:
+        """
+        Returns a list of table names in the database.
+        """
+        results = self.schema_catalog()
+        if 'error' in results:
+            return results
+        return {'table_names': list(results['catalog'].table_names)}
+
     def table_info(self, table : str) -> dict:
         """
         Returns information about the tables in the database.
         """
-        results = {}
-        if self.connection_string.startswith('sqlite'):
-            try:
-                # Use SQLAlchemy to reflect the table info
-                with self.engine.connect() as conn:
-                    pragma_stmt = text(f'PRAGMA table_info({table})')
-                    cursor_results = conn.execute(pragma_stmt).fetchall()
-                    results[table] = {row[1]: row[2] for row in cursor_results}
-                    self.logger.info(f'Found {len(cursor_results)} fields in the {table} table')
-            except SQLAlchemyError as e:
-                self.logger.error(f"SQLAlchemy error: {e}")
-                results['error'] = str(e)
-        else:
-            results['error'] = 'This endpoint supports for SQLite databases'
-        return results
+        results = self.schema_catalog()
+        if 'error' in results:
+            return results
+        return {table: dict(results['catalog'].table_columns(table))}
 
-    def query(self, metadata : MetaData, request: models.QueryRequest) -> dict:
+    def query(self, metadata : MetaData, request: models.QueryRequest, timer : Optional[QueryTimer] = None) -> dict:
         """
         Executes a SQL query against the database.
         The query is expected to be in the form of a JSON object.
@@ -200,36 +699,629 @@ class DBInterface(Setup):
                     "ArtistId": 1
                 }
             }
+
+        At most max_page_size rows are returned. When more rows match, the
+        result includes a next_cursor to request the following page with.
+
+        Results are kept in the result cache until SQLite reports a new
+        PRAGMA data_version, and identical concurrent requests share one execution.
+        Requests equal to a hot view are answered from its precomputed result.
+
+        The phases of the query are marked on timer. When a timer is passed
+        in, the caller may mark further phases and must call finish_query;
+        otherwise the timings are recorded when the query returns.
         """
         result = {}
-        table_name = request.table
-        fields = request.fields
-        filters = request.filters or {}
+        finish = timer is None
+        timer = timer or QueryTimer()
 
         try:
-            # Reflect the table
-            table = Table(table_name, metadata, autoload_with=self.engine)
-            # Build the select statement
-            if fields:
-                columns = [table.c[field] for field in fields]
-                stmt = select(*columns)
+            snapshot = self.hot_views.match('query', request)
+            if snapshot is not None:
+                result = snapshot.result
             else:
-                stmt = select(table)  # Select all columns            
-
-            # Build WHERE clause
-            if filters:
-                conditions = [table.c[key] == value for key, value in filters.items()]
-                stmt = stmt.where(and_(*conditions)) 
-
-            with self.engine.connect() as conn:
-                response = conn.execute(stmt).fetchall()
-                result['query'] = str(stmt)
-                result['result'] = [dict(row._mapping) for row in response]
-                self.logger.info(f'Found {len(result["result"])} records with query \"{stmt}\"')
+                metadata, database = self.route(metadata, request.database)
+                key = (
+                    request.database,
+                    request.table,
+                    tuple(request.fields) if request.fields else None,
+                    json.dumps(request.filters or {}, sort_keys=True, default=str),
+                    request.order_by,
+                    request.limit,
+                    request.cursor,
+                    tuple(request.expand or ()),
+                )
+                result = self.result_cache.get_or_compute(
+                    key,
+                    database.version_probe.data_version(),
+                    lambda: self._execute_query(metadata, request, timer=timer),
+                    scope=database.name,
+                )
+            timer.mark('cache')
         except SQLAlchemyError as e:
             self.logger.error(f"SQLAlchemy error: {e}")
             result['error'] = str(e)
         except Exception as e:
             self.logger.error(f"General error: {e}")
             result['error'] = str(e)
+        if finish:
+            self.finish_query(request, timer, result)
         return result
+
+    def finish_query(self, request: models.QueryRequest, timer : QueryTimer, result : dict) -> None:
+        """
+        Records the phase timings of a finished query and logs it as slow
+        when it took at least slow_query_seconds.
+        """
+        slow = 0 < self.slow_query_seconds <= timer.total
+        self.query_timings.record(timer, slow)
+        if slow:
+            self.logger.warning(
+                f'Slow query on table {request.table} took {timer.total * 1000:.1f} ms '
+                f'({timer.describe()}): "{result.get("query", result.get("error"))}"'
+            )
+
+    def query_batch(self, metadata : MetaData, request: models.BatchQueryRequest) -> dict:
+        """
+        Executes the queries of a batch and returns their results in input order.
+
+        Sequential batches run on one connection inside a single read
+        transaction, so all results reflect the same snapshot of the database.
+        Parallel batches run each query through query() on the batch thread
+        pool, using separate pooled connections and the result cache.
+        A failing query is reported in its own item and does not fail the batch.
+        """
+        results = {}
+        if len(request.queries) > self.max_batch_size:
+            results['error'] = f'A batch may contain at most {self.max_batch_size} queries'
+            return results
+
+        if request.parallel:
+            with self._batch_pool_lock:
+                if self._batch_pool is None:
+                    self._batch_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db_batch')
+                batch_pool = self._batch_pool
+            futures = [batch_pool.submit(self.query, metadata, query) for query in request.queries]
+            results['results'] = [future.result() for future in futures]
+            return results
+
+        items = []
+        routing_errors = {}
+        databases = set()
+        for position, query in enumerate(request.queries):
+            try:
+                databases.add(self.database(query.database).name)
+            except ValueError as e:
+                routing_errors[position] = str(e)
+        try:
+            if len(databases) > 1:
+                raise ValueError('A sequential batch runs in one transaction and must query a single database')
+            metadata, database = self.route(metadata, databases.pop() if databases else None)
+            with database.connect() as conn:
+                with conn.begin():
+                    if database.engine.dialect.name == 'sqlite':
+                        # pysqlite does not begin transactions for SELECT statements,
+                        # so start one explicitly to hold a single read snapshot
+                        conn.exec_driver_sql('BEGIN')
+                    for position, query in enumerate(request.queries):
+                        item = {}
+                        timer = QueryTimer()
+                        try:
+                            if position in routing_errors:
+                                raise ValueError(routing_errors[position])
+                            item = self._execute_query(metadata, query, conn, timer, route='batch')
+                        except SQLAlchemyError as e:
+                            self.logger.error(f"SQLAlchemy error: {e}")
+                            item['error'] = str(e)
+                        except Exception as e:
+                            self.logger.error(f"General error: {e}")
+                            item['error'] = str(e)
+                        self.finish_query(query, timer, item)
+                        items.append(item)
+            results['results'] = items
+            self.log_sampled('batch', 'Executed a batch of %d queries', len(items))
+        except SQLAlchemyError as e:
+            self.logger.error(f"SQLAlchemy error: {e}")
+            results['error'] = str(e)
+        except ValueError as e:
+            self.logger.error(f"General error: {e}")
+            results['error'] = str(e)
+        return results
+
+    def _execute_query(
+        self,
+        metadata : MetaData,
+        request: models.QueryRequest,
+        conn=None,
+        timer : Optional[QueryTimer] = None,
+        route : str = 'query',
+    ) -> dict:
+        """
+        Runs one page of a query against the database, on conn if given or
+        else on a new connection to the database the request is routed to,
+        marking its phases on timer. The result is logged subject to the
+        sampling rate of route.
+        """
+        timer = timer or QueryTimer()
+        if conn is None:
+            metadata, database = self.route(metadata, request.database)
+            with database.connect() as conn:
+                timer.mark('checkout')
+                return self._execute_query(metadata, request, conn, timer, route)
+
+        result = {}
+        prepared = self.prepare_query(metadata, request)
+        params = self.query_params(prepared, request)
+        timer.mark('build')
+
+        if self.index_advisor is not None:
+            self.index_advisor.observe(conn, prepared, params)
+        cursor_result = conn.execute(prepared['statement'], params)
+        keys = prepared['output_names']
+        timer.mark('execute')
+        rows = cursor_result.fetchall()
+        nested = None
+        if prepared['expansions']:
+            if len(rows) > self.max_expand_rows:
+                raise ValueError(
+                    f'Expanding the query joined more than {self.max_expand_rows} rows, '
+                    'request a smaller limit or fewer expansions'
+                )
+            parents = nest_rows(
+                rows, prepared['page_width'], prepared['key_positions'], prepared['expansions'], self.max_expand_children
+            )
+            rows = [row for row, _ in parents]
+            nested = [expansions for _, expansions in parents]
+
+        page_size = params['page_limit'] - 1
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last_row = rows[-1]
+            next_cursor = encode_cursor(
+                prepared['key_names'], [last_row[i] for i in prepared['key_positions']]
+            )
+        result['query'] = prepared['query']
+        result['result'] = [dict(zip(keys, row)) for row in rows]
+        if nested is not None:
+            for row, expansions in zip(result['result'], nested):
+                row.update(expansions)
+        result['next_cursor'] = next_cursor
+        timer.mark('fetch')
+        self.log_sampled(route, 'Found %d records with query "%s"', len(result['result']), prepared['query'])
+        return result
+
+    def aggregate(self, metadata : MetaData, request: models.AggregateRequest) -> dict:
+        """
+        Groups the filtered rows of a table and computes aggregates per group
+        inside the database, returning only the aggregated rows.
+
+        For example:
+
+            {
+                "table": "Track",
+                "group_by": ["GenreId"],
+                "aggregates": [{"function": "count"}, {"function": "avg", "column": "Milliseconds"}]
+            }
+
+        An aggregation may return at most max_page_size groups. Results are
+        kept in the result cache like those of query(), and requests equal to
+        a hot view are answered from its precomputed result.
+        """
+        result = {}
+
+        try:
+            snapshot = self.hot_views.match('aggregate', request)
+            if snapshot is not None:
+                return snapshot.result
+            metadata, database = self.route(metadata, request.database)
+            key = ('aggregate', json.dumps(request.model_dump(), sort_keys=True, default=str))
+            result = self.result_cache.get_or_compute(
+                key,
+                database.version_probe.data_version(),
+                lambda: self._execute_aggregate(metadata, database, request),
+                scope=database.name,
+            )
+        except SQLAlchemyError as e:
+            self.logger.error(f"SQLAlchemy error: {e}")
+            result['error'] = str(e)
+        except Exception as e:
+            self.logger.error(f"General error: {e}")
+            result['error'] = str(e)
+        return result
+
+    def _execute_aggregate(self, metadata : MetaData, database : Database, request: models.AggregateRequest) -> dict:
+        """
+        Runs an aggregation on a new connection to database.
+        """
+        result = {}
+        prepared = self.prepare_aggregate(metadata, request)
+        params = filter_params(normalize_filters(request.filters), prepared['parsers'])
+        # one group more than allowed is fetched to detect oversized results
+        params['limit'] = min(request.limit, self.max_page_size) if request.limit else self.max_page_size + 1
+        with database.connect() as conn:
+            cursor_result = conn.execute(prepared['statement'], params)
+            keys = [str(key) for key in cursor_result.keys()]
+            rows = cursor_result.fetchall()
+        if len(rows) > self.max_page_size:
+            raise ValueError(
+                f'Aggregation returned more than {self.max_page_size} groups, add filters or a limit'
+            )
+        result['query'] = prepared['query']
+        result['result'] = [dict(zip(keys, row)) for row in rows]
+        self.log_sampled('aggregate', 'Aggregated %d groups with query "%s"', len(rows), prepared['query'])
+        return result
+
+    def prepare_aggregate(self, metadata : MetaData, request: models.AggregateRequest) -> dict:
+        """
+        Returns the prepared statement for the shape of an aggregate request,
+        kept in the statement cache like the statements of query().
+        """
+        group_by = tuple(request.group_by)
+        aggregates = tuple(
+            (aggregate.function, aggregate.column, aggregate_alias(aggregate.function, aggregate.column, aggregate.alias))
+            for aggregate in request.aggregates
+        )
+        shape = filter_shape(normalize_filters(request.filters))
+        key = (
+            'aggregate', metadata.info.get('schema_key'), request.table, group_by, aggregates, shape,
+            request.order_by, request.descending,
+        )
+
+        def build() -> dict:
+            table = self.reflect_table(metadata, request.table)
+            columns = {key: table_column(table, key) for key, _ in shape}
+            text_dates = metadata.info.get('engine', self.engine).dialect.name == 'sqlite'
+            stmt = build_aggregate_statement(
+                table, group_by, aggregates, build_conditions(columns, shape, text_dates),
+                request.order_by, request.descending, has_limit=True,
+            )
+            return {
+                'statement': stmt,
+                'query': str(stmt),
+                'parsers': {key: value_parser(column, text_dates) for key, column in columns.items()},
+            }
+
+        return self.statement_cache.get_or_build(key, build)
+
+    def explain_query(self, metadata : MetaData, request: models.QueryRequest) -> dict:
+        """
+        Returns the SQL of a query request and SQLite's EXPLAIN QUERY PLAN
+        for it, without executing the query.
+        """
+        result = {}
+
+        try:
+            metadata, database = self.route(metadata, request.database)
+            if database.engine.dialect.name != 'sqlite':
+                raise ValueError('EXPLAIN QUERY PLAN is only available for SQLite databases')
+            prepared = self.prepare_query(metadata, request)
+            params = self.query_params(prepared, request)
+            with database.connect() as conn:
+                plan = explain_query_plan(conn, prepared['statement'], params)
+            result['query'] = prepared['query']
+            result['plan'] = plan
+        except SQLAlchemyError as e:
+            self.logger.error(f"SQLAlchemy error: {e}")
+            result['error'] = str(e)
+        except Exception as e:
+            self.logger.error(f"General error: {e}")
+            result['error'] = str(e)
+        return result
+
+    def stream_query(self, metadata : MetaData, request: models.QueryRequest) -> dict:
+        """
+        Executes a query whose rows are streamed instead of returned in pages.
+
+        The statement is executed with a server-side cursor. The result holds
+        the column names under 'keys' and an iterator under 'chunks' that
+        fetches stream_chunk_size rows at a time and closes the connection
+        when exhausted or closed. The page size limit does not apply; an explicit limit
+        in the request does. Requests for a shard group are run by stream_shards.
+        """
+        if request.database in self.shard_groups:
+            return self.stream_shards(request)
+        result = {}
+
+        try:
+            metadata, database = self.route(metadata, request.database)
+            prepared = self.prepare_query(metadata, request, paginate=False)
+            params = self.query_params(prepared, request, paginate=False)
+
+            conn = database.connect()
+            try:
+                cursor_result = conn.execution_options(
+                    stream_results=True, yield_per=self.stream_chunk_size
+                ).execute(prepared['statement'], params)
+            except Exception:
+                conn.close()
+                raise
+            result['query'] = prepared['query']
+            result['keys'] = [str(key) for key in cursor_result.keys()][:prepared['output_count']]
+            result['chunks'] = ClosingChunks(
+                self._stream_chunks(conn, cursor_result, prepared, request.limit), cursor_result, conn
+            )
+            self.log_sampled('stream', 'Streaming records with query "%s"', prepared['query'])
+        except SQLAlchemyError as e:
+            self.logger.error(f"SQLAlchemy error: {e}")
+            result['error'] = str(e)
+        except Exception as e:
+            self.logger.error(f"General error: {e}")
+            result['error'] = str(e)
+        return result
+
+    def stream_shards(self, request: models.QueryRequest) -> dict:
+        """
+        Streams a query across every database of a shard group in parallel.
+
+        The statement is prepared once per distinct schema and run on up to
+        max_shard_workers databases at a time, each on its own connection and
+        server-side cursor. Chunks are yielded as they arrive, so rows are in
+        key order within a database but interleaved between databases; the
+        _shard column names the database of each row. An explicit limit
+        applies to the merged stream.
+        """
+        result = {}
+
+        try:
+            jobs = []
+            keys = None
+            for name in self.shard_groups[request.database]:
+                database = self.databases[name]
+                prepared = self.prepare_query(database.metadata, request, paginate=False)
+                if keys is None:
+                    keys = prepared['output_names']
+                elif prepared['output_names'] != keys:
+                    raise ValueError(
+                        f'The databases of shard group "{request.database}" have different columns for table "{request.table}"'
+                    )
+                jobs.append((database, prepared, self.query_params(prepared, request, paginate=False)))
+            result['query'] = jobs[0][1]['query']
+            result['keys'] = keys + [SHARD_COLUMN]
+            result['chunks'] = self._merge_shard_chunks(request.database, jobs, request.limit)
+            self.log_sampled(
+                'stream', 'Streaming records from %d databases of shard group %s with query "%s"',
+                len(jobs), request.database, result['query'],
+            )
+        except SQLAlchemyError as e:
+            self.logger.error(f"SQLAlchemy error: {e}")
+            result['error'] = str(e)
+        except Exception as e:
+            self.logger.error(f"General error: {e}")
+            result['error'] = str(e)
+        return result
+
+    def _shard_producer(self, database : Database, prepared : dict, params : dict):
+        """
+        Returns a producer for merge_streams emitting the rows of one shard in chunks, tagged with its name.
+        """
+        output_count = prepared['output_count']
+
+        def produce(emit) -> None:
+            with database.connect() as conn:
+                cursor_result = conn.execution_options(
+                    stream_results=True, yield_per=self.stream_chunk_size
+                ).execute(prepared['statement'], params)
+                try:
+                    for partition in cursor_result.partitions():
+                        if not emit([tuple(row)[:output_count] + (database.name,) for row in partition]):
+                            return
+                finally:
+                    cursor_result.close()
+
+        return produce
+
+    def _merge_shard_chunks(self, group : str, jobs : list, limit : Optional[int]):
+        """
+        Yields the chunks of all shards as they arrive, then logs the number of rows streamed.
+        """
+        producers = [self._shard_producer(database, prepared, params) for database, prepared, params in jobs]
+        count = 0
+        try:
+            for chunk in merge_streams(producers, self.max_shard_workers, limit):
+                count += len(chunk)
+                yield chunk
+        finally:
+            self.log_sampled('stream', 'Streamed %d records from shard group %s', count, group)
+
+    def check_stream(self, metadata : MetaData, request: models.QueryRequest) -> dict:
+        """
+        Prepares the statement and parameters stream_query would run for a
+        request, without executing it, and returns the error if it is invalid.
+        """
+        result = {}
+
+        try:
+            if request.database in self.shard_groups:
+                metadata = self.databases[self.shard_groups[request.database][0]].metadata
+            else:
+                metadata, _ = self.route(metadata, request.database)
+            prepared = self.prepare_query(metadata, request, paginate=False)
+            self.query_params(prepared, request, paginate=False)
+        except SQLAlchemyError as e:
+            self.logger.error(f"SQLAlchemy error: {e}")
+            result['error'] = str(e)
+        except Exception as e:
+            self.logger.error(f"General error: {e}")
+            result['error'] = str(e)
+        return result
+
+    def _stream_chunks(self, conn, cursor_result, prepared : dict, limit : Optional[int]):
+        """
+        Yields lists of row tuples without the extra key columns, then closes the connection.
+        """
+        output_count = prepared['output_count']
+        remaining = limit
+        count = 0
+        try:
+            for partition in cursor_result.partitions():
+                if remaining is not None:
+                    partition = partition[:remaining]
+                    remaining -= len(partition)
+                count += len(partition)
+                yield [tuple(row)[:output_count] for row in partition]
+                if remaining == 0:
+                    break
+        finally:
+            cursor_result.close()
+            conn.close()
+            self.log_sampled('stream', 'Streamed %d records with query "%s"', count, prepared['query'])
+
+    def query_params(self, prepared : dict, request: models.QueryRequest, paginate : bool = True) -> dict:
+        """
+        Returns the bound parameter values of a prepared statement for a request.
+
+        page_limit is one more than the page size so that a further page can be
+        detected, and expand_limit one more than the joined rows allowed.
+        """
+        params = filter_params(normalize_filters(request.filters), prepared['parsers'])
+        if request.cursor is not None:
+            values = decode_cursor(request.cursor, prepared['key_names'])
+            values = [sqlite_text(value) if text else value for value, text in zip(values, prepared['cursor_text_dates'])]
+            params.update(zip(prepared['cursor_bind_names'], values))
+        if paginate:
+            page_size = min(request.limit or self.max_page_size, self.max_page_size)
+            params['page_limit'] = page_size + 1
+        if prepared['expansions']:
+            params['expand_limit'] = self.max_expand_rows + 1
+        return params
+
+    def prepare_query(self, metadata : MetaData, request: models.QueryRequest, paginate : bool = True) -> dict:
+        """
+        Returns the prepared statement for the shape of a query request.
+
+        The shape is the table, the selected fields, the filtered columns with
+        their operators, the ordering column, whether a cursor is given,
+        whether the result is paginated and the expanded relations. Statements are built once per shape
+        with bound parameters for the filters, cursor and page size and kept
+        in the statement cache, so repeated requests only bind values.
+        """
+        fields = tuple(request.fields) if request.fields else None
+        shape = filter_shape(normalize_filters(request.filters))
+        has_cursor = request.cursor is not None
+        expand = tuple(request.expand or ())
+        if expand and not paginate:
+            raise ValueError('expand is only supported for paginated queries')
+        key = (metadata.info.get('schema_key'), request.table, fields, shape, request.order_by, has_cursor, paginate, expand)
+        return self.statement_cache.get_or_build(
+            key,
+            lambda: dict(
+                self._build_statement(
+                    metadata, request.table, fields, shape, request.order_by, has_cursor, paginate, expand
+                ),
+                shape=key,
+            ),
+        )
+
+    def result_columns(self, metadata : MetaData, request: models.QueryRequest) -> list:
+        """
+        Returns the (name, type, declared type) of each column in the result of
+        a query request, taken from the reflected table of its prepared statement.
+        """
+        metadata, _ = self.route(metadata, request.database)
+        return self.prepare_query(metadata, request)['output_columns']
+
+    def reflect_table(self, metadata : MetaData, table_name : str) -> Table:
+        """
+        Returns a table of the metadata, reflecting it first unless it is already there.
+        """
+        with self._reflect_lock:
+            return Table(table_name, metadata, autoload_with=metadata.info.get('engine', self.engine))
+
+    def _build_statement(
+        self,
+        metadata : MetaData,
+        table_name : str,
+        fields : Optional[tuple],
+        shape : tuple,
+        order_by : Optional[str] = None,
+        has_cursor : bool = False,
+        paginate : bool = True,
+        expand : tuple = (),
+    ) -> dict:
+        """
+        Builds the select statement for one request shape.
+
+        Rows are ordered by the keyset of order_by followed by the primary key
+        columns. Key columns missing from fields are selected after the
+        requested columns so the cursor can be built, and are dropped from the result.
+
+        With expand, this page of rows becomes a subquery that the related
+        tables are joined to, and the columns the joins need are selected
+        after the key columns.
+        """
+        table = self.reflect_table(metadata, table_name)
+        # Build the select statement
+        if fields:
+            columns = [table.c[field] for field in fields]
+        else:
+            columns = list(table.columns)  # Select all columns
+
+        # Determine the keyset used for ordering and cursors
+        key_columns = list(table.primary_key.columns)
+        if order_by is not None:
+            order_column = table.c[order_by]
+            if order_column.nullable:
+                raise ValueError(f'Cannot order by nullable column "{order_by}"')
+            key_columns = [order_column] + [column for column in key_columns if column is not order_column]
+        if not key_columns:
+            raise ValueError(f'Table "{table_name}" has no primary key, order_by is required')
+
+        output_count = len(columns)
+        key_positions = []
+        for key_column in key_columns:
+            if key_column in columns:
+                key_positions.append(columns.index(key_column))
+            else:
+                key_positions.append(len(columns))
+                columns.append(key_column)
+        expansions = resolve_expansions(
+            table, expand, lambda name: self.reflect_table(metadata, name), self.max_expand_depth
+        )
+        for expansion in expansions:
+            for name in expansion.parent_columns:
+                if table.c[name] not in columns:
+                    columns.append(table.c[name])
+        stmt = select(*columns)
+
+        # Build WHERE clause with named bound parameters for the filters
+        # SQLite compares dates as the stored text, so dates are bound as text in the same format
+        text_dates = metadata.info.get('engine', self.engine).dialect.name == 'sqlite'
+        conditions = build_conditions(table.c, shape, text_dates)
+        parsers = {key: value_parser(table.c[key], text_dates) for key, _ in shape}
+        cursor_bind_names = [f'after_{column.name}' for column in key_columns]
+        cursor_text_dates = [text_dates and is_text_date(column) for column in key_columns]
+        if has_cursor:
+            cursor_params = [
+                bindparam(name, type_=bind_type(column, text_dates))
+                for name, column in zip(cursor_bind_names, key_columns)
+            ]
+            if len(key_columns) == 1:
+                conditions.append(key_columns[0] > cursor_params[0])
+            else:
+                conditions.append(tuple_(*key_columns) > tuple_(*cursor_params))
+        if conditions:
+            stmt = stmt.where(and_(*conditions))
+        stmt = stmt.order_by(*key_columns)
+        if paginate:
+            stmt = stmt.limit(bindparam('page_limit', type_=Integer))
+        if expansions:
+            stmt = build_expand_statement(stmt.subquery('page'), [column.name for column in key_columns], expansions)
+
+        return {
+            'statement': stmt,
+            'query': str(stmt),
+            'table': table_name,
+            'order_by': order_by,
+            'filter_shape': shape,
+            'parsers': parsers,
+            'cursor_bind_names': cursor_bind_names,
+            'cursor_text_dates': cursor_text_dates,
+            'key_names': [column.name for column in key_columns],
+            'key_positions': key_positions,
+            'output_count': output_count,
+            'output_names': [str(column.name) for column in columns[:output_count]],
+            'output_columns': [(str(column.name), column.type, str(column.type)) for column in columns[:output_count]],
+            'expansions': expansions,
+            'page_width': len(columns),
+        }
@@ -0,0 +1,75 @@
+"""
+This module contains a probe for the version counters SQLite keeps for its schema and data.
+"""
+import threading
+import time
+from typing import Optional
+from sqlalchemy.engine import Engine
+
+
+class VersionProbe:
+    """
+    Reads SQLite version PRAGMAs on a dedicated connection outside the pool.
+
+    Each PRAGMA is read at most once per check_interval seconds; in between
+    the last value is returned without touching the database, so callers can
+    check for changes on every request. For databases other than SQLite the
+    probe is disabled and every read returns None.
+    """
+    def __init__(self, engine: Engine, check_interval: float = 1.0):
+        self.engine = engine
+        self.check_interval = check_interval
+        self.enabled = engine.dialect.name == 'sqlite'
+        self._connection = None
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _connect(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        return self.engine.dialect.connect(*cargs, **cparams)
+
+    def read(self, pragma: str) -> Optional[int]:
+        """
+        Returns the integer value of a version PRAGMA such as schema_version.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            checked_at, value = self._values.get(pragma, (None, None))
+            if checked_at is not None and now - checked_at < self.check_interval:
+                return value
+
+            if self._connection is None:
+                self._connection = self._connect()
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute(f'PRAGMA {pragma}')
+                value = cursor.fetchone()[0]
+            finally:
+                cursor.close()
+            self._values[pragma] = (now, value)
+            return value
+
+    def schema_version(self) -> Optional[int]:
+        """
+        Returns PRAGMA schema_version, which changes whenever the schema is altered.
+        """
+        return self.read('schema_version')
+
+    def data_version(self) -> Optional[int]:
+        """
+        Returns PRAGMA data_version, which changes when another connection commits.
+        As the value is per connection, it is always read on the probe's own connection.
+        """
+        return self.read('data_version')
+
+    def close(self) -> None:
+        """
+        Closes the dedicated connection.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,79 @@
+"""
+This module contains encoders that turn query rows into bytes for responses.
+"""
+import csv
+import datetime
+import io
+import json
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, Sequence
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+CSV_MEDIA_TYPE = 'text/csv'
+
+
+def json_default(value: Any) -> Any:
+    """
+    Converts values the json module cannot encode the same way Pydantic serializes them:
+    dates and times as ISO 8601 strings and decimals as strings.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps_json(content: Any) -> bytes:
+    """
+    Encodes content as compact JSON bytes, producing the same output as the
+    Pydantic response models. Uses orjson when it is installed and falls back
+    to the json module otherwise.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+
+
+def iter_ndjson(keys: Sequence[str], chunks: Iterable[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    """
+    Encodes chunks of rows as newline delimited JSON objects, one bytes block per chunk.
+    """
+    keys = list(keys)
+    for chunk in chunks:
+        lines = [
+            json.dumps(dict(zip(keys, row)), ensure_ascii=False, separators=(',', ':'), default=json_default)
+            for row in chunk
+        ]
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(keys: Sequence[str], chunks: Iterable[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    """
+    Encodes chunks of rows as CSV with a header line, one bytes block per chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(keys)
+    yield buffer.getvalue().encode('utf-8')
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in chunk)
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
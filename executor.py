@@ -0,0 +1,97 @@
+"""
+This module contains the executor that runs the blocking DBInterface calls for the FastAPI routes.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class ExecutorSaturated(Exception):
+    """
+    Raised when the executor already holds as many calls as it is allowed to queue
+    """
+    pass
+
+
+class ExecutorTimeout(Exception):
+    """
+    Raised when a call does not finish within the configured request timeout
+    """
+    pass
+
+
+class DBExecutor:
+    """
+    Runs synchronous DBInterface methods on behalf of the async routes in create_app.
+
+    Supported modes:
+    - inline: call the method directly on the event loop (no isolation)
+    - threadpool: run the method on a bounded thread pool so a slow query
+      cannot stall the event loop, with a per-request timeout and a queue
+      depth limit that rejects new work once the pool is saturated
+    """
+    modes = ('inline', 'threadpool')
+
+    def __init__(
+        self,
+        mode: str = 'threadpool',
+        max_workers: int = 8,
+        max_queue: int = 32,
+        timeout: Optional[float] = None,
+    ):
+        if mode not in self.modes:
+            raise ValueError(f'Unknown execution mode "{mode}", expected one of {self.modes}')
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout or None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        if mode == 'threadpool':
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db_executor')
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of calls that are running or waiting for a worker thread.
+        Calls that timed out keep counting until their thread actually finishes.
+        """
+        return self._pending
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        """
+        Run func(*args) according to the execution mode and return its result.
+
+        Raises ExecutorSaturated if running and queued calls already fill the
+        pool and its queue, and ExecutorTimeout if the call takes longer than
+        the configured timeout.
+        """
+        if self._pool is None:
+            return func(*args)
+
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise ExecutorSaturated(
+                    f'Database executor is saturated ({self._pending} calls pending)'
+                )
+            self._pending += 1
+
+        future = self._pool.submit(func, *args)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise ExecutorTimeout(f'Database call did not finish within {self.timeout} seconds')
+
+    def shutdown(self) -> None:
+        """
+        Stop accepting work and release the worker threads.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,169 @@
+"""
+This module contains the foreign key expansions accepted in QueryRequest.expand.
+
+Each expansion is a path of related table names, such as "Artist" or
+"Track.Genre", followed from the queried table along the reflected foreign
+keys. A table the parent refers to is nested as an object (many-to-one), a
+table referring to the parent is nested as a list (one-to-many):
+
+    {"table": "Album", "expand": ["Artist", "Track.Genre"]}
+
+The page of parent rows is selected as a subquery and the related tables are
+joined to it with LEFT OUTER JOINs, so one statement returns the whole result.
+"""
+from typing import Callable, Dict, List, Sequence, Tuple
+from sqlalchemy import Integer, Table, and_, bindparam, select
+from sqlalchemy.sql import LABEL_STYLE_TABLENAME_PLUS_COL
+from sqlalchemy.exc import NoSuchTableError
+
+
+class Expansion:
+    """
+    One related table joined to its parent table, with the expansions nested below it.
+    """
+    def __init__(self, name: str, table: Table, many: bool, parent_columns: List[str], child_columns: List[str]):
+        self.name = name
+        self.table = table
+        self.many = many
+        self.parent_columns = parent_columns
+        self.child_columns = child_columns
+        self.children: List['Expansion'] = []
+        self.column_names = [str(column.name) for column in table.columns]
+        key_columns = list(table.primary_key.columns) or list(table.columns)
+        self.key_positions = [self.column_names.index(column.name) for column in key_columns]
+        # position of the first column of this table in the joined rows, set by build_expand_statement
+        self.position = 0
+
+
+def _relation(parent: Table, name: str, reflect: Callable[[str], Table]) -> Expansion:
+    """
+    Returns the expansion of parent to the table called name, preferring a
+    foreign key of parent to that table over one of that table to parent.
+    """
+    if name in parent.c:
+        raise ValueError(f'Cannot expand "{name}", it is a column of table "{parent.name}"')
+    try:
+        table = reflect(name)
+    except NoSuchTableError:
+        raise ValueError(f'Cannot expand unknown table "{name}"')
+
+    outgoing = [fk for fk in parent.foreign_key_constraints if fk.referred_table.name == table.name]
+    incoming = [fk for fk in table.foreign_key_constraints if fk.referred_table.name == parent.name]
+    if len(outgoing) == 1:
+        fk = outgoing[0]
+        return Expansion(
+            name, table, False, [column.name for column in fk.columns], [element.column.name for element in fk.elements]
+        )
+    if not outgoing and len(incoming) == 1:
+        fk = incoming[0]
+        return Expansion(
+            name, table, True, [element.column.name for element in fk.elements], [column.name for column in fk.columns]
+        )
+    if outgoing or incoming:
+        raise ValueError(f'Cannot expand "{name}" from "{parent.name}", they are related by several foreign keys')
+    raise ValueError(f'Cannot expand "{name}" from "{parent.name}", there is no foreign key between them')
+
+
+def resolve_expansions(
+    table: Table, paths: Sequence[str], reflect: Callable[[str], Table], max_depth: int
+) -> List[Expansion]:
+    """
+    Returns the tree of expansions for dotted paths of table names, merging
+    common prefixes. Raises ValueError for paths deeper than max_depth or
+    tables without a single foreign key relation to their parent.
+    """
+    roots: List[Expansion] = []
+    for path in paths:
+        names = path.split('.')
+        if len(names) > max_depth:
+            raise ValueError(f'Cannot expand "{path}", at most {max_depth} levels can be expanded')
+        parent, siblings = table, roots
+        for name in names:
+            node = next((node for node in siblings if node.name == name), None)
+            if node is None:
+                node = _relation(parent, name, reflect)
+                siblings.append(node)
+            parent, siblings = node.table, node.children
+    return roots
+
+
+def build_expand_statement(page, key_names: List[str], roots: List[Expansion]):
+    """
+    Returns the statement joining the expansions to the page subquery, which
+    must contain the parent columns of the top-level expansions.
+
+    Rows are ordered by the page keyset and then by the key of every joined
+    table, so the rows of one parent are adjacent. The number of joined rows
+    is bound to the expand_limit parameter.
+    """
+    columns = list(page.c)
+    joined = page
+    order = [page.c[name] for name in key_names]
+    aliases = []
+
+    def join(nodes: List[Expansion], parent_source) -> None:
+        nonlocal joined
+        for node in nodes:
+            alias = node.table.alias(f'expand_{len(aliases)}')
+            aliases.append(alias)
+            onclause = and_(*(
+                alias.c[child] == parent_source.c[parent]
+                for parent, child in zip(node.parent_columns, node.child_columns)
+            ))
+            joined = joined.outerjoin(alias, onclause)
+            node.position = len(columns)
+            columns.extend(alias.c)
+            order.extend(alias.c[node.column_names[i]] for i in node.key_positions)
+            join(node.children, alias)
+
+    join(roots, page)
+    return (
+        select(*columns)
+        .select_from(joined)
+        .order_by(*order)
+        .limit(bindparam('expand_limit', type_=Integer))
+        .set_label_style(LABEL_STYLE_TABLENAME_PLUS_COL)
+    )
+
+
+def _attach(row: tuple, nodes: List[Expansion], target: dict, seen: Dict[tuple, dict], max_children: int) -> None:
+    for node in nodes:
+        values = row[node.position:node.position + len(node.column_names)]
+        key = tuple(values[i] for i in node.key_positions)
+        if all(value is None for value in key):
+            # no related row on this side of the outer join
+            continue
+        seen_key = (id(target), node.name, key)
+        child = seen.get(seen_key)
+        if child is None:
+            if node.many and len(target[node.name]) >= max_children:
+                continue
+            child = dict(zip(node.column_names, values))
+            child.update({nested.name: [] if nested.many else None for nested in node.children})
+            seen[seen_key] = child
+            if node.many:
+                target[node.name].append(child)
+            else:
+                target[node.name] = child
+        _attach(row, node.children, child, seen, max_children)
+
+
+def nest_rows(
+    rows: Sequence[tuple], page_width: int, key_positions: List[int], roots: List[Expansion], max_children: int
+) -> List[Tuple[tuple, dict]]:
+    """
+    Groups joined rows by parent and returns, per parent in order, its page
+    columns and its nested expansions. At most max_children rows are nested
+    per parent and one-to-many expansion.
+    """
+    parents: List[Tuple[tuple, dict]] = []
+    nested_by_key: Dict[tuple, dict] = {}
+    seen: Dict[tuple, dict] = {}
+    for row in rows:
+        key = tuple(row[i] for i in key_positions)
+        nested = nested_by_key.get(key)
+        if nested is None:
+            nested = nested_by_key[key] = {node.name: [] if node.many else None for node in roots}
+            parents.append((tuple(row[:page_width]), nested))
+        _attach(row, roots, nested, seen, max_children)
+    return parents
@@ -0,0 +1,345 @@
+"""
+This module contains the export jobs of /exports/: full query results written
+to compressed CSV or Parquet files by background workers.
+
+A job streams the rows of a QueryRequest from a server-side cursor, chunk by
+chunk, into a file in the export directory, so neither the event loop nor
+the request executor waits for it and the result is never held in memory.
+In process mode the jobs run on a pool of worker processes, each with its
+own DBInterface and connection pool; thread mode runs them on threads that
+share the DBInterface of the application.
+"""
+import datetime
+import gzip
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+import columnar
+import encoders
+import models
+
+
+EXPORT_FORMATS = {
+    'csv': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+EXPORT_MODES = ('process', 'thread')
+
+
+class ExportsSaturated(Exception):
+    """
+    Raised when as many export jobs are waiting as the export queue allows
+    """
+    pass
+
+
+def write_csv(path : Path, keys : Sequence[str], chunks : Iterable[list]) -> int:
+    """
+    Writes rows to a gzip compressed CSV file with a header line and returns the number of rows written.
+    """
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    with gzip.open(path, 'wb', compresslevel=6) as file:
+        for block in encoders.iter_csv(keys, counted()):
+            file.write(block)
+    return rows
+
+
+def write_parquet(path : Path, keys : Sequence[str], column_types : Optional[list], chunks : Iterable[list]) -> int:
+    """
+    Writes rows to a zstd compressed Parquet file, one row group per chunk,
+    typed from the reflected column types when given. Returns the number of rows written.
+    """
+    if columnar.pyarrow is None:
+        raise RuntimeError('Parquet exports require pyarrow (pip install pyarrow)')
+    import pyarrow.parquet
+
+    rows = 0
+    writer = None
+    column_types = column_types or [None] * len(keys)
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            values = list(zip(*chunk))
+            arrays = [columnar.arrow_array(list(column), column_type) for column, column_type in zip(values, column_types)]
+            batch = columnar.pyarrow.RecordBatch.from_arrays(arrays, names=list(keys))
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(str(path), batch.schema, compression='zstd')
+            writer.write_batch(batch.cast(writer.schema) if batch.schema != writer.schema else batch)
+            rows += len(chunk)
+        if writer is None:
+            schema = columnar.pyarrow.schema([(key, columnar.pyarrow.string()) for key in keys])
+            writer = pyarrow.parquet.ParquetWriter(str(path), schema, compression='zstd')
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_rows(interface, request : models.QueryRequest, export_format : str, path : Path) -> dict:
+    """
+    Streams the rows of a query into an export file and returns its row count
+    and size. The file is written under a .part name and renamed when complete.
+    """
+    result = interface.stream_query(interface.metadata, request)
+    if 'error' in result:
+        raise ValueError(result['error'])
+    partial = path.with_name(path.name + '.part')
+    try:
+        if export_format == 'parquet':
+            column_types = None
+            if request.database not in interface.shard_groups:
+                column_types = [column_type for _, column_type, _ in interface.result_columns(interface.metadata, request)]
+            rows = write_parquet(partial, result['keys'], column_types, result['chunks'])
+        else:
+            rows = write_csv(partial, result['keys'], result['chunks'])
+        os.replace(partial, path)
+    except BaseException:
+        result['chunks'].close()
+        partial.unlink(missing_ok=True)
+        raise
+    return {'rows': rows, 'bytes': path.stat().st_size}
+
+
+_worker_interface = None
+
+
+def _export_in_process(config_file : str, request_json : str, export_format : str, path : str) -> dict:
+    """
+    Runs an export in a worker process, creating the worker's DBInterface on
+    its first job, without the hot views only the application serves.
+    """
+    global _worker_interface
+    if _worker_interface is None:
+        from db_interface import DBInterface
+        _worker_interface = DBInterface(config_file, views=False)
+    request = models.QueryRequest.model_validate_json(request_json)
+    return export_rows(_worker_interface, request, export_format, Path(path))
+
+
+def _timestamp(seconds : Optional[float]) -> Optional[str]:
+    if seconds is None:
+        return None
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+
+
+class ExportJob:
+    """
+    One export: its request, output file and progress.
+
+    The status of a finished job is the outcome recorded by
+    ExportManager._finish, set under the job's lock together with the row
+    count or error, so a job is never reported done before its file is.
+    """
+    def __init__(self, request : models.QueryRequest, export_format : str, directory : Path):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.format = export_format
+        self.path = directory / f'{self.id}{EXPORT_FORMATS[export_format][0]}'
+        self.media_type = EXPORT_FORMATS[export_format][1]
+        self.future: Optional[Future] = None
+        self.rows: Optional[int] = None
+        self.bytes: Optional[int] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.outcome: Optional[str] = None
+        self.lock = threading.RLock()
+        self._finished = threading.Event()
+
+    @property
+    def status(self) -> str:
+        with self.lock:
+            if self.outcome is not None:
+                return self.outcome
+            if self.future is None:
+                return 'queued'
+            # a done future whose outcome is not recorded yet is still finishing
+            return 'running' if self.future.running() or self.future.done() else 'queued'
+
+    def wait(self, timeout : Optional[float] = None) -> bool:
+        """
+        Waits until the outcome of the job is recorded and returns whether it was.
+        """
+        return self._finished.wait(timeout)
+
+    def describe(self) -> dict:
+        with self.lock:
+            return self._describe()
+
+    def _describe(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'format': self.format,
+            'table': self.request.table,
+            'database': self.request.database,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'error': self.error,
+            'created_at': _timestamp(self.created_at),
+            'finished_at': _timestamp(self.finished_at),
+        }
+
+
+class ExportManager:
+    """
+    Queues export jobs on a process or thread pool and keeps their state.
+
+    At most max_pending jobs may be queued or running; further submissions
+    raise ExportsSaturated. Finished jobs and their files are removed
+    retention seconds after they finish, checked whenever jobs are read and
+    periodically by a background thread, so an idle server removes them too.
+    """
+    def __init__(
+        self,
+        interface,
+        directory : Path,
+        mode : str = 'process',
+        max_workers : int = 2,
+        max_pending : int = 16,
+        retention : float = 3600,
+    ):
+        if mode not in EXPORT_MODES:
+            raise ValueError(f'Unknown export mode "{mode}", expected one of {EXPORT_MODES}')
+        self.interface = interface
+        self.directory = Path(directory)
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.jobs: Dict[str, ExportJob] = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._stopped = threading.Event()
+        self._expire_thread = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self.mode == 'process' and multiprocessing.current_process().daemon:
+                self.interface.logger.warning('A daemonic process cannot start export worker processes, using threads')
+                self.mode = 'thread'
+            if self.mode == 'process':
+                # spawn, as forking a process with running threads can leave their locks held in the child
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db_export')
+            if self.retention > 0 and self._expire_thread is None:
+                self._expire_thread = threading.Thread(target=self._run_expire, name='db_export_expire', daemon=True)
+                self._expire_thread.start()
+        return self._pool
+
+    def _run_expire(self) -> None:
+        while not self._stopped.wait(min(self.retention, 60)):
+            self.expire()
+
+    def submit(self, request : models.QueryRequest, export_format : str = 'csv') -> ExportJob:
+        """
+        Queues an export of the rows of request and returns its job.
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unknown export format "{export_format}", expected one of {list(EXPORT_FORMATS)}')
+        if export_format == 'parquet' and columnar.pyarrow is None:
+            raise ValueError('Parquet exports require pyarrow to be installed')
+        self.expire()
+        with self._lock:
+            pending = sum(1 for job in self.jobs.values() if job.status in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise ExportsSaturated(f'{pending} exports are already pending, try again later')
+            job = ExportJob(request, export_format, self.directory)
+            pool = self._get_pool()
+            if self.mode == 'process':
+                job.future = pool.submit(
+                    _export_in_process, str(self.interface.config_file), request.model_dump_json(),
+                    export_format, str(job.path),
+                )
+            else:
+                job.future = pool.submit(export_rows, self.interface, request, export_format, job.path)
+            self.jobs[job.id] = job
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def _finish(self, job : ExportJob, future : Future) -> None:
+        with job.lock:
+            job.finished_at = time.time()
+            if future.cancelled():
+                job.outcome = 'cancelled'
+            elif future.exception() is not None:
+                error = future.exception()
+                job.error = str(error) or type(error).__name__
+                job.outcome = 'failed'
+                self.interface.logger.error(f'Export {job.id} of table {job.request.table} failed: {job.error}')
+            else:
+                outcome = future.result()
+                job.rows, job.bytes = outcome['rows'], outcome['bytes']
+                job.outcome = 'done'
+                self.interface.logger.info(f'Exported {job.rows} rows of table {job.request.table} to {job.path}')
+        job._finished.set()
+
+    def get(self, job_id : str) -> Optional[ExportJob]:
+        self.expire()
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[dict]:
+        self.expire()
+        return [job.describe() for job in list(self.jobs.values())]
+
+    def remove(self, job_id : str) -> bool:
+        """
+        Cancels a queued job or deletes the file of a finished one. Returns
+        False for running jobs, which cannot be interrupted.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        with job.lock:
+            # cancel fails once a worker has picked the job up, however recently
+            if job.outcome is None and (job.future is None or not job.future.cancel()):
+                return False
+        job.path.unlink(missing_ok=True)
+        with self._lock:
+            self.jobs.pop(job_id, None)
+        return True
+
+    def expire(self) -> None:
+        """
+        Removes jobs that finished more than retention seconds ago, with their files.
+        """
+        if self.retention <= 0:
+            return
+        cutoff = time.time() - self.retention
+        for job in list(self.jobs.values()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                self.remove(job.id)
+
+    def stats(self) -> dict:
+        self.expire()
+        statuses = [job.status for job in list(self.jobs.values())]
+        return {status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed', 'cancelled')}
+
+    def close(self) -> None:
+        """
+        Cancels queued jobs, shuts the worker pool down and stops removing expired jobs.
+        """
+        self._stopped.set()
+        if self._expire_thread is not None:
+            self._expire_thread.join()
+            self._expire_thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,209 @@
+"""
+This module contains the filter operators accepted in QueryRequest.filters.
+
+A filter is either a plain value, meaning equality, or an object of operators:
+
+    {
+        "ArtistId": 1,
+        "Milliseconds": {"gte": 200000, "lt": 300000},
+        "GenreId": {"in": [1, 2, 3]},
+        "InvoiceDate": {"between": ["2010-01-01", "2010-12-31"]},
+        "Name": {"startswith": "The"},
+        "Composer": {"is_null": false}
+    }
+
+Every operator compiles to a bound-parameter condition that SQLite can serve
+from an index on the column. startswith is compiled to a range on the column
+rather than LIKE, so it is case-sensitive and works with ordinary indexes.
+"""
+import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Tuple
+from sqlalchemy import Column, String, bindparam
+from sqlalchemy.sql import sqltypes
+
+
+OPERATORS = ('eq', 'ne', 'lt', 'lte', 'gt', 'gte', 'in', 'between', 'startswith', 'is_null')
+
+_COMPARISONS = {
+    'eq': lambda column, param: column == param,
+    'ne': lambda column, param: column != param,
+    'lt': lambda column, param: column < param,
+    'lte': lambda column, param: column <= param,
+    'gt': lambda column, param: column > param,
+    'gte': lambda column, param: column >= param,
+}
+
+_PARSERS = {
+    datetime.datetime: datetime.datetime.fromisoformat,
+    datetime.date: datetime.date.fromisoformat,
+    datetime.time: datetime.time.fromisoformat,
+    Decimal: Decimal,
+}
+
+
+def _null_comparisons(ops: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns operators with eq and ne comparisons to null turned into is_null,
+    since SQL never finds a value equal to NULL.
+    """
+    ops = dict(ops)
+    for op, is_null in (('eq', True), ('ne', False)):
+        if op in ops and ops[op] is None:
+            del ops[op]
+            ops['is_null'] = is_null
+    return ops
+
+
+def normalize_filters(filters: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the filters as {column: {operator: value}}, turning plain values
+    into eq and comparisons to null into is_null.
+    Raises ValueError for unknown or empty operator objects.
+    """
+    normalized = {}
+    for key, spec in (filters or {}).items():
+        if isinstance(spec, dict):
+            if not spec:
+                raise ValueError(f'Filter for "{key}" has no operators')
+            unknown = [op for op in spec if op not in OPERATORS]
+            if unknown:
+                raise ValueError(f'Unknown filter operator(s) {unknown} for "{key}", expected one of {list(OPERATORS)}')
+            normalized[key] = _null_comparisons(spec)
+        else:
+            normalized[key] = _null_comparisons({'eq': spec})
+    return normalized
+
+
+def filter_shape(normalized: Dict[str, Dict[str, Any]]) -> Tuple:
+    """
+    Returns the hashable shape of normalized filters: the sorted columns with
+    their sorted operators. Only is_null contributes its value, since it
+    changes the SQL (IS NULL or IS NOT NULL); all other values are bound.
+    """
+    return tuple(
+        (key, tuple(sorted((op, bool(value) if op == 'is_null' else None) for op, value in ops.items())))
+        for key, ops in sorted(normalized.items())
+    )
+
+
+def bind_names(key: str, op: str) -> List[str]:
+    """
+    Returns the bound parameter names used by an operator on a column.
+    Equality keeps the name SQLAlchemy generates for a literal comparison.
+    """
+    if op == 'eq':
+        return [f'{key}_1']
+    if op == 'between':
+        return [f'{key}_from', f'{key}_to']
+    if op == 'startswith':
+        return [f'{key}_prefix', f'{key}_prefix_end']
+    if op == 'is_null':
+        return []
+    return [f'{key}_{op}']
+
+
+def build_conditions(columns: Dict[str, Column], shape: Tuple, text_dates: bool = False) -> List:
+    """
+    Returns the WHERE conditions for a filter shape, with bound parameters
+    named by bind_names. With text_dates, as on SQLite, date and time columns
+    are compared with text parameters.
+    """
+    conditions = []
+    for key, ops in shape:
+        column = columns[key]
+        for op, is_null in ops:
+            names = bind_names(key, op)
+            params = [bindparam(name, type_=bind_type(column, text_dates)) for name in names]
+            if op in _COMPARISONS:
+                conditions.append(_COMPARISONS[op](column, params[0]))
+            elif op == 'in':
+                conditions.append(column.in_(bindparam(names[0], type_=bind_type(column, text_dates), expanding=True)))
+            elif op == 'between':
+                conditions.append(column.between(params[0], params[1]))
+            elif op == 'startswith':
+                conditions.append(column >= params[0])
+                conditions.append(column < params[1])
+            elif op == 'is_null':
+                conditions.append(column.is_(None) if is_null else column.is_not(None))
+    return conditions
+
+
+def is_text_date(column: Column) -> bool:
+    """
+    Returns whether a column holds dates or times, which SQLite stores as text.
+    """
+    return isinstance(column.type, (sqltypes.Date, sqltypes.DateTime, sqltypes.Time))
+
+
+def sqlite_text(value: Any) -> Any:
+    """
+    Returns a date, time or datetime in the text format of SQLite's date and
+    time functions, such as '2009-01-01 00:00:00', in which such values are
+    usually stored. SQLAlchemy's own bind format always adds microseconds,
+    so it neither equals nor sorts with the stored text. Other values are returned unchanged.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def bind_type(column: Column, text_dates: bool = False):
+    """
+    Returns the type of a parameter compared with a column: the column's own
+    type, or a string for date and time columns when they are compared as text.
+    """
+    return String() if text_dates and is_text_date(column) else column.type
+
+
+def value_parser(column: Column, text_dates: bool = False) -> Callable[[Any], Any]:
+    """
+    Returns a function converting JSON values to the Python type of a column,
+    so that dates, times and decimals can be given as strings. With
+    text_dates, parsed dates and times are returned as sqlite_text instead.
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return lambda value: value
+    for parsed_type, parse in _PARSERS.items():
+        if issubclass(python_type, parsed_type):
+            if text_dates and is_text_date(column):
+                return lambda value: sqlite_text(parse(value) if isinstance(value, str) else value)
+            return lambda value: parse(value) if isinstance(value, str) else value
+    return lambda value: value
+
+
+def _prefix_end(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def filter_params(normalized: Dict[str, Dict[str, Any]], parsers: Dict[str, Callable[[Any], Any]]) -> Dict[str, Any]:
+    """
+    Returns the bound parameter values for normalized filters.
+    Raises ValueError when a value does not suit its operator.
+    """
+    params = {}
+    for key, ops in normalized.items():
+        parse = parsers[key]
+        for op, value in ops.items():
+            names = bind_names(key, op)
+            if op == 'in':
+                if not isinstance(value, list):
+                    raise ValueError(f'Filter "in" for "{key}" expects a list')
+                params[names[0]] = [parse(item) for item in value]
+            elif op == 'between':
+                if not isinstance(value, list) or len(value) != 2:
+                    raise ValueError(f'Filter "between" for "{key}" expects a list of two values')
+                params[names[0]], params[names[1]] = parse(value[0]), parse(value[1])
+            elif op == 'startswith':
+                if not isinstance(value, str) or not value:
+                    raise ValueError(f'Filter "startswith" for "{key}" expects a non-empty string')
+                params[names[0]], params[names[1]] = value, _prefix_end(value)
+            elif op == 'is_null':
+                continue
+            else:
+                params[names[0]] = parse(value)
+    return params
@@ -0,0 +1,182 @@
+"""
+This module contains the hot views: /query/ and /aggregate/ requests named in
+config.ini whose results are precomputed and kept in memory.
+
+    [view:invoice_totals]
+    type = aggregate
+    request = {"table": "Invoice", "group_by": ["CustomerId"], "aggregates": [{"function": "sum", "column": "Total"}]}
+
+A view is served from its precomputed result and JSON body by /views/{name}
+and by any /query/ or /aggregate/ request equal to its request. A background
+thread recomputes a view when the data version of its database changes;
+until the new result is ready the previous one keeps being served.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+from pydantic import BaseModel
+from encoders import dumps_json
+from http_cache import make_etag
+
+
+VIEW_TYPES = ('query', 'aggregate')
+
+
+def view_key(view_type : str, request : BaseModel) -> str:
+    """
+    Returns the key a request is matched to views by, independent of the
+    order of its fields and of fields left at their defaults.
+    """
+    return f'{view_type}:{json.dumps(request.model_dump(), sort_keys=True, default=str)}'
+
+
+class ViewSnapshot(NamedTuple):
+    """
+    One computed result of a view with its JSON body and ETag, replaced as a
+    whole on refresh. The ETag is None when ETags are disabled.
+    """
+    result: dict
+    body: bytes
+    etag: Optional[str]
+    version: Optional[int]
+    computed_at: float
+
+
+class HotView:
+    """
+    A named request whose result is precomputed.
+    """
+    def __init__(self, name : str, view_type : str, request : BaseModel):
+        if view_type not in VIEW_TYPES:
+            raise ValueError(f'Unknown type "{view_type}" of view "{name}", expected one of {list(VIEW_TYPES)}')
+        self.name = name
+        self.type = view_type
+        self.request = request
+        self.key = view_key(view_type, request)
+        self.snapshot: Optional[ViewSnapshot] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.error: Optional[str] = None
+        self.refresh_seconds = 0.0
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            'type': self.type,
+            'table': self.request.table,
+            'ready': snapshot is not None,
+            'rows': len(snapshot.result['result']) if snapshot is not None else 0,
+            'bytes': len(snapshot.body) if snapshot is not None else 0,
+            'age_seconds': time.monotonic() - snapshot.computed_at if snapshot is not None else None,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'last_refresh_seconds': self.refresh_seconds,
+            'error': self.error,
+        }
+
+
+class HotViews:
+    """
+    The hot views of a DBInterface and the thread refreshing them.
+
+    compute returns the result of a view's request, raising on errors, and
+    version returns the current data version of the database a view reads.
+    Every interval seconds the views whose data version changed are computed
+    again, one at a time, off the request path. Without etags the snapshots
+    have no ETag.
+    """
+    def __init__(
+        self,
+        views : List[HotView],
+        compute : Callable[[HotView], dict],
+        version : Callable[[HotView], Optional[int]],
+        interval : float = 1.0,
+        logger : Optional[logging.Logger] = None,
+        etags : bool = True,
+    ):
+        self.views: Dict[str, HotView] = {view.name: view for view in views}
+        self._by_key = {view.key: view for view in views}
+        self._compute = compute
+        self._version = version
+        self.interval = interval
+        self.etags = etags
+        self.logger = logger or logging.getLogger()
+        self._refresh_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self) -> int:
+        return len(self.views)
+
+    def get(self, name : str) -> Optional[HotView]:
+        return self.views.get(name)
+
+    def match(self, view_type : str, request : BaseModel) -> Optional[ViewSnapshot]:
+        """
+        Returns the current snapshot of the view equal to a request, if it is computed.
+        """
+        if not self._by_key:
+            return None
+        view = self._by_key.get(view_key(view_type, request))
+        return view.snapshot if view is not None else None
+
+    def refresh(self, view : HotView, force : bool = False) -> bool:
+        """
+        Computes a view again when its data version changed, or always with
+        force. Returns whether a new snapshot was stored. Errors are logged
+        and the previous snapshot is kept.
+        """
+        with self._refresh_lock:
+            try:
+                version = self._version(view)
+                if not force and view.snapshot is not None and view.snapshot.version == version:
+                    return False
+                start = time.perf_counter()
+                result = self._compute(view)
+                body = dumps_json(result)
+            except Exception as e:
+                view.failures += 1
+                view.error = str(e)
+                self.logger.error(f'Could not refresh view {view.name}: {e}')
+                return False
+            view.refresh_seconds = time.perf_counter() - start
+            etag = make_etag('view', view.name, version, view.refreshes) if self.etags else None
+            view.snapshot = ViewSnapshot(result, body, etag, version, time.monotonic())
+            view.refreshes += 1
+            view.error = None
+            self.logger.info(
+                f'Refreshed view {view.name} with {len(result["result"])} rows in {view.refresh_seconds * 1000:.1f} ms'
+            )
+            return True
+
+    def refresh_all(self, force : bool = False) -> int:
+        """
+        Refreshes every view whose data version changed and returns how many were computed.
+        """
+        return sum(self.refresh(view, force) for view in self.views.values())
+
+    def start(self) -> None:
+        """
+        Starts the background thread refreshing the views, if there are any.
+        """
+        if self.views and self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='hot_views', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.refresh_all()
+
+    def close(self) -> None:
+        """
+        Stops the background thread.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {name: view.stats() for name, view in self.views.items()}
@@ -0,0 +1,39 @@
+"""
+This module contains the ETag and Cache-Control helpers for conditional requests.
+
+ETags are derived from the SQLite version counters and the request, so an
+If-None-Match header can be answered with 304 Not Modified before any query runs.
+"""
+import hashlib
+import json
+from typing import Optional
+
+
+def make_etag(*parts) -> str:
+    """
+    Returns a strong ETag for the JSON encoding of parts.
+    """
+    encoded = json.dumps(parts, sort_keys=True, default=str).encode()
+    return f'"{hashlib.blake2b(encoded, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match : Optional[str], etag : str) -> bool:
+    """
+    Returns whether an If-None-Match header matches etag. As required for
+    If-None-Match, tags are compared weakly, ignoring a W/ prefix.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def cache_control(max_age : int) -> str:
+    """
+    Returns the Cache-Control header value: shared caches may keep responses
+    for max_age seconds, or must revalidate them when max_age is 0.
+    """
+    if max_age > 0:
+        return f'public, max-age={max_age}'
+    return 'no-cache'
@@ -0,0 +1,96 @@
+"""
+This module contains the index advisor, which reports query shapes that SQLite cannot serve from an index.
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+
+# Operators whose columns can lead an index: the planner needs equality on them
+EQUALITY_OPERATORS = ('eq', 'in', 'is_null')
+# Operators that can use the column after the equality columns of an index
+RANGE_OPERATORS = ('lt', 'lte', 'gt', 'gte', 'between', 'startswith')
+
+
+def explain_query_plan(conn, statement, params: dict) -> List[str]:
+    """
+    Returns the detail lines of SQLite's EXPLAIN QUERY PLAN for a statement,
+    without executing it. Parameter values do not change the plan, so every
+    placeholder is bound to NULL.
+    """
+    compiled = statement.params(**params).compile(
+        dialect=conn.dialect, compile_kwargs={'render_postcompile': True}
+    )
+    placeholders = tuple(None for _ in compiled.positiontup or ())
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled.string}', placeholders).fetchall()
+    return [row[3] for row in rows]
+
+
+def suggest_index(table: str, filter_shape: tuple, order_by: Optional[str]) -> Optional[str]:
+    """
+    Returns a CREATE INDEX statement for the filtered columns: equality columns
+    first, then one range column, or else the ordering column.
+    """
+    equality_columns = [key for key, ops in filter_shape if any(op in EQUALITY_OPERATORS for op, _ in ops)]
+    range_columns = [
+        key for key, ops in filter_shape
+        if key not in equality_columns and any(op in RANGE_OPERATORS for op, _ in ops)
+    ]
+    columns = equality_columns + range_columns[:1]
+    if not range_columns and order_by is not None and order_by not in columns:
+        columns.append(order_by)
+    if not columns:
+        return None
+    index_name = '_'.join(['ix', table] + columns)
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    return f'CREATE INDEX "{index_name}" ON "{table}" ({column_list})'
+
+
+class IndexAdvisor:
+    """
+    Runs EXPLAIN QUERY PLAN once for every query shape it sees and reports
+    shapes that scan a whole table or sort without an index, together with
+    a suggested index. Only the first max_shapes shapes are recorded.
+    """
+    def __init__(self, max_shapes: int = 256):
+        self.max_shapes = max_shapes
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, conn, prepared: dict, params: dict) -> None:
+        """
+        Records a query of a prepared shape, explaining the shape the first time it is seen.
+        """
+        key = prepared['shape']
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                report['seen'] += 1
+                return
+            if len(self._reports) >= self.max_shapes:
+                return
+            report = self._reports[key] = {'table': prepared['table'], 'query': prepared['query'], 'seen': 1}
+
+        plan = explain_query_plan(conn, prepared['statement'], params)
+        full_scan = any(detail.startswith('SCAN') for detail in plan)
+        temp_sort = any('USE TEMP B-TREE' in detail for detail in plan)
+        suggested_index = None
+        if (full_scan and prepared['filter_shape']) or temp_sort:
+            suggested_index = suggest_index(prepared['table'], prepared['filter_shape'], prepared['order_by'])
+        report.update({
+            'plan': plan,
+            'full_scan': full_scan,
+            'temp_sort': temp_sort,
+            'suggested_index': suggested_index,
+        })
+
+    def advice(self, problems_only: bool = False) -> List[dict]:
+        """
+        Returns the reports of all recorded shapes, or only of those that
+        scan a table or sort without an index.
+        """
+        with self._lock:
+            reports = [dict(report) for report in self._reports.values() if 'plan' in report]
+        if problems_only:
+            reports = [report for report in reports if report['full_scan'] or report['temp_sort']]
+        return reports
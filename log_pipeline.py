@@ -0,0 +1,122 @@
+"""
+This module contains the asynchronous logging pipeline and the sampler for hot path log lines.
+"""
+import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """
+    Parses sampling rates given as comma separated route:rate pairs, e.g. "query:0.1, stream:1".
+    Raises ValueError for malformed pairs or rates outside 0 to 1.
+    """
+    rates = {}
+    for pair in (value or '').split(','):
+        pair = pair.strip()
+        if not pair:
+            continue
+        route, _, rate = pair.partition(':')
+        rate = float(rate)
+        if not 0 <= rate <= 1:
+            raise ValueError(f'Log sample rate for "{route.strip()}" must be between 0 and 1, got {rate}')
+        rates[route.strip()] = rate
+    return rates
+
+
+class LogSampler:
+    """
+    Decides which hot path log lines are written, by route. Routes without
+    a configured rate are always logged.
+    """
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = dict(rates)
+        self.sampled_out = 0
+        self._lock = threading.Lock()
+
+    def sample(self, route: str) -> bool:
+        """
+        Returns whether a log line for route should be written.
+        """
+        rate = self.rates.get(route, 1.0)
+        if rate >= 1.0 or (rate > 0.0 and random.random() < rate):
+            return True
+        with self._lock:
+            self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the writer thread and drops
+    records instead of blocking when the queue is full.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.queued = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler formats the message here; the listener's handlers format it instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        with self._lock:
+            self.queued += 1
+
+
+class _BlockingSentinelListener(QueueListener):
+    """
+    Queue listener that waits for room in a full queue to enqueue its stop sentinel.
+    """
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """
+    Moves the handlers of a logger behind a bounded queue served by a
+    background writer thread, so that logging calls only enqueue records.
+    """
+    def __init__(self, logger: logging.Logger, queue_size: int):
+        self.logger = logger
+        self.handlers = list(logger.handlers)
+        self.queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.listener = _BlockingSentinelListener(self.queue_handler.queue, *self.handlers, respect_handler_level=True)
+        self.closed = False
+        for handler in self.handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(self.queue_handler)
+        self.listener.start()
+
+    def close(self) -> None:
+        """
+        Writes the queued records, stops the writer thread and restores the logger's handlers.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+
+    def stats(self) -> dict:
+        """
+        Returns the records queued, dropped because the queue was full, and waiting to be written.
+        """
+        return {
+            'queued': self.queue_handler.queued,
+            'dropped': self.queue_handler.dropped,
+            'pending': self.queue_handler.queue.qsize(),
+        }
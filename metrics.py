@@ -0,0 +1,190 @@
+"""
+This module contains the request metrics exported in the Prometheus text format by /metrics.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+
+# Upper bounds in seconds of the request latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Name, type and help text of the metrics recorded by MetricsMiddleware and the routes
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Latency of HTTP requests by route, method and status.'),
+    'http_requests_in_flight': ('gauge', 'HTTP requests currently being handled.'),
+    'http_response_bytes_total': ('counter', 'Response body bytes sent, by route and table.'),
+    'db_rows_returned_total': ('counter', 'Rows returned by the query endpoints, by table.'),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms kept in one shard per thread.
+
+    Each thread records into its own shard without taking a lock, so
+    recording costs a few dictionary operations on the hot path. The
+    shards are summed when the metrics are scraped.
+    """
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {'values': {}, 'histograms': {}}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        """
+        Adds amount to a counter or gauge; gauges may be decremented with a negative amount.
+        """
+        values = self._shard()['values']
+        key = (name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        """
+        Records a value in a histogram.
+        """
+        histograms = self._shard()['histograms']
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # one count per bucket, then the +Inf bucket, the sum and the count
+            histogram = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def collect(self) -> Tuple[Dict[tuple, float], Dict[tuple, list]]:
+        """
+        Returns the values and histograms of all shards summed by name and labels.
+        """
+        with self._shards_lock:
+            shards = list(self._shards)
+        values: Dict[tuple, float] = {}
+        histograms: Dict[tuple, list] = {}
+        for shard in shards:
+            for key, value in list(shard['values'].items()):
+                values[key] = values.get(key, 0) + value
+            for key, histogram in list(shard['histograms'].items()):
+                total = histograms.setdefault(key, [0] * len(histogram))
+                for i, value in enumerate(list(histogram)):
+                    total[i] += value
+        return values, histograms
+
+    def render(self, extra: Iterable[Tuple[str, str, str, Labels, float]] = ()) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format, followed
+        by extra samples given as (name, type, help, labels, value).
+        """
+        values, histograms = self.collect()
+        samples: Dict[str, list] = {}
+        for (name, labels), value in values.items():
+            samples.setdefault(name, []).append((labels, value))
+        types = {name: (metric_type, help_text) for name, (metric_type, help_text) in METRICS.items()}
+        for name, metric_type, help_text, labels, value in extra:
+            types.setdefault(name, (metric_type, help_text))
+            samples.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (metric_type, help_text) in types.items():
+            if metric_type == 'histogram':
+                series = sorted((labels, histogram) for (hist_name, labels), histogram in histograms.items() if hist_name == name)
+            else:
+                series = sorted(samples.get(name, []))
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in series:
+                if metric_type == 'histogram':
+                    lines.extend(self._render_histogram(name, labels, value))
+                else:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, name: str, labels: Labels, histogram: list) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), histogram):
+            cumulative += count
+            bucket_labels = labels + (('le', _format_value(bound)),)
+            lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram[-2])}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram[-1]}')
+        return lines
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency, in-flight count and response
+    bytes of every HTTP request, labelled with the route's path template.
+
+    Routes may put the queried table in request.state.table to label the
+    response bytes with it.
+    """
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = scope.setdefault('state', {})
+        response = {'status': 500, 'bytes': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['bytes'] += len(message.get('body', b''))
+            await send(message)
+
+        self.metrics.inc('http_requests_in_flight', (), 1)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.inc('http_requests_in_flight', (), -1)
+            # the router stores the matched route in the scope
+            route_path = getattr(scope.get('route'), 'path', 'unmatched')
+            self.metrics.observe(
+                'http_request_duration_seconds',
+                (('route', route_path), ('method', scope['method']), ('status', str(response['status']))),
+                time.perf_counter() - start,
+            )
+            self.metrics.inc(
+                'http_response_bytes_total',
+                (('route', route_path), ('table', str(state.get('table', '')))),
+                response['bytes'],
+            )
@@ -1,5 +1,5 @@
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, RootModel
+from pydantic import BaseModel, Field, RootModel
 
 
 class TableSchema(RootModel[Dict[str, str]]):
@@ -23,10 +23,32 @@ class TableWrapper(RootModel[Dict[str, TableModel]]):
 
 class QueryRequest(BaseModel):
     """
-    Represents a request to query a database table."""
+    Represents a request to query a database table.
+
+    Each filter is either a value the column must equal, or an object of
+    operators: eq, ne, lt, lte, gt, gte, in, between, startswith and is_null.
+    For example {"Milliseconds": {"gte": 200000, "lt": 300000}}.
+
+    expand lists related tables to nest in each row, following the reflected
+    foreign keys: a table the row refers to is nested as an object, a table
+    referring to the row as a list. Paths such as "Track.Genre" expand
+    further levels, up to max_expand_depth.
+
+    Results are returned in pages ordered by order_by (when given) and the
+    primary key. Pass the next_cursor of a response as cursor to get the next page.
+
+    database routes the query to a named database from config.ini instead of
+    the [database] section. /query/stream also accepts a shard group, which
+    runs the query on all of its databases in parallel.
+    """
     table: str
     fields: Optional[List[str]] = None
     filters: Optional[Dict[str, Any]] = None
+    order_by: Optional[str] = None
+    limit: Optional[int] = Field(default=None, gt=0)
+    cursor: Optional[str] = None
+    expand: Optional[List[str]] = None
+    database: Optional[str] = None
 
 
 class TableList(BaseModel):
@@ -39,4 +61,77 @@ class TableList(BaseModel):
 class DBQueryResponse(BaseModel):
     query: str
     result: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class Aggregate(BaseModel):
+    """
+    One aggregate of an aggregation: a function of count, count_distinct,
+    sum, avg, min or max applied to a column (count alone counts rows).
+    The result is named alias, or function_column when no alias is given.
+    """
+    function: str
+    column: Optional[str] = None
+    alias: Optional[str] = None
+
+
+class AggregateRequest(BaseModel):
+    """
+    Represents a request to aggregate the filtered rows of a table per group.
+
+    filters accept the same values and operators as QueryRequest. order_by
+    names a group_by column or an aggregate alias; without it groups are
+    ordered by the group_by columns. database routes the aggregation like
+    the database of QueryRequest.
+    """
+    table: str
+    group_by: List[str] = []
+    aggregates: List[Aggregate] = Field(min_length=1)
+    filters: Optional[Dict[str, Any]] = None
+    order_by: Optional[str] = None
+    descending: bool = False
+    limit: Optional[int] = Field(default=None, gt=0)
+    database: Optional[str] = None
+
+
+class AggregateResponse(BaseModel):
+    query: str
+    result: List[Dict[str, Any]]
+
+
+class QueryPlan(BaseModel):
+    """
+    The SQL of a query request and the detail lines of its EXPLAIN QUERY PLAN.
+    """
+    query: str
+    plan: List[str]
+
+
+
+class BatchQueryRequest(BaseModel):
+    """
+    Represents several query requests executed together.
 
+    By default the queries run one after another on a single connection in
+    one read transaction, so every result comes from the same snapshot. With
+    parallel set they run concurrently on separate pooled connections instead.
+    """
+    queries: List[QueryRequest]
+    parallel: bool = False
+
+
+class BatchQueryItem(BaseModel):
+    """
+    The result of one query in a batch, or the error it failed with.
+    """
+    query: Optional[str] = None
+    result: Optional[List[Dict[str, Any]]] = None
+    next_cursor: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchQueryResponse(BaseModel):
+    """
+    The results of a batch, in the order of the requested queries.
+    """
+    results: List[BatchQueryItem]
@@ -0,0 +1,70 @@
+"""
+This module contains the opaque cursor tokens used for keyset pagination of /query/ results.
+"""
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+from typing import Any, List, Sequence, Tuple
+
+
+_TAGGED_TYPES = {
+    'datetime': (datetime.datetime, datetime.datetime.fromisoformat),
+    'date': (datetime.date, datetime.date.fromisoformat),
+    'time': (datetime.time, datetime.time.fromisoformat),
+    'decimal': (Decimal, Decimal),
+}
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor token cannot be decoded or belongs to another ordering
+    """
+    pass
+
+
+def _encode_value(value: Any) -> Any:
+    for tag, (python_type, _) in _TAGGED_TYPES.items():
+        if isinstance(value, python_type):
+            return {tag: str(value) if tag == 'decimal' else value.isoformat()}
+    if isinstance(value, bytes):
+        return {'bytes': base64.b64encode(value).decode('ascii')}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and len(value) == 1:
+        tag, raw = next(iter(value.items()))
+        if tag == 'bytes':
+            return base64.b64decode(raw)
+        return _TAGGED_TYPES[tag][1](raw)
+    return value
+
+
+def encode_cursor(key_names: Sequence[str], values: Sequence[Any]) -> str:
+    """
+    Returns an opaque token holding the ordering key values of the last row on a page.
+    """
+    payload = {'k': list(key_names), 'v': [_encode_value(value) for value in values]}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, key_names: Sequence[str]) -> List[Any]:
+    """
+    Returns the ordering key values stored in a token created by encode_cursor.
+
+    Raises InvalidCursor if the token is malformed or was created for a
+    different ordering than key_names.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        names: Tuple[str, ...] = tuple(payload['k'])
+        values = [_decode_value(value) for value in payload['v']]
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {e}')
+    if names != tuple(key_names) or len(values) != len(names):
+        raise InvalidCursor(f'Cursor was created for ordering {list(names)}, not {list(key_names)}')
+    return values
@@ -0,0 +1,79 @@
+"""
+This module contains the timers for the phases of a query.
+"""
+import threading
+import time
+from typing import Dict
+
+
+class QueryTimer:
+    """
+    Splits the time spent on one query into phases using the monotonic
+    performance counter. Each call to mark() attributes the time since the
+    previous mark to a phase.
+
+    DBInterface marks the phases checkout, build, execute, fetch and cache;
+    the /query/ route adds serialize.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """
+        Adds the time since the previous mark to phase and returns it.
+        """
+        now = time.perf_counter()
+        seconds = now - self._last
+        self._last = now
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        return seconds
+
+    @property
+    def total(self) -> float:
+        """
+        Seconds from the creation of the timer to the last mark.
+        """
+        return self._last - self.start
+
+    def describe(self) -> str:
+        """
+        Returns the phase durations in milliseconds for log lines.
+        """
+        return ', '.join(f'{phase}={seconds * 1000:.1f}ms' for phase, seconds in self.phases.items())
+
+
+class PhaseStats:
+    """
+    Accumulates the count, total and maximum duration of each query phase,
+    and how many queries exceeded the slow query threshold.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.slow_queries = 0
+        self._phases: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, timer: QueryTimer, slow: bool = False) -> None:
+        with self._lock:
+            self.queries += 1
+            if slow:
+                self.slow_queries += 1
+            for phase, seconds in list(timer.phases.items()) + [('total', timer.total)]:
+                stats = self._phases.setdefault(phase, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                stats['count'] += 1
+                stats['seconds'] += seconds
+                if seconds > stats['max_seconds']:
+                    stats['max_seconds'] = seconds
+
+    def stats(self) -> dict:
+        """
+        Returns the query counts and, for each phase, the count and the total, average and maximum seconds.
+        """
+        with self._lock:
+            phases = {
+                phase: dict(stats, avg_seconds=stats['seconds'] / stats['count'])
+                for phase, stats in self._phases.items()
+            }
+            return {'queries': self.queries, 'slow_queries': self.slow_queries, 'phases': phases}
@@ -0,0 +1,166 @@
+"""
+This module contains the in-process cache of /query/ results.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from encoders import json_default
+
+
+class _Flight:
+    """
+    A computation in progress that identical concurrent requests wait for
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """
+    Least-recently-used cache of query results bounded by entry count and bytes.
+
+    Entries belong to a scope, such as the database they were read from, and
+    to its data version; when a different version of a scope is reported the
+    entries of that scope are dropped. Entries can also expire after ttl seconds.
+    Concurrent misses for the same key are coalesced so only one of them runs
+    the query while the others wait for its result.
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._versions = {}
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def size_of(value: Any) -> int:
+        """
+        Returns the approximate size of a result as its length encoded as JSON.
+        """
+        return len(json.dumps(value, default=json_default))
+
+    def _check_version(self, scope: Hashable, version: Optional[int]) -> None:
+        if scope in self._versions and self._versions[scope] == version:
+            return
+        if scope in self._versions:
+            stale = [key for key, entry in self._entries.items() if entry[3] == scope]
+            for key in stale:
+                self.bytes -= self._entries.pop(key)[1]
+            if stale:
+                self.invalidations += 1
+        self._versions[scope] = version
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, size = entry[:2]
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.bytes -= size
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, scope: Hashable, value: Any) -> None:
+        size = self.size_of(value)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._entries[key] = (time.monotonic(), size, value, scope)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size, _, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def get_or_compute(
+        self, key: Hashable, version: Optional[int], compute: Callable[[], Any], scope: Hashable = None
+    ) -> Any:
+        """
+        Returns the cached value for key at the given data version of its
+        scope, calling compute() on a miss. Exceptions raised by compute()
+        are passed to every waiting caller and nothing is cached.
+        """
+        if not self.enabled:
+            return compute()
+
+        with self._lock:
+            self._check_version(scope, version)
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if flight.error is None and self._versions.get(scope) == version:
+                    self._store(key, scope, flight.value)
+            flight.event.set()
+        return flight.value
+
+    def clear(self) -> None:
+        """
+        Removes every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the size, hit ratio and eviction counters of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
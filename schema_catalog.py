@@ -0,0 +1,94 @@
+"""
+This module contains the in-memory schema catalog served by the /tables/ endpoints.
+"""
+import json
+import threading
+from typing import Dict, List, Optional
+from sqlalchemy import MetaData, Table, text
+from sqlalchemy.engine import Engine
+
+
+def dump_json(content) -> bytes:
+    """
+    Serializes content the same way FastAPI's default JSONResponse does.
+    """
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')
+    ).encode('utf-8')
+
+
+class SchemaCatalog:
+    """
+    Table names and column types of the database, held in memory.
+
+    The responses for /tables/ and /tables/info/{table} are serialized once per
+    table and then answered from memory. For SQLite the column types are the
+    declared types reported by PRAGMA table_info; for other databases they are
+    the reflected types compiled for the engine's dialect.
+
+    Table names come from the reflected metadata unless given explicitly.
+    Column types can be supplied (for example from a schema snapshot), loaded
+    for every table at once with build(), or loaded per table on first use.
+    """
+    def __init__(
+        self,
+        engine: Engine,
+        metadata: MetaData,
+        schema_version: Optional[int] = None,
+        table_names: Optional[List[str]] = None,
+        columns: Optional[Dict[str, Dict[str, str]]] = None,
+    ):
+        self.engine = engine
+        self.metadata = metadata
+        self.schema_version = schema_version
+        self.table_names: List[str] = sorted(metadata.tables if table_names is None else table_names)
+        self.columns: Dict[str, Dict[str, str]] = dict(columns or {})
+        self.tables_body = dump_json({'table_names': self.table_names})
+        self.table_bodies: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def _load_columns(self, table_names: List[str]) -> None:
+        if self.engine.dialect.name == 'sqlite':
+            with self.engine.connect() as conn:
+                for table_name in table_names:
+                    pragma_stmt = text(f'PRAGMA table_info("{table_name}")')
+                    rows = conn.execute(pragma_stmt).fetchall()
+                    self.columns[table_name] = {row[1]: row[2] for row in rows}
+        else:
+            for table_name in table_names:
+                table = Table(table_name, self.metadata, autoload_with=self.engine)
+                self.columns[table_name] = {
+                    column.name: column.type.compile(dialect=self.engine.dialect)
+                    for column in table.columns
+                }
+
+    def build(self) -> 'SchemaCatalog':
+        """
+        Loads and serializes the column types of every table that is not loaded yet.
+        """
+        with self._lock:
+            self._load_columns([name for name in self.table_names if name not in self.columns])
+            for table_name in self.table_names:
+                self.table_bodies[table_name] = dump_json({table_name: self.columns[table_name]})
+        return self
+
+    def table_columns(self, table: str) -> Dict[str, str]:
+        """
+        Returns the column types of a table, which are empty for an unknown table.
+        """
+        if table not in self.columns and table in self.table_names:
+            with self._lock:
+                if table not in self.columns:
+                    self._load_columns([table])
+        return self.columns.get(table, {})
+
+    def table_body(self, table: str) -> bytes:
+        """
+        Returns the serialized column types of a table, which are empty for an unknown table.
+        """
+        body = self.table_bodies.get(table)
+        if body is None:
+            body = dump_json({table: self.table_columns(table)})
+            if table in self.columns:
+                self.table_bodies[table] = body
+        return body
@@ -0,0 +1,63 @@
+"""
+This module contains the on-disk schema snapshot that lets DBInterface skip reflection at startup.
+"""
+import pickle
+from pathlib import Path
+from typing import Dict, Optional, Union
+from sqlalchemy import MetaData
+
+
+SNAPSHOT_FORMAT = 1
+
+
+def load_snapshot(path: Union[str, Path], connection_string: str, schema_version: Optional[int]) -> Optional[dict]:
+    """
+    Returns the snapshot stored at path if it was taken of the same database at
+    the same schema_version, else None. Without a schema_version the snapshot
+    cannot be validated and is never used.
+
+    The snapshot holds 'metadata' (the reflected MetaData) and 'columns' (the
+    column types served by the schema catalog). It is a pickle written by
+    save_snapshot, so it must only be read from a location the service controls.
+    """
+    path = Path(path)
+    if schema_version is None or not path.is_file():
+        return None
+    with open(path, 'rb') as file:
+        snapshot = pickle.load(file)
+    if (
+        snapshot.get('format') != SNAPSHOT_FORMAT
+        or snapshot.get('connection_string') != connection_string
+        or snapshot.get('schema_version') != schema_version
+    ):
+        return None
+    return snapshot
+
+
+def save_snapshot(
+    path: Union[str, Path],
+    connection_string: str,
+    schema_version: Optional[int],
+    metadata: MetaData,
+    columns: Dict[str, Dict[str, str]],
+) -> bool:
+    """
+    Writes the reflected metadata and catalog column types to path and returns
+    whether a snapshot was written. The file is replaced atomically.
+    """
+    if schema_version is None:
+        return False
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'connection_string': connection_string,
+        'schema_version': schema_version,
+        'metadata': metadata,
+        'columns': columns,
+    }
+    temporary_path = path.with_name(path.name + '.tmp')
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+    temporary_path.replace(path)
+    return True
@@ -0,0 +1,111 @@
+"""
+This module contains the connection settings applied to SQLite engines serving reads,
+and the timer for connection pool checkouts.
+"""
+import sqlite3
+import threading
+from typing import Dict, Mapping
+from urllib.parse import quote
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, URL
+
+
+# PRAGMAs that may be set on every new connection, in the order they are applied
+READ_PRAGMAS = ('mmap_size', 'cache_size', 'temp_store', 'query_only')
+
+
+def read_pragmas(section: Mapping[str, str]) -> Dict[str, str]:
+    """
+    Returns the READ_PRAGMAS given a non-empty value in a configuration section.
+    """
+    pragmas = {}
+    for name in READ_PRAGMAS:
+        value = (section.get(name) or '').strip()
+        if value:
+            pragmas[name] = value
+    return pragmas
+
+
+def is_file_database(url: URL) -> bool:
+    """
+    Returns whether a SQLite URL refers to a database file rather than an in-memory database.
+    """
+    database = url.database or ''
+    return database not in ('', ':memory:') and 'mode=memory' not in database
+
+
+def read_only_url(url: URL, immutable: bool = False) -> URL:
+    """
+    Returns the URL of a SQLite database file opened as a read-only URI
+    (mode=ro), optionally flagged immutable so SQLite skips locking and
+    change detection entirely.
+    """
+    if not is_file_database(url) or url.query.get('uri'):
+        return url
+    query = dict(url.query)
+    query['mode'] = 'ro'
+    if immutable:
+        query['immutable'] = '1'
+    query['uri'] = 'true'
+    return url.set(database=f'file:{quote(url.database, safe="/:")}', query=query)
+
+
+def set_journal_mode(url: URL, journal_mode: str) -> str:
+    """
+    Switches a SQLite database file to journal_mode and returns the mode in effect.
+
+    The journal mode is stored in the database file, so it is set once on a
+    separate read-write connection rather than on every pooled connection,
+    which may be read-only.
+    """
+    conn = sqlite3.connect(url.database)
+    try:
+        return conn.execute(f'PRAGMA journal_mode={journal_mode}').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def install_pragmas(engine: Engine, pragmas: Dict[str, str]) -> None:
+    """
+    Sets the given PRAGMAs on every connection the engine opens.
+    """
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+class CheckoutTimer:
+    """
+    Accumulates how long checking connections out of the pool took.
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            if seconds > self.max_wait_seconds:
+                self.max_wait_seconds = seconds
+
+    def stats(self) -> dict:
+        """
+        Returns the checkout count and the total, average and maximum wait in seconds.
+        """
+        return {
+            'checkouts': self.checkouts,
+            'wait_seconds': self.wait_seconds,
+            'avg_wait_seconds': self.wait_seconds / self.checkouts if self.checkouts else 0.0,
+            'max_wait_seconds': self.max_wait_seconds,
+        }
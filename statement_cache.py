@@ -0,0 +1,67 @@
+"""
+This module contains a bounded LRU cache for the SQL statements built by DBInterface.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class StatementCache:
+    """
+    Least-recently-used cache of prepared statements keyed by request shape.
+
+    Entries are built once by the callable passed to get_or_build and reused
+    for every later request with the same shape, so only the bound parameter
+    values change between calls. Hit and miss counters are kept for reporting.
+    """
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """
+        Return the cached entry for key, calling build() to create it on a miss.
+        Exceptions raised by build() propagate and nothing is cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = build()
+        if self.maxsize <= 0:
+            return entry
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        """
+        Remove every entry, for example after the schema changed.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the size and hit/miss counters of the cache.
+        """
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
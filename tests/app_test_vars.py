@@ -22,7 +22,8 @@ album_request = {
         "ArtistId": 1
     }   
 }
-album_expected_sql_query = 'SELECT "Album"."AlbumId", "Album"."Title" \nFROM "Album" \nWHERE "Album"."ArtistId" = :ArtistId_1'
+album_expected_sql_query = ('SELECT "Album"."AlbumId", "Album"."Title" \nFROM "Album" \nWHERE "Album"."ArtistId" = :ArtistId_1 '
+                            'ORDER BY "Album"."AlbumId"\n LIMIT :page_limit')
 album_query_result = [{'AlbumId': 1, 'Title': 'For Those About To Rock We Salute You'}, {'AlbumId': 4, 'Title': 'Let There Be Rock'}]
 artist_request = {
     "table": "Artist",
@@ -30,7 +31,8 @@ artist_request = {
         "ArtistId": 1
     }
 }
-artist_expected_sql_query = 'SELECT "Artist"."ArtistId", "Artist"."Name" \nFROM "Artist" \nWHERE "Artist"."ArtistId" = :ArtistId_1'
+artist_expected_sql_query = ('SELECT "Artist"."ArtistId", "Artist"."Name" \nFROM "Artist" \nWHERE "Artist"."ArtistId" = :ArtistId_1 '
+                             'ORDER BY "Artist"."ArtistId"\n LIMIT :page_limit')
 artist_query_result = [{'ArtistId': 1, 'Name': 'AC/DC'}]
 no_table_query = {
     "fields": ["AlbumId", "Title"],
@@ -46,3 +48,12 @@ no_table_detail = [{
         'fields': ['AlbumId', 'Title'],
         'filters': {'ArtistId': 1}},
 }]
+track_count = 3503
+invoice_page_request = {
+    "table": "Invoice",
+    "fields": ["InvoiceId", "Total"],
+    "order_by": "InvoiceDate",
+    "limit": 2
+}
+invoice_first_page = [{'InvoiceId': 1, 'Total': '1.98'}, {'InvoiceId': 2, 'Total': '3.96'}]
+invoice_second_page = [{'InvoiceId': 3, 'Total': '5.94'}, {'InvoiceId': 4, 'Total': '8.91'}]
@@ -0,0 +1,110 @@
+"""
+Test module for the admission.py cost estimates, token buckets and in-flight budget
+"""
+import sqlite3
+from pathlib import Path
+import pytest
+from sqlalchemy import MetaData, Table, create_engine
+from admission import AdmissionController, Overloaded, RateLimited, RowCounts, estimate_rows, index_columns
+from filters import normalize_filters
+
+
+REPO_DIRECTORY = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope='module')
+def track() -> Table:
+    engine = create_engine(f'sqlite:///{REPO_DIRECTORY / "db" / "chinook.db"}')
+    return Table('Track', MetaData(), autoload_with=engine)
+
+
+def test_index_columns(track: Table) -> None:
+    """
+    Test that the primary key is a unique index column and foreign key indexes are not.
+    """
+    assert index_columns(track) == {'TrackId': True, 'AlbumId': False, 'GenreId': False, 'MediaTypeId': False}
+
+
+def test_estimate_rows(track: Table) -> None:
+    """
+    Test that indexed filters and index ordered pages examine fewer rows than scans.
+    """
+    rows = 3503
+    assert estimate_rows(track, rows, normalize_filters({'TrackId': 5})) == 1
+    assert estimate_rows(track, rows, normalize_filters({'TrackId': {'in': [1, 2, 3]}})) == 3
+    assert estimate_rows(track, rows, normalize_filters({'AlbumId': 1})) == 60
+    assert estimate_rows(track, rows, normalize_filters({'TrackId': {'gt': 100}})) == 876
+    assert estimate_rows(track, rows, normalize_filters({'Composer': 'AC/DC'})) == rows
+    # a page in primary key order stops early, unless a filter needs every row examined
+    assert estimate_rows(track, rows, {}, page_size=100) == 100
+    assert estimate_rows(track, rows, {}, order_by='Name', page_size=100) == rows
+    assert estimate_rows(track, rows, normalize_filters({'Composer': 'AC/DC'}), page_size=100) == rows
+    assert estimate_rows(track, rows, {}, page_size=100, expand=2) == 300
+
+
+def test_row_counts_follow_data_version(tmp_path: Path) -> None:
+    """
+    Test that row counts are kept until the data version changes.
+    """
+    path = tmp_path / 'counts.db'
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE Sale (SaleId INTEGER PRIMARY KEY, Total NUMERIC)')
+        conn.execute('CREATE TABLE Tag (Name TEXT PRIMARY KEY) WITHOUT ROWID')
+        conn.executemany('INSERT INTO Sale (Total) VALUES (?)', [(1,), (2,)])
+        conn.executemany('INSERT INTO Tag VALUES (?)', [('a',), ('b',), ('c',)])
+    counts = RowCounts(create_engine(f'sqlite:///{path}'))
+    try:
+        assert counts.count('Sale', 1) == 2
+        assert counts.count('Tag', 1) == 3
+        with sqlite3.connect(path) as conn:
+            conn.execute('INSERT INTO Sale (Total) VALUES (3)')
+        assert counts.count('Sale', 1) == 2
+        assert counts.count('Sale', 2) == 3
+    finally:
+        counts.close()
+
+
+def test_token_bucket_per_client() -> None:
+    """
+    Test that a client is limited once its bucket is spent while other clients are not.
+    """
+    controller = AdmissionController(rate=1, burst=10, max_inflight_cost=1000)
+    controller.release(controller.admit('a', 6))
+    controller.release(controller.admit('a', 4))
+    with pytest.raises(RateLimited) as error:
+        controller.admit('a', 2)
+    assert 0 < error.value.retry_after <= 2
+    controller.release(controller.admit('b', 10))
+    # a request costing more than the burst is admitted with a full bucket
+    controller.release(controller.admit('c', 50))
+    with pytest.raises(RateLimited):
+        controller.admit('c', 1)
+    assert controller.stats()['rate_limited'] == 2
+    assert controller.stats()['admitted'] == 4
+
+
+def test_inflight_budget() -> None:
+    """
+    Test that the cost in flight is bounded, except for a single request costing more than the budget.
+    """
+    controller = AdmissionController(rate=100, burst=1000, max_inflight_cost=10)
+    first = controller.admit('a', 6)
+    with pytest.raises(Overloaded):
+        controller.admit('b', 5)
+    second = controller.admit('b', 4)
+    assert controller.stats()['inflight_cost'] == 10
+    controller.release(first)
+    controller.release(second)
+    controller.release(controller.admit('c', 25))
+    assert controller.stats()['inflight_cost'] == 0
+    assert controller.stats()['overloaded'] == 1
+
+
+def test_clients_forgotten_least_recently_seen() -> None:
+    """
+    Test that only the buckets of the most recent max_clients clients are kept.
+    """
+    controller = AdmissionController(rate=1, burst=5, max_inflight_cost=1000, max_clients=2)
+    for client in ('a', 'b', 'a', 'c'):
+        controller.release(controller.admit(client, 1))
+    assert list(controller._buckets) == ['a', 'c']
@@ -0,0 +1,94 @@
+"""
+Test module for the aggregates.py aggregations run by DBInterface.aggregate
+"""
+import sqlite3
+from decimal import Decimal
+from pathlib import Path
+import pytest
+import models
+from db_interface import DBInterface
+
+
+DB_INTERFACE = DBInterface()
+DB_PATH = Path(__file__).parent.parent / 'db' / 'chinook.db'
+
+
+def fetch(sql: str) -> list:
+    with sqlite3.connect(DB_PATH) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def aggregate(**request_body) -> dict:
+    return DB_INTERFACE.aggregate(DB_INTERFACE.metadata, models.AggregateRequest(**request_body))
+
+
+def test_revenue_per_country() -> None:
+    """
+    Test grouping with a sum ordered by its alias, descending and limited.
+    """
+    result = aggregate(
+        table='Invoice',
+        group_by=['BillingCountry'],
+        aggregates=[{'function': 'sum', 'column': 'Total', 'alias': 'revenue'}, {'function': 'count'}],
+        order_by='revenue',
+        descending=True,
+        limit=5,
+    )
+    expected = fetch(
+        'SELECT BillingCountry, round(sum(Total), 2), count(*) FROM Invoice '
+        'GROUP BY BillingCountry ORDER BY sum(Total) DESC LIMIT 5'
+    )
+    assert [
+        (row['BillingCountry'], row['revenue'], row['count']) for row in result['result']
+    ] == [(country, Decimal(str(revenue)).quantize(Decimal('0.01')), count) for country, revenue, count in expected]
+
+
+def test_aggregates_with_filters() -> None:
+    """
+    Test every aggregate function per group on filtered rows, with default output names.
+    """
+    result = aggregate(
+        table='Track',
+        group_by=['GenreId'],
+        aggregates=[
+            {'function': 'count'},
+            {'function': 'count_distinct', 'column': 'AlbumId'},
+            {'function': 'avg', 'column': 'Milliseconds'},
+            {'function': 'min', 'column': 'Milliseconds'},
+            {'function': 'max', 'column': 'Milliseconds'},
+        ],
+        filters={'GenreId': {'in': [1, 2]}, 'Milliseconds': {'gt': 100000}},
+    )
+    expected = fetch(
+        'SELECT GenreId, count(*), count(DISTINCT AlbumId), avg(Milliseconds), min(Milliseconds), max(Milliseconds) '
+        'FROM Track WHERE GenreId IN (1, 2) AND Milliseconds > 100000 GROUP BY GenreId ORDER BY GenreId'
+    )
+    assert [tuple(row.values()) for row in result['result']] == expected
+    assert list(result['result'][0]) == [
+        'GenreId', 'count', 'count_distinct_AlbumId', 'avg_Milliseconds', 'min_Milliseconds', 'max_Milliseconds'
+    ]
+
+
+def test_count_without_grouping() -> None:
+    """
+    Test that counting all rows without group_by reads the table.
+    """
+    result = aggregate(table='Track', aggregates=[{'function': 'count'}])
+    assert 'FROM "Track"' in result['query']
+    assert [row['count'] for row in result['result']] == [fetch('SELECT count(*) FROM Track')[0][0]]
+
+
+@pytest.mark.parametrize('request_body', [
+    {'table': 'Track', 'group_by': ['NoSuchColumn'], 'aggregates': [{'function': 'count'}]},
+    {'table': 'Track', 'aggregates': [{'function': 'sum', 'column': 'Name'}]},
+    {'table': 'Track', 'aggregates': [{'function': 'median', 'column': 'Milliseconds'}]},
+    {'table': 'Track', 'aggregates': [{'function': 'max'}]},
+    {'table': 'Track', 'aggregates': [{'function': 'count'}], 'filters': {'NoSuchColumn': 1}},
+    {'table': 'Track', 'aggregates': [{'function': 'count'}], 'order_by': 'Name'},
+    {'table': 'Track', 'group_by': ['TrackId'], 'aggregates': [{'function': 'count'}]},
+])
+def test_invalid_aggregations(request_body: dict) -> None:
+    """
+    Test that unknown columns and functions, non-numeric sums, bad ordering and oversized results are rejected.
+    """
+    assert 'error' in aggregate(**request_body)
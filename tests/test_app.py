@@ -8,6 +8,9 @@ Requirements:
 uvicorn must be running the app:my_app FastAPI instance 
 This works with the chinook database. 
 """
+import asyncio
+import json
+import gzip
 import multiprocessing
 import time
 from typing import Generator
@@ -155,3 +158,393 @@ def test_query(api_url: str, request_body, expected_status_code, expected_sql_qu
         assert data['result'] == expected_query_result
     else:
         assert data['detail'] == expected_query_result
+
+
+def test_statement_cache_stats(api_url: str) -> None:
+    """
+    Test that repeating a query shape with new filter values is served from the statement cache.
+    """
+    before = requests.get(f"{api_url}/stats/").json()['statement_cache']
+    for artist_id in (1, 2, 3):
+        request_body = {**test_vars.album_request, 'filters': {'ArtistId': artist_id}}
+        response = requests.post(f"{api_url}/query/", json=request_body)
+        assert response.status_code == 200
+        assert response.json()['query'] == test_vars.album_expected_sql_query
+    after = requests.get(f"{api_url}/stats/").json()['statement_cache']
+    assert after['hits'] - before['hits'] >= 2
+    assert after['misses'] - before['misses'] <= 1
+    assert after['size'] <= after['maxsize']
+
+
+def test_query_pages_through_table(api_url: str) -> None:
+    """
+    Test that following next_cursor returns every row of a table exactly once.
+    """
+    request_body = {'table': 'Track', 'fields': ['Name'], 'limit': 1000}
+    track_names = []
+    pages = 0
+    while True:
+        response = requests.post(f"{api_url}/query/", json=request_body)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data['result']) <= 1000
+        assert all(list(row) == ['Name'] for row in data['result'])
+        track_names.extend(row['Name'] for row in data['result'])
+        pages += 1
+        if data['next_cursor'] is None:
+            break
+        request_body['cursor'] = data['next_cursor']
+    assert pages == 4
+    assert len(track_names) == test_vars.track_count
+
+
+def test_query_pages_by_order_column(api_url: str) -> None:
+    """
+    Test keyset pagination on a non-unique ordering column with a cursor holding a datetime.
+    """
+    response = requests.post(f"{api_url}/query/", json=test_vars.invoice_page_request)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['result'] == test_vars.invoice_first_page
+    request_body = {**test_vars.invoice_page_request, 'cursor': data['next_cursor']}
+    response = requests.post(f"{api_url}/query/", json=request_body)
+    assert response.status_code == 200
+    assert response.json()['result'] == test_vars.invoice_second_page
+
+
+@pytest.mark.parametrize('request_body', [
+    {'table': 'Album', 'cursor': 'not-a-cursor'},
+    {'table': 'Album', 'order_by': 'Title', 'cursor': 'eyJrIjpbIkFsYnVtSWQiXSwidiI6WzEwXX0'},
+    {'table': 'Artist', 'order_by': 'Name'},
+])
+def test_query_rejects_invalid_pagination(api_url: str, request_body: dict) -> None:
+    """
+    Test that malformed or mismatched cursors and nullable order_by columns are rejected.
+    """
+    response = requests.post(f"{api_url}/query/", json=request_body)
+    assert response.status_code == 400
+
+
+def test_query_stream_ndjson(api_url: str) -> None:
+    """
+    Test that /query/stream returns every matching row as newline delimited JSON, without paging.
+    """
+    request_body = {'table': 'Track', 'fields': ['TrackId', 'UnitPrice']}
+    response = requests.post(f"{api_url}/query/stream", json=request_body)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    lines = response.text.splitlines()
+    assert len(lines) == test_vars.track_count
+    assert json.loads(lines[0]) == {'TrackId': 1, 'UnitPrice': '0.99'}
+
+
+def test_query_stream_csv(api_url: str) -> None:
+    """
+    Test that /query/stream returns CSV with a header line when asked for text/csv.
+    """
+    request_body = {**test_vars.album_request, 'limit': 1}
+    response = requests.post(f"{api_url}/query/stream", json=request_body, headers={'Accept': 'text/csv'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/csv')
+    assert response.text.splitlines() == ['AlbumId,Title', '1,For Those About To Rock We Salute You']
+
+
+def test_query_stream_unknown_table(api_url: str) -> None:
+    """
+    Test that errors are reported before streaming starts.
+    """
+    response = requests.post(f"{api_url}/query/stream", json={'table': 'NoSuchTable'})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_query_batch(api_url: str, parallel: bool) -> None:
+    """
+    Test that /query/batch returns results and per-item errors in input order.
+    """
+    request_body = {
+        'queries': [
+            test_vars.album_request,
+            {'table': 'NoSuchTable'},
+            test_vars.artist_request,
+        ],
+        'parallel': parallel,
+    }
+    response = requests.post(f"{api_url}/query/batch", json=request_body)
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert len(results) == 3
+    assert results[0]['query'] == test_vars.album_expected_sql_query
+    assert results[0]['result'] == test_vars.album_query_result
+    assert results[1]['error'] and results[1]['result'] is None
+    assert results[2]['result'] == test_vars.artist_query_result
+
+
+def test_query_batch_too_large(api_url: str) -> None:
+    """
+    Test that batches over max_batch_size are rejected.
+    """
+    request_body = {'queries': [test_vars.artist_request] * (DB_INTERFACE.max_batch_size + 1)}
+    response = requests.post(f"{api_url}/query/batch", json=request_body)
+    assert response.status_code == 400
+
+
+def test_query_filter_operators(api_url: str) -> None:
+    """
+    Test that operator filters are accepted by /query/ and unknown operators are rejected.
+    """
+    request_body = {'table': 'Album', 'fields': ['AlbumId'], 'filters': {'ArtistId': {'in': [1, 2]}}}
+    response = requests.post(f"{api_url}/query/", json=request_body)
+    assert response.status_code == 200
+    assert [row['AlbumId'] for row in response.json()['result']] == [1, 2, 3, 4]
+    request_body['filters'] = {'ArtistId': {'like': 1}}
+    response = requests.post(f"{api_url}/query/", json=request_body)
+    assert response.status_code == 400
+
+
+def test_query_advice(api_url: str) -> None:
+    """
+    Test that /query/advice reports whether the index advisor is enabled.
+    """
+    response = requests.get(f"{api_url}/query/advice")
+    assert response.status_code == 200
+    assert response.json()['enabled'] == DB_INTERFACE.index_advisor_enabled
+
+
+def test_query_explain(api_url: str) -> None:
+    """
+    Test that /query/explain returns the query plan and rejects invalid requests.
+    """
+    response = requests.post(f"{api_url}/query/explain", json=test_vars.album_request)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['query'] == test_vars.album_expected_sql_query
+    assert data['plan']
+    response = requests.post(f"{api_url}/query/explain", json={'table': 'NoSuchTable'})
+    assert response.status_code == 400
+
+
+def test_query_phase_stats(api_url: str) -> None:
+    """
+    Test that /stats/ reports the phase timings of /query/ requests.
+    """
+    requests.post(f"{api_url}/query/", json=test_vars.artist_request)
+    queries = requests.get(f"{api_url}/stats/").json()['queries']
+    assert queries['queries'] >= 1
+    assert queries['phases']['serialize']['count'] >= 1
+
+
+def test_metrics(api_url: str) -> None:
+    """
+    Test that /metrics exports latency, row and pool metrics in the Prometheus text format.
+    """
+    requests.post(f"{api_url}/query/", json=test_vars.album_request)
+    response = requests.get(f"{api_url}/metrics")
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    text = response.text
+    assert 'http_request_duration_seconds_bucket{route="/query/",method="POST",status="200",le="+Inf"}' in text
+    assert 'db_rows_returned_total{table="Album"}' in text
+    assert 'http_response_bytes_total{route="/query/",table="Album"}' in text
+    assert 'db_pool_checked_out ' in text
+    assert 'http_requests_in_flight 1' in text
+
+
+def test_admission_stats(api_url: str) -> None:
+    """
+    Test that admitted query requests are counted and their cost released when they finish.
+    """
+    requests.post(f"{api_url}/query/", json=test_vars.album_request)
+    admission = requests.get(f"{api_url}/stats/").json()['admission']
+    assert admission['admitted'] >= 1
+    assert admission['inflight_cost'] == 0
+    assert 'admission_inflight_cost 0' in requests.get(f"{api_url}/metrics").text
+
+
+def test_metrics_ignore_unknown_tables(api_url: str) -> None:
+    """
+    Test that requests for unknown tables do not create table label series.
+    """
+    assert requests.get(f"{api_url}/tables/info/NoSuchTable").status_code == 200
+    assert requests.post(f"{api_url}/query/", json={'table': 'NoSuchTable'}).status_code == 400
+    requests.get(f"{api_url}/tables/info/Genre")
+    text = requests.get(f"{api_url}/metrics").text
+    assert 'NoSuchTable' not in text
+    assert 'http_response_bytes_total{route="/tables/info/{table}",table="Genre"}' in text
+
+
+@pytest.mark.parametrize('spec_version', ['2.0', '2.4'])
+def test_stream_released_on_disconnect(spec_version: str) -> None:
+    """
+    Test that a stream whose client disconnects early releases its admitted cost and pooled connection.
+
+    The requests are sent straight to an in-process application: with ASGI
+    2.0 the client disconnects before the body is sent, with 2.4 sending
+    the first chunk of the body fails.
+    """
+    asgi_app = app.create_app(DB_INTERFACE)
+    payload = json.dumps({'table': 'Track'}).encode()
+
+    async def stream_and_disconnect() -> None:
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': payload, 'more_body': False}
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and spec_version == '2.4':
+                raise OSError('Connection reset by peer')
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0', 'spec_version': spec_version}, 'http_version': '1.1',
+            'method': 'POST', 'scheme': 'http', 'path': '/query/stream', 'raw_path': b'/query/stream',
+            'root_path': '', 'query_string': b'', 'client': ('127.0.0.1', 50000), 'server': ('test', 80),
+            'headers': [(b'host', b'test'), (b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())],
+        }
+        try:
+            await asgi_app(scope, receive, send)
+        except Exception:
+            pass
+
+    try:
+        for _ in range(5):
+            asyncio.run(stream_and_disconnect())
+        assert asgi_app.state.admission.stats()['admitted'] == 5
+        assert asgi_app.state.admission.stats()['inflight_cost'] == 0
+        assert DB_INTERFACE.pool_stats()['checkedout'] == 0
+    finally:
+        asgi_app.state.executor.shutdown()
+
+
+def test_aggregate(api_url: str) -> None:
+    """
+    Test that /aggregate/ returns one row per group and rejects unknown columns.
+    """
+    request_body = {
+        'table': 'Track',
+        'group_by': ['MediaTypeId'],
+        'aggregates': [{'function': 'count', 'alias': 'tracks'}],
+    }
+    response = requests.post(f"{api_url}/aggregate/", json=request_body)
+    assert response.status_code == 200
+    result = response.json()['result']
+    assert len(result) == 5
+    assert sum(row['tracks'] for row in result) == test_vars.track_count
+    request_body['group_by'] = ['NoSuchColumn']
+    response = requests.post(f"{api_url}/aggregate/", json=request_body)
+    assert response.status_code == 400
+
+
+def test_query_expand(api_url: str) -> None:
+    """
+    Test that /query/ nests expanded relations and that /query/stream rejects them.
+    """
+    request_body = {'table': 'Album', 'fields': ['Title'], 'filters': {'AlbumId': 1}, 'expand': ['Artist']}
+    response = requests.post(f"{api_url}/query/", json=request_body)
+    assert response.status_code == 200
+    assert response.json()['result'] == [
+        {'Title': 'For Those About To Rock We Salute You', 'Artist': {'ArtistId': 1, 'Name': 'AC/DC'}}
+    ]
+    response = requests.post(f"{api_url}/query/stream", json=request_body)
+    assert response.status_code == 400
+
+
+def test_query_columnar(api_url: str) -> None:
+    """
+    Test that /query/ negotiates column-oriented JSON and Arrow through the Accept header.
+    """
+    request_body = {'table': 'Customer', 'fields': ['CustomerId', 'Country'], 'limit': 2}
+    response = requests.post(
+        f"{api_url}/query/", json=request_body, headers={'Accept': 'application/vnd.columnar+json'}
+    )
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/vnd.columnar+json'
+    body = response.json()
+    assert body['columns'] == ['CustomerId', 'Country']
+    assert body['types'] == {'CustomerId': 'INTEGER', 'Country': 'NVARCHAR(40)'}
+    assert body['data'] == {'CustomerId': [1, 2], 'Country': ['Brazil', 'Germany']}
+    assert body['next_cursor']
+
+    response = requests.post(
+        f"{api_url}/query/", json=request_body, headers={'Accept': 'application/vnd.apache.arrow.stream'}
+    )
+    if app.columnar.pyarrow is None:
+        assert response.status_code == 406
+    else:
+        assert response.status_code == 200
+        assert response.headers['x-next-cursor'] == body['next_cursor']
+
+    request_body['expand'] = ['SupportRep']
+    response = requests.post(
+        f"{api_url}/query/", json=request_body, headers={'Accept': 'application/vnd.columnar+json'}
+    )
+    assert response.status_code == 400
+
+
+def test_conditional_requests(api_url: str) -> None:
+    """
+    Test that GET /tables/ and /query/ send ETags and answer a matching If-None-Match with 304.
+    """
+    response = requests.get(f"{api_url}/tables/")
+    etag = response.headers['etag']
+    assert response.headers['cache-control'] == 'no-cache'
+    response = requests.get(f"{api_url}/tables/", headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+
+    response = requests.post(f"{api_url}/query/", json=test_vars.album_request)
+    etag = response.headers['etag']
+    assert response.headers['vary'] == 'Accept'
+    response = requests.post(f"{api_url}/query/", json=test_vars.album_request, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['etag'] == etag
+    response = requests.post(
+        f"{api_url}/query/", json=dict(test_vars.album_request, limit=1), headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 200
+    response = requests.post(
+        f"{api_url}/query/",
+        json=test_vars.album_request,
+        headers={'If-None-Match': etag, 'Accept': 'application/vnd.columnar+json'},
+    )
+    assert response.status_code == 200
+
+
+def test_views(api_url: str) -> None:
+    """
+    Test that /views/ lists the configured hot views and unknown views are not found.
+    """
+    response = requests.get(f"{api_url}/views/")
+    assert response.status_code == 200
+    assert response.json() == {}
+    response = requests.get(f"{api_url}/views/no_such_view")
+    assert response.status_code == 404
+
+
+def test_export(api_url: str) -> None:
+    """
+    Test that /exports/ queues a job whose CSV file can be downloaded once it is done.
+    """
+    request_body = {'table': 'Genre', 'fields': ['GenreId', 'Name']}
+    response = requests.post(f"{api_url}/exports/", json=request_body)
+    assert response.status_code == 202
+    job = response.json()
+    assert response.headers['location'] == f"/exports/{job['id']}"
+    deadline = time.time() + 60
+    while job['status'] in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.2)
+        job = requests.get(f"{api_url}/exports/{job['id']}").json()
+    assert job['status'] == 'done'
+    assert job['rows'] == 25
+
+    response = requests.get(f"{api_url}/exports/{job['id']}/file")
+    assert response.status_code == 200
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert lines[:2] == ['GenreId,Name', '1,Rock']
+    assert requests.delete(f"{api_url}/exports/{job['id']}").status_code == 204
+    assert requests.get(f"{api_url}/exports/{job['id']}").status_code == 404
+    response = requests.post(f"{api_url}/exports/", json={'table': 'NoSuchTable'})
+    assert response.status_code == 400
@@ -0,0 +1,50 @@
+"""
+Test module for the benchmark helpers in benchmarks/
+
+These run the synthetic database generator and the in-process ASGI load
+test at a tiny scale, so the benchmarks keep working as the app changes.
+"""
+import asyncio
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'benchmarks'))
+
+import bench_load
+import synthetic_db
+from bench_common import compare, make_interface
+
+
+def test_synthetic_database_and_load(tmp_path: Path) -> None:
+    """
+    Test that a synthetic database has the expected rows and can be queried through the ASGI app.
+    """
+    db_path = tmp_path / 'bench.db'
+    counts = synthetic_db.generate(db_path, invoice_lines=400, seed=1)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT count(*) FROM InvoiceLine').fetchone()[0] == 400
+        assert conn.execute('SELECT count(*) FROM Track').fetchone()[0] == counts['Track']
+
+    interface = make_interface(db_path)
+    app = bench_load.create_app(interface)
+    try:
+        status, body = asyncio.run(
+            bench_load.asgi_request(app, 'POST', '/query/', {'table': 'InvoiceLine', 'limit': 5})
+        )
+        assert status == 200
+        assert len(json.loads(body)['result']) == 5
+        stats = asyncio.run(bench_load.run_load(app, 'GET', '/tables/', None, concurrency=4, total=20))
+        assert stats['count'] == 20 and stats['errors'] == 0
+    finally:
+        app.state.executor.shutdown()
+
+
+def test_compare_reports_regressions() -> None:
+    """
+    Test that only results slower than the baseline by more than the tolerance are reported.
+    """
+    baseline = [{'name': 'a', 'p50_ms': 1.0}, {'name': 'b', 'p50_ms': 1.0}]
+    results = [{'name': 'a', 'p50_ms': 1.05}, {'name': 'b', 'p50_ms': 1.5}, {'name': 'c', 'p50_ms': 9.0}]
+    assert [row['name'] for row in compare(results, baseline, tolerance=0.1)] == ['b']
@@ -0,0 +1,87 @@
+"""
+Test module for the columnar.py encodings of /query/ results
+"""
+import json
+import pytest
+import columnar
+import models
+from db_interface import DBInterface
+
+
+DB_INTERFACE = DBInterface()
+
+
+def query_columns(**request_body):
+    request = models.QueryRequest(**request_body)
+    result = DB_INTERFACE.query(DB_INTERFACE.metadata, request)
+    return result, DB_INTERFACE.result_columns(DB_INTERFACE.metadata, request)
+
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, 'json'),
+    ('application/json', 'json'),
+    ('*/*', 'json'),
+    (columnar.COLUMNAR_JSON_MEDIA_TYPE, 'columnar'),
+    (f'{columnar.ARROW_STREAM_MEDIA_TYPE}, application/json;q=0.5', 'arrow'),
+])
+def test_negotiate(accept, expected) -> None:
+    """
+    Test that the Accept header selects the response format.
+    """
+    assert columnar.negotiate(accept) == expected
+
+
+def test_result_columns_use_reflected_types() -> None:
+    """
+    Test that result columns follow the requested fields with their declared types.
+    """
+    _, columns = query_columns(table='Invoice', fields=['Total', 'InvoiceDate'], limit=1)
+    assert [(name, declared) for name, _, declared in columns] == [('Total', 'NUMERIC(10, 2)'), ('InvoiceDate', 'DATETIME')]
+
+
+def test_columnar_json() -> None:
+    """
+    Test that columnar JSON holds one array per column in row order and the next cursor.
+    """
+    result, columns = query_columns(table='Invoice', limit=3)
+    body = json.loads(columnar.dumps_columnar_json(result, columns))
+    assert body['columns'] == [name for name, _, _ in columns]
+    assert body['types']['CustomerId'] == 'INTEGER'
+    assert body['data']['InvoiceId'] == [1, 2, 3]
+    assert body['data']['Total'] == [str(row['Total']) for row in result['result']]
+    assert body['next_cursor'] == result['next_cursor']
+    assert body['query'] == result['query']
+
+
+def test_columnar_json_is_smaller_for_wide_tables() -> None:
+    """
+    Test that dropping the repeated column names shrinks the payload of a wide table.
+    """
+    result, columns = query_columns(table='Customer', limit=50)
+    row_json = json.dumps(result, default=str).encode()
+    assert len(columnar.dumps_columnar_json(result, columns)) < 0.8 * len(row_json)
+
+
+def test_arrow_stream() -> None:
+    """
+    Test that the Arrow stream round trips with the reflected column types.
+    """
+    pyarrow = pytest.importorskip('pyarrow')
+    result, columns = query_columns(table='Invoice', limit=3)
+    table = pyarrow.ipc.open_stream(columnar.dumps_arrow(result, columns)).read_all()
+    assert table.column_names == [name for name, _, _ in columns]
+    assert table.schema.field('InvoiceId').type == pyarrow.int64()
+    assert table.schema.field('Total').type == pyarrow.decimal128(10, 2)
+    assert table.schema.field('InvoiceDate').type == pyarrow.timestamp('us')
+    assert table.column('InvoiceId').to_pylist() == [1, 2, 3]
+    assert table.schema.metadata[b'next_cursor'].decode() == result['next_cursor']
+
+
+def test_arrow_requires_pyarrow(monkeypatch) -> None:
+    """
+    Test that encoding Arrow without pyarrow raises a clear error.
+    """
+    monkeypatch.setattr(columnar, 'pyarrow', None)
+    result, columns = query_columns(table='Album', limit=1)
+    with pytest.raises(RuntimeError, match='pyarrow'):
+        columnar.dumps_arrow(result, columns)
@@ -0,0 +1,64 @@
+"""
+Test module for the databases.py schema fingerprints and stream merging
+"""
+import configparser
+import sqlite3
+import threading
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine
+from databases import merge_streams, pool_options, reflect_shared, schema_fingerprint
+
+
+def make_database(path: Path, ddl: str):
+    with sqlite3.connect(path) as conn:
+        conn.execute(ddl)
+    return create_engine(f'sqlite:///{path}')
+
+
+def test_reflect_shared_per_schema(tmp_path: Path) -> None:
+    """
+    Test that databases with the same schema share one reflected metadata.
+    """
+    first = make_database(tmp_path / 'a.db', 'CREATE TABLE Sale (SaleId INTEGER PRIMARY KEY, Total NUMERIC)')
+    second = make_database(tmp_path / 'b.db', 'CREATE TABLE Sale (SaleId INTEGER PRIMARY KEY, Total NUMERIC)')
+    other = make_database(tmp_path / 'c.db', 'CREATE TABLE Sale (SaleId INTEGER PRIMARY KEY)')
+    assert schema_fingerprint(first) == schema_fingerprint(second) != schema_fingerprint(other)
+
+    schemas = {}
+    metadata = reflect_shared(first, schemas)
+    assert reflect_shared(second, schemas) is metadata
+    assert reflect_shared(other, schemas) is not metadata
+    assert metadata.info['engine'] is first
+    assert list(metadata.tables) == ['Sale']
+
+
+def test_merge_streams_limit_and_errors() -> None:
+    """
+    Test that merged chunks stop at the limit, stop the producers and pass on their errors.
+    """
+    stopped = threading.Event()
+
+    def endless(emit) -> None:
+        while emit([1, 2]):
+            pass
+        stopped.set()
+
+    def failing(emit) -> None:
+        raise RuntimeError('shard is down')
+
+    assert sum(len(chunk) for chunk in merge_streams([endless, endless], max_workers=2, limit=5)) == 5
+    assert stopped.wait(5)
+    with pytest.raises(RuntimeError, match='shard is down'):
+        list(merge_streams([failing], max_workers=1))
+    chunks = list(merge_streams([lambda emit: emit(['a']), lambda emit: emit(['b'])], max_workers=1))
+    assert sorted(chunks) == [['a'], ['b']]
+
+
+def test_pool_options() -> None:
+    """
+    Test that only the pool options present in a section are returned.
+    """
+    config = configparser.ConfigParser()
+    config.read_string('[database:archive]\nconnection_string = sqlite://\npool_size = 2\npool_timeout = 5\n')
+    assert pool_options(config['database:archive']) == {'pool_size': 2, 'pool_timeout': 5.0}
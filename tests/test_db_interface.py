@@ -0,0 +1,502 @@
+"""
+Test module for the db_interface.py DBInterface
+
+These tests run DBInterface directly against a copy of the chinook database,
+using a configuration file written to a temporary directory.
+"""
+import configparser
+import json
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+import pytest
+from sqlalchemy.exc import OperationalError
+import db_interface
+import models
+from db_interface import DBInterface
+from schema_catalog import SchemaCatalog
+
+
+REPO_DIRECTORY = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def db_copy(tmp_path: Path) -> Path:
+    """
+    Copy of the chinook database that tests may modify.
+    """
+    db_path = tmp_path / 'chinook.db'
+    shutil.copy(REPO_DIRECTORY / 'db' / 'chinook.db', db_path)
+    return db_path
+
+
+@pytest.fixture
+def make_interface(tmp_path: Path, db_copy: Path) -> Callable[..., DBInterface]:
+    """
+    Factory for a DBInterface on the database copy. Keyword arguments
+    override options as section__option=value, positional arguments name
+    sections left out of the configuration.
+    """
+    def factory(*removed_sections, **overrides) -> DBInterface:
+        config = configparser.ConfigParser()
+        config.read(REPO_DIRECTORY / 'config.ini')
+        for section in removed_sections:
+            config.remove_section(section)
+        config['database']['db_directory'] = str(db_copy.parent)
+        config['database']['connection_string'] = f'sqlite:///{db_copy}'
+        for key, value in overrides.items():
+            section, option = key.split('__')
+            if not config.has_section(section):
+                config.add_section(section)
+            config[section][option] = str(value)
+        config_file = tmp_path / 'config.ini'
+        with open(config_file, 'w') as file:
+            config.write(file)
+        return DBInterface(config_file)
+    return factory
+
+
+@pytest.mark.parametrize('section, option, default', [
+    ('cache', 'statement_cache_size', 256),
+    ('exports', 'export_max_pending', 16),
+    ('admission', 'admission_rate', 100),
+])
+def test_config_without_section(make_interface: Callable, section: str, option: str, default) -> None:
+    """
+    Test that a config file written before a section existed falls back to its defaults.
+    """
+    interface = make_interface(section)
+    assert getattr(interface, option) == default
+
+
+def test_schema_catalog_detects_schema_change(make_interface: Callable, db_copy: Path) -> None:
+    """
+    Test that a schema change is picked up through PRAGMA schema_version.
+    """
+    interface = make_interface(cache__version_check_interval=0)
+    assert 'Review' not in interface.get_tables()['table_names']
+    interface.query(interface.metadata, models.QueryRequest(table='Album', filters={'ArtistId': 1}))
+    assert len(interface.statement_cache) == 1
+
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute('CREATE TABLE Review (ReviewId INTEGER PRIMARY KEY, Body NVARCHAR(200))')
+
+    assert 'Review' in interface.get_tables()['table_names']
+    assert interface.table_info('Review') == {'Review': {'ReviewId': 'INTEGER', 'Body': 'NVARCHAR(200)'}}
+    assert len(interface.statement_cache) == 0
+    assert 'Review' in interface.metadata.tables
+
+
+def test_schema_catalog_from_reflected_types(make_interface: Callable, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that for databases other than SQLite the catalog uses the reflected column types.
+    """
+    interface = make_interface()
+    monkeypatch.setattr(interface.engine.dialect, 'name', 'postgresql')
+    catalog = SchemaCatalog(interface.engine, interface.metadata).build()
+    assert catalog.table_names == interface.get_tables()['table_names']
+    assert catalog.columns['Invoice']['Total'] == 'NUMERIC(10, 2)'
+    assert catalog.table_body('Artist') == b'{"Artist":{"ArtistId":"INTEGER","Name":"NVARCHAR(120)"}}'
+
+
+def test_result_cache_invalidated_by_data_version(make_interface: Callable, db_copy: Path) -> None:
+    """
+    Test that a write by another connection invalidates cached query results.
+    """
+    interface = make_interface(cache__version_check_interval=0)
+    request = models.QueryRequest(table='Artist', filters={'ArtistId': 1})
+    assert interface.query(interface.metadata, request)['result'][0]['Name'] == 'AC/DC'
+    assert interface.query(interface.metadata, request)['result'][0]['Name'] == 'AC/DC'
+    assert interface.result_cache.hits == 1
+
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute("UPDATE Artist SET Name = 'ACDC' WHERE ArtistId = 1")
+
+    assert interface.query(interface.metadata, request)['result'][0]['Name'] == 'ACDC'
+    assert interface.result_cache.invalidations == 1
+
+
+def test_read_profile(make_interface: Callable) -> None:
+    """
+    Test that connections are opened read-only with the configured PRAGMAs and pool size.
+    """
+    interface = make_interface(database__max_workers=3, database__pool_size=0)
+    assert interface.engine.url.query['mode'] == 'ro'
+    assert interface.engine.pool.size() == 3
+    with interface.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA query_only').scalar() == 1
+        assert conn.exec_driver_sql('PRAGMA mmap_size').scalar() == int(interface.sqlite_pragmas['mmap_size'])
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("UPDATE Artist SET Name = 'ACDC' WHERE ArtistId = 1")
+    assert interface.pool_stats()['checkouts'] == 1
+
+
+def test_journal_mode_set_on_read_only_database(make_interface: Callable, db_copy: Path) -> None:
+    """
+    Test that the journal mode is switched once even though pooled connections are read-only.
+    """
+    interface = make_interface(database__journal_mode='WAL')
+    with interface.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+    assert interface.get_tables()['table_names'][0] == 'Album'
+
+
+def test_lazy_reflection(make_interface: Callable) -> None:
+    """
+    Test that lazy mode reflects only the tables that are used.
+    """
+    interface = make_interface(database__reflection='lazy')
+    assert len(interface.metadata.tables) == 0
+    assert 'Track' in interface.get_tables()['table_names']
+    assert interface.table_info('Genre') == {'Genre': {'GenreId': 'INTEGER', 'Name': 'NVARCHAR(120)'}}
+    result = interface.query(interface.metadata, models.QueryRequest(table='Album', filters={'ArtistId': 1}))
+    assert len(result['result']) == 2
+    assert set(interface.metadata.tables) == {'Album', 'Artist'}
+
+
+def test_schema_snapshot_reused_until_schema_changes(make_interface: Callable, tmp_path: Path, db_copy: Path) -> None:
+    """
+    Test that the schema snapshot replaces reflection while schema_version is unchanged.
+    """
+    snapshot_path = tmp_path / 'schema_snapshot.pickle'
+    interface = make_interface(database__schema_snapshot=snapshot_path)
+    assert interface.snapshot is None
+    assert snapshot_path.is_file()
+
+    interface = make_interface(database__schema_snapshot=snapshot_path)
+    assert interface.snapshot is not None
+    assert interface.table_info('Artist') == {'Artist': {'ArtistId': 'INTEGER', 'Name': 'NVARCHAR(120)'}}
+    result = interface.query(interface.metadata, models.QueryRequest(table='Artist', filters={'ArtistId': 1}))
+    assert result['result'] == [{'ArtistId': 1, 'Name': 'AC/DC'}]
+
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute('CREATE TABLE Review (ReviewId INTEGER PRIMARY KEY)')
+    interface = make_interface(database__schema_snapshot=snapshot_path)
+    assert interface.snapshot is None
+    assert 'Review' in interface.get_tables()['table_names']
+
+
+def test_index_advisor_suggests_index_for_full_scan(make_interface: Callable) -> None:
+    """
+    Test that the index advisor reports a range filter on an unindexed column with a suggested index.
+    """
+    interface = make_interface(api__index_advisor='true')
+    request = models.QueryRequest(table='Track', filters={'Milliseconds': {'gt': 300000}})
+    interface.query(interface.metadata, request)
+    interface.query(interface.metadata, models.QueryRequest(table='Track', filters={'Milliseconds': {'gt': 1}}))
+    interface.query(interface.metadata, models.QueryRequest(table='Album', filters={'ArtistId': 1}))
+
+    problems = interface.index_advisor.advice(problems_only=True)
+    assert len(problems) == 1
+    assert problems[0]['table'] == 'Track'
+    assert problems[0]['seen'] == 2
+    assert problems[0]['full_scan']
+    assert problems[0]['suggested_index'] == 'CREATE INDEX "ix_Track_Milliseconds" ON "Track" ("Milliseconds")'
+    assert len(interface.index_advisor.advice()) == 2
+
+
+def test_slow_query_log(make_interface: Callable, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that query phases are recorded and queries above slow_query_seconds are logged.
+    """
+    interface = make_interface(logging__slow_query_seconds=0.000001)
+    warnings = []
+    monkeypatch.setattr(interface.logger, 'warning', warnings.append)
+    request = models.QueryRequest(table='Track', filters={'GenreId': 1})
+    interface.query(interface.metadata, request)
+    assert len(warnings) == 1 and warnings[0].startswith('Slow query on table Track')
+    stats = interface.query_timings.stats()
+    assert stats['queries'] == stats['slow_queries'] == 1
+    assert {'checkout', 'build', 'execute', 'fetch', 'cache', 'total'} <= set(stats['phases'])
+
+    interface = make_interface(logging__slow_query_seconds=0)
+    interface.query(interface.metadata, request)
+    assert interface.query_timings.stats()['slow_queries'] == 0
+
+
+def test_explain_query(make_interface: Callable) -> None:
+    """
+    Test that explain_query returns the plan of a query without executing it.
+    """
+    interface = make_interface()
+    result = interface.explain_query(interface.metadata, models.QueryRequest(table='Album', filters={'ArtistId': 1}))
+    assert result['query'].startswith('SELECT "Album"."AlbumId"')
+    assert any('USING INDEX IFK_AlbumArtistId' in detail for detail in result['plan'])
+    assert interface.query_timings.stats()['queries'] == 0
+
+
+def test_async_logging_with_sampling(make_interface: Callable) -> None:
+    """
+    Test that async logging queues records and that sampled out query log lines are counted.
+    """
+    interface = make_interface(logging__async_logging='true', logging__log_sample_rates='query:0')
+    try:
+        interface.query(interface.metadata, models.QueryRequest(table='Artist', filters={'ArtistId': 1}))
+        stats = interface.logging_stats()
+        assert stats['async']
+        assert stats['sampled_out'] == 1
+        assert stats['queued'] > 0 and stats['dropped'] == 0
+    finally:
+        interface.close_logging()
+    assert interface.logger.handlers == interface.log_pipeline.handlers
+
+
+def test_expand_row_caps(make_interface: Callable) -> None:
+    """
+    Test that nested rows are capped per parent and that too many joined rows are rejected.
+    """
+    interface = make_interface(api__max_expand_children=2, api__max_expand_rows=20)
+    request = models.QueryRequest(table='Album', fields=['AlbumId'], expand=['Track'], limit=2)
+    result = interface.query(interface.metadata, request)
+    assert [len(album['Track']) for album in result['result']] == [2, 1]
+    request = models.QueryRequest(table='Album', fields=['AlbumId'], expand=['Track'], limit=10)
+    assert 'joined more than 20 rows' in interface.query(interface.metadata, request)['error']
+
+
+def test_pages_by_datetime_with_ties(make_interface: Callable) -> None:
+    """
+    Test that paging by a DATETIME column with repeated values returns every row exactly once.
+    """
+    interface = make_interface()
+    request = models.QueryRequest(table='Invoice', fields=['InvoiceId'], order_by='InvoiceDate', limit=5)
+    invoice_ids = []
+    while True:
+        result = interface.query(interface.metadata, request)
+        invoice_ids.extend(row['InvoiceId'] for row in result['result'])
+        if result['next_cursor'] is None:
+            break
+        request = request.model_copy(update={'cursor': result['next_cursor']})
+    assert sorted(invoice_ids) == list(range(1, 413))
+
+
+def test_etag_follows_database_versions(make_interface: Callable, db_copy: Path) -> None:
+    """
+    Test that data ETags change after a write and schema ETags only after a schema change.
+    """
+    interface = make_interface(cache__version_check_interval=0)
+    query_etag = interface.etag('query', {'table': 'Artist'})
+    tables_etag = interface.etag('tables', data=False)
+    assert query_etag == interface.etag('query', {'table': 'Artist'})
+    assert query_etag != interface.etag('query', {'table': 'Album'})
+
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute("UPDATE Artist SET Name = 'ACDC' WHERE ArtistId = 1")
+    assert interface.etag('query', {'table': 'Artist'}) != query_etag
+    assert interface.etag('tables', data=False) == tables_etag
+
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute('CREATE TABLE Review (ReviewId INTEGER PRIMARY KEY)')
+    assert interface.etag('tables', data=False) != tables_etag
+    assert make_interface(api__etags='false').etag('tables', data=False) is None
+
+
+@pytest.fixture
+def shard_files(tmp_path: Path, db_copy: Path) -> Path:
+    """
+    Two copies of the chinook database in a shards directory, with one artist renamed in each.
+    """
+    directory = tmp_path / 'shards'
+    directory.mkdir()
+    for name in ('sales_a', 'sales_b'):
+        shutil.copy(db_copy, directory / f'{name}.db')
+        with sqlite3.connect(directory / f'{name}.db') as conn:
+            conn.execute("UPDATE Artist SET Name = ? WHERE ArtistId = 1", (name,))
+    return directory
+
+
+def test_query_routed_to_named_database(make_interface: Callable, shard_files: Path) -> None:
+    """
+    Test that the database field routes queries and aggregations, with separate cached results.
+    """
+    interface = make_interface(
+        cache__version_check_interval=0,
+        **{'database:archive__connection_string': f'sqlite:///{shard_files / "sales_a.db"}'},
+    )
+    request = models.QueryRequest(table='Artist', filters={'ArtistId': 1})
+    assert interface.query(interface.metadata, request)['result'][0]['Name'] == 'AC/DC'
+    routed = request.model_copy(update={'database': 'archive'})
+    assert interface.query(interface.metadata, routed)['result'][0]['Name'] == 'sales_a'
+    assert interface.query(interface.metadata, request.model_copy(update={'database': 'chinook'}))['result'][0]['Name'] == 'AC/DC'
+    assert interface.etag('query', {}, database='archive') != interface.etag('query', {})
+    # the databases are at different data versions, which must not invalidate each other's results
+    with sqlite3.connect(shard_files / 'sales_a.db') as conn:
+        conn.execute("UPDATE Genre SET Name = 'Rock and Roll' WHERE GenreId = 1")
+    interface.query(interface.metadata, routed)
+    hits = interface.result_cache.hits
+    for _ in range(3):
+        interface.query(interface.metadata, request)
+        interface.query(interface.metadata, routed)
+    assert interface.result_cache.hits == hits + 6
+    assert interface.result_cache.invalidations == 1
+
+    aggregate = models.AggregateRequest(table='Artist', aggregates=[{'function': 'max', 'column': 'Name'}], database='archive')
+    assert interface.aggregate(interface.metadata, aggregate)['result'] == [{'max_Name': 'sales_a'}]
+    unknown = request.model_copy(update={'database': 'nowhere'})
+    assert interface.query(interface.metadata, unknown)['error'] == 'Unknown database "nowhere"'
+
+    batch = models.BatchQueryRequest(queries=[request, routed])
+    assert 'single database' in interface.query_batch(interface.metadata, batch)['error']
+    results = interface.query_batch(interface.metadata, batch.model_copy(update={'parallel': True}))['results']
+    assert [item['result'][0]['Name'] for item in results] == ['AC/DC', 'sales_a']
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_batch_reports_unknown_database_per_item(make_interface: Callable, parallel: bool) -> None:
+    """
+    Test that a batch item routed to an unknown database fails alone.
+    """
+    interface = make_interface()
+    request = models.BatchQueryRequest(parallel=parallel, queries=[
+        models.QueryRequest(table='Artist', filters={'ArtistId': 1}),
+        models.QueryRequest(table='Artist', database='missing'),
+        models.QueryRequest(table='Album', filters={'AlbumId': 1}),
+    ])
+    results = interface.query_batch(interface.metadata, request)['results']
+    assert results[0]['result'][0]['Name'] == 'AC/DC'
+    assert results[1]['error'] == 'Unknown database "missing"'
+    assert results[2]['result'][0]['AlbumId'] == 1
+
+
+def test_parallel_batches_share_one_pool(make_interface: Callable, monkeypatch) -> None:
+    """
+    Test that concurrent parallel batches start a single batch pool, which is shut down with the interface.
+    """
+    pools = []
+
+    class SlowPool(ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            time.sleep(0.05)
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+
+    monkeypatch.setattr(db_interface, 'ThreadPoolExecutor', SlowPool)
+    interface = make_interface()
+    request = models.BatchQueryRequest(parallel=True, queries=[models.QueryRequest(table='Genre', limit=1)] * 2)
+    barrier = threading.Barrier(4)
+
+    def run_batch() -> None:
+        barrier.wait()
+        interface.query_batch(interface.metadata, request)
+
+    threads = [threading.Thread(target=run_batch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pools) == 1
+    interface.close_batch_pool()
+    assert pools[0]._shutdown
+
+
+def test_shard_group_reflected_once_and_streamed(make_interface: Callable, shard_files: Path) -> None:
+    """
+    Test that shards with the same schema share metadata and that a stream merges all of them.
+    """
+    interface = make_interface(**{'shards:sales__files': f'{shard_files}/sales_*.db'})
+    assert interface.shard_groups == {'sales': ['sales/sales_a', 'sales/sales_b']}
+    assert interface.databases['sales/sales_a'].metadata is interface.databases['sales/sales_b'].metadata
+
+    request = models.QueryRequest(table='Artist', fields=['Name'], filters={'ArtistId': {'in': [1, 2]}}, database='sales')
+    result = interface.stream_query(interface.metadata, request)
+    assert result['keys'] == ['Name', '_shard']
+    rows = sorted(row for chunk in result['chunks'] for row in chunk)
+    assert rows == [
+        ('Accept', 'sales/sales_a'), ('Accept', 'sales/sales_b'),
+        ('sales_a', 'sales/sales_a'), ('sales_b', 'sales/sales_b'),
+    ]
+    limited = interface.stream_query(interface.metadata, request.model_copy(update={'limit': 3}))
+    assert sum(len(chunk) for chunk in limited['chunks']) == 3
+    assert 'only be queried with /query/stream' in interface.query(interface.metadata, request)['error']
+
+
+def test_estimate_cost(make_interface: Callable, db_copy: Path, shard_files: Path) -> None:
+    """
+    Test that admission costs grow with the rows examined, the table size and the shards queried.
+    """
+    interface = make_interface(
+        cache__version_check_interval=0, **{'shards:sales__files': f'{shard_files}/sales_*.db'}
+    )
+    lookup = models.QueryRequest(table='Track', filters={'TrackId': 1})
+    scan = models.QueryRequest(table='Track', filters={'Composer': 'AC/DC'})
+    assert interface.estimate_cost(interface.metadata, lookup) == 1.001
+    assert interface.estimate_cost(interface.metadata, scan) == 1 + 3503 / 1000
+    sharded = scan.model_copy(update={'database': 'sales'})
+    assert interface.estimate_cost(interface.metadata, sharded, paginate=False) == 1 + 2 * 3503 / 1000
+    aggregate = models.AggregateRequest(table='Track', aggregates=[{'function': 'count'}], limit=1)
+    assert interface.estimate_cost(interface.metadata, aggregate, paginate=False) == 1 + 3503 / 1000
+    assert interface.estimate_cost(interface.metadata, models.QueryRequest(table='Missing')) == 1
+    batch = models.BatchQueryRequest(queries=[lookup, scan])
+    assert interface.estimate_cost(interface.metadata, batch) == 1.001 + 1 + 3503 / 1000
+
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute("INSERT INTO Track (Name, MediaTypeId, Milliseconds, UnitPrice) VALUES ('New', 1, 1, 0.99)")
+    assert interface.estimate_cost(interface.metadata, scan) == 1 + 3504 / 1000
+    interface.close_databases()
+
+
+def test_hot_view_served_and_refreshed(make_interface: Callable, db_copy: Path) -> None:
+    """
+    Test that a hot view is computed at startup, answers equal requests and follows writes.
+    """
+    view_request = {
+        'table': 'Invoice',
+        'group_by': ['CustomerId'],
+        'aggregates': [{'function': 'count', 'alias': 'invoices'}],
+        'filters': {'CustomerId': 1},
+    }
+    interface = make_interface(**{
+        'cache__version_check_interval': 0,
+        'cache__view_refresh_interval': 0,
+        'view:customer_invoices__type': 'aggregate',
+        'view:customer_invoices__request': json.dumps(view_request),
+    })
+    view = interface.hot_views.get('customer_invoices')
+    assert view.snapshot.result['result'] == [{'CustomerId': 1, 'invoices': 7}]
+    request = models.AggregateRequest(**view_request)
+    assert interface.aggregate(interface.metadata, request) is view.snapshot.result
+    assert interface.result_cache.misses == 0
+
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute('DELETE FROM InvoiceLine WHERE InvoiceId = 98')
+        conn.execute('DELETE FROM Invoice WHERE InvoiceId = 98')
+    assert interface.hot_views.refresh_all() == 1
+    assert interface.aggregate(interface.metadata, request)['result'] == [{'CustomerId': 1, 'invoices': 6}]
+    assert interface.hot_views.refresh_all() == 0
+
+
+@pytest.mark.parametrize('etags', [True, False])
+def test_hot_view_etags_follow_setting(make_interface: Callable, etags: bool) -> None:
+    """
+    Test that view snapshots only have an ETag when ETags are enabled.
+    """
+    interface = make_interface(**{
+        'api__etags': str(etags).lower(),
+        'view:genres__request': json.dumps({'table': 'Genre'}),
+    })
+    assert (interface.hot_views.get('genres').snapshot.etag is not None) is etags
+    interface.close_views()
+
+
+def test_interface_without_views(make_interface: Callable, tmp_path: Path) -> None:
+    """
+    Test that an interface built without views, as in the export workers, precomputes none.
+    """
+    view_request = {'table': 'Genre', 'filters': {'GenreId': 1}}
+    make_interface(**{'view:rock__request': json.dumps(view_request)})
+    interface = DBInterface(tmp_path / 'config.ini', views=False)
+    assert len(interface.hot_views) == 0
+    result = interface.query(interface.metadata, models.QueryRequest(**view_request))
+    assert result['result'] == [{'GenreId': 1, 'Name': 'Rock'}]
+    interface.close_views()
+
+
+def test_invalid_hot_view(make_interface: Callable) -> None:
+    """
+    Test that a view with an invalid request fails at startup.
+    """
+    with pytest.raises(ValueError, match='Invalid request of view "broken"'):
+        make_interface(**{'view:broken__request': '{"fields": ["Name"]}'})
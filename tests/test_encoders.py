@@ -0,0 +1,44 @@
+"""
+Test module for the encoders.py response encoders
+"""
+import json
+import pytest
+import encoders
+import models
+from db_interface import DBInterface
+
+
+DB_INTERFACE = DBInterface()
+
+
+@pytest.mark.parametrize('request_body', [
+    {'table': 'Invoice', 'limit': 50},
+    {'table': 'Track', 'fields': ['TrackId', 'Name', 'Composer', 'UnitPrice']},
+    {'table': 'Employee'},
+])
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_dumps_json_matches_response_model(
+    monkeypatch: pytest.MonkeyPatch, request_body: dict, use_orjson: bool
+) -> None:
+    """
+    Test that the fast encoder produces the same bytes as the Pydantic response model.
+    """
+    if use_orjson and encoders.orjson is None:
+        pytest.skip('orjson is not installed')
+    if not use_orjson:
+        monkeypatch.setattr(encoders, 'orjson', None)
+    result = DB_INTERFACE.query(DB_INTERFACE.metadata, models.QueryRequest(**request_body))
+    expected = models.DBQueryResponse(**result).model_dump_json()
+    assert encoders.dumps_json(result).decode('utf-8') == expected
+
+
+def test_iter_ndjson_encodes_each_row() -> None:
+    """
+    Test that NDJSON output holds one JSON object per row, encoded like the response model.
+    """
+    result = DB_INTERFACE.query(DB_INTERFACE.metadata, models.QueryRequest(table='Invoice', limit=3))
+    keys = list(result['result'][0])
+    rows = [tuple(row.values()) for row in result['result']]
+    lines = b''.join(encoders.iter_ndjson(keys, [rows[:2], rows[2:]])).decode('utf-8').splitlines()
+    expected = json.loads(models.DBQueryResponse(**result).model_dump_json())['result']
+    assert [json.loads(line) for line in lines] == expected
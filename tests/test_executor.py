@@ -0,0 +1,85 @@
+"""
+Test module for the executor.py DBExecutor
+
+These are unit tests that run the executor directly, without a database or uvicorn.
+"""
+import asyncio
+import threading
+import pytest
+from executor import DBExecutor, ExecutorSaturated, ExecutorTimeout
+
+
+@pytest.mark.parametrize('mode', ['inline', 'threadpool'])
+def test_run_returns_result(mode: str) -> None:
+    """
+    Test that both execution modes return the result of the wrapped call.
+    """
+    executor = DBExecutor(mode=mode, max_workers=2, max_queue=0)
+    try:
+        assert asyncio.run(executor.run(sum, [1, 2, 3])) == 6
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+def test_run_in_threadpool_does_not_block_event_loop() -> None:
+    """
+    Test that a blocking call in threadpool mode leaves the event loop free.
+    """
+    executor = DBExecutor(mode='threadpool', max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        task = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        release.set()
+        return await task
+
+    try:
+        assert asyncio.run(scenario()) is True
+    finally:
+        executor.shutdown()
+
+
+def test_run_rejects_when_saturated() -> None:
+    """
+    Test that calls beyond max_workers + max_queue are rejected immediately.
+    """
+    executor = DBExecutor(mode='threadpool', max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.create_task(executor.run(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(sum, [1])
+        release.set()
+        await asyncio.gather(*blocked)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+
+def test_run_times_out() -> None:
+    """
+    Test that a call running longer than the timeout raises ExecutorTimeout.
+    """
+    executor = DBExecutor(mode='threadpool', max_workers=1, max_queue=0, timeout=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(ExecutorTimeout):
+            asyncio.run(executor.run(release.wait, 5))
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_unknown_mode() -> None:
+    """
+    Test that an unknown execution mode is rejected.
+    """
+    with pytest.raises(ValueError):
+        DBExecutor(mode='processpool')
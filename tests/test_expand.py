@@ -0,0 +1,55 @@
+"""
+Test module for the expand.py foreign key expansions run by DBInterface.query
+"""
+import pytest
+import models
+from db_interface import DBInterface
+
+
+DB_INTERFACE = DBInterface()
+
+
+def query(**request_body) -> dict:
+    return DB_INTERFACE.query(DB_INTERFACE.metadata, models.QueryRequest(**request_body))
+
+
+def test_expand_many_to_one_and_nested_one_to_many() -> None:
+    """
+    Test that an album page nests its artist as an object and its tracks, with their genres, as lists.
+    """
+    result = query(table='Album', fields=['AlbumId', 'Title'], expand=['Artist', 'Track.Genre'], limit=3)
+    albums = result['result']
+    assert [album['AlbumId'] for album in albums] == [1, 2, 3]
+    assert set(albums[0]) == {'AlbumId', 'Title', 'Artist', 'Track'}
+    assert albums[0]['Artist'] == {'ArtistId': 1, 'Name': 'AC/DC'}
+    assert [len(album['Track']) for album in albums] == [10, 1, 3]
+    assert albums[1]['Track'][0]['Genre'] == {'GenreId': 1, 'Name': 'Rock'}
+    plain = query(table='Track', filters={'AlbumId': 1})['result']
+    assert [track['TrackId'] for track in albums[0]['Track']] == [track['TrackId'] for track in plain]
+
+
+def test_expand_pages_by_parent_rows() -> None:
+    """
+    Test that pagination counts parent rows, not joined rows.
+    """
+    first = query(table='Album', fields=['AlbumId'], expand=['Track'], limit=2)
+    assert len(first['result']) == 2
+    second = query(table='Album', fields=['AlbumId'], expand=['Track'], limit=2, cursor=first['next_cursor'])
+    assert [album['AlbumId'] for album in second['result']] == [3, 4]
+
+
+def test_expand_missing_relations() -> None:
+    """
+    Test that rows without related rows get null or an empty list.
+    """
+    employees = query(table='Employee', fields=['EmployeeId'], expand=['Employee', 'Customer'], limit=2)['result']
+    assert employees[0]['Employee'] is None and employees[0]['Customer'] == []
+    assert employees[1]['Employee']['EmployeeId'] == 1
+
+
+@pytest.mark.parametrize('expand', [['NoSuchTable'], ['Genre'], ['Track.Genre.Track'], ['Title']])
+def test_invalid_expansions(expand: list) -> None:
+    """
+    Test that unknown or unrelated tables, columns and paths deeper than max_expand_depth are rejected.
+    """
+    assert 'error' in query(table='Album', expand=expand)
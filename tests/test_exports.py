@@ -0,0 +1,176 @@
+"""
+Test module for the exports.py background export jobs
+"""
+import csv
+import gzip
+import io
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+import pytest
+import columnar
+import exports
+import models
+from db_interface import DBInterface
+from exports import ExportManager, ExportsSaturated
+
+
+DB_INTERFACE = DBInterface()
+
+
+def read_csv(path: Path) -> list:
+    with gzip.open(path, 'rt') as file:
+        return list(csv.reader(io.StringIO(file.read())))
+
+
+@pytest.mark.parametrize('mode', ['thread', 'process'])
+def test_csv_export(tmp_path: Path, mode: str) -> None:
+    """
+    Test that a job writes every matching row to a gzip compressed CSV file.
+    """
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode=mode, max_workers=1)
+    try:
+        job = manager.submit(models.QueryRequest(table='Track', fields=['TrackId', 'Name'], filters={'GenreId': 1}))
+        assert job.wait(timeout=60)
+    finally:
+        manager.close()
+    assert job.status == 'done'
+    rows = read_csv(job.path)
+    assert rows[0] == ['TrackId', 'Name']
+    assert len(rows) - 1 == job.rows == 1297
+    assert rows[1] == ['1', 'For Those About To Rock (We Salute You)']
+    assert job.bytes == job.path.stat().st_size
+    assert not list(tmp_path.glob('*.part'))
+    assert manager.stats()['done'] == 1
+
+
+def test_failed_export(tmp_path: Path) -> None:
+    """
+    Test that a failing job reports its error and leaves no file behind.
+    """
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode='thread')
+    job = manager.submit(models.QueryRequest(table='Track', fields=['NoSuchColumn']))
+    assert job.wait(timeout=10)
+    assert job.status == 'failed'
+    assert 'NoSuchColumn' in job.describe()['error']
+    assert not list(tmp_path.iterdir())
+    manager.close()
+
+
+def test_status_follows_recorded_outcome(tmp_path: Path) -> None:
+    """
+    Test that a job whose future is done is not reported done before its outcome is recorded.
+    """
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode='thread')
+    job = exports.ExportJob(models.QueryRequest(table='Genre'), 'csv', tmp_path)
+    job.future = Future()
+    job.future.set_running_or_notify_cancel()
+    job.future.set_exception(RuntimeError('disk full'))
+    assert job.status == 'running'
+    manager._finish(job, job.future)
+    assert job.status == 'failed'
+    assert job.describe()['error'] == 'disk full'
+
+
+def test_export_queue_limit_and_removal(tmp_path: Path, monkeypatch) -> None:
+    """
+    Test that submissions beyond max_pending are rejected and queued jobs can be cancelled.
+    """
+    release = threading.Event()
+
+    def blocked_export(interface, request, export_format, path):
+        release.wait(10)
+        return {'rows': 0, 'bytes': 0}
+
+    monkeypatch.setattr(exports, 'export_rows', blocked_export)
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode='thread', max_workers=1, max_pending=2)
+    request = models.QueryRequest(table='Genre')
+    running = manager.submit(request)
+    queued = manager.submit(request)
+    with pytest.raises(ExportsSaturated):
+        manager.submit(request)
+    assert manager.remove(queued.id)
+    assert manager.get(queued.id) is None
+    assert queued.status == 'cancelled'
+    release.set()
+    assert running.wait(timeout=10)
+    manager.close()
+
+
+class StartingFuture(Future):
+    """
+    A future that a worker picks up just as it is cancelled.
+    """
+    def cancel(self) -> bool:
+        self.set_running_or_notify_cancel()
+        return super().cancel()
+
+
+def test_remove_job_as_it_starts(tmp_path: Path) -> None:
+    """
+    Test that a job a worker picks up while it is being removed stays registered until it finishes.
+    """
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode='thread')
+    job = exports.ExportJob(models.QueryRequest(table='Genre'), 'csv', tmp_path)
+    job.future = StartingFuture()
+    manager.jobs[job.id] = job
+    assert job.status == 'queued'
+    assert not manager.remove(job.id)
+    assert manager.get(job.id) is job
+    assert job.status == 'running'
+    job.future.set_result({'rows': 0, 'bytes': 0})
+    manager._finish(job, job.future)
+    assert manager.remove(job.id)
+    assert manager.get(job.id) is None
+
+
+def test_expired_exports_are_removed(tmp_path: Path) -> None:
+    """
+    Test that finished jobs and their files are removed after the retention period.
+    """
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode='thread', retention=60)
+    job = manager.submit(models.QueryRequest(table='Genre'))
+    assert job.wait(timeout=10)
+    assert job.path.exists()
+    job.finished_at -= 120
+    assert manager.list() == []
+    assert not job.path.exists()
+    manager.close()
+
+
+def test_idle_exports_are_removed(tmp_path: Path) -> None:
+    """
+    Test that finished files are removed after a short retention period without any further calls.
+    """
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode='thread', retention=0.2)
+    try:
+        job = manager.submit(models.QueryRequest(table='Genre'))
+        assert job.wait(timeout=10)
+        deadline = time.monotonic() + 5
+        while job.path.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not job.path.exists()
+        assert job.id not in manager.jobs
+        assert manager.stats()['done'] == 0
+    finally:
+        manager.close()
+
+
+def test_parquet_export(tmp_path: Path) -> None:
+    """
+    Test that Parquet exports keep the reflected column types, and require pyarrow.
+    """
+    manager = ExportManager(DB_INTERFACE, tmp_path, mode='thread')
+    request = models.QueryRequest(table='Invoice', fields=['InvoiceId', 'Total'])
+    if columnar.pyarrow is None:
+        with pytest.raises(ValueError, match='pyarrow'):
+            manager.submit(request, 'parquet')
+        return
+    import pyarrow.parquet
+    job = manager.submit(request, 'parquet')
+    assert job.wait(timeout=30)
+    table = pyarrow.parquet.read_table(job.path)
+    assert table.num_rows == job.rows == 412
+    assert table.schema.field('Total').type == columnar.pyarrow.decimal128(10, 2)
+    manager.close()
@@ -0,0 +1,96 @@
+"""
+Test module for the filters.py filter operators
+"""
+import sqlite3
+from pathlib import Path
+import pytest
+import models
+from db_interface import DBInterface
+from filters import filter_shape, normalize_filters
+
+
+DB_INTERFACE = DBInterface()
+DB_PATH = Path(__file__).parent.parent / 'db' / 'chinook.db'
+
+
+def count_rows(sql: str, params: tuple = ()) -> int:
+    with sqlite3.connect(DB_PATH) as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+@pytest.mark.parametrize('filters, where, params', [
+    ({'Milliseconds': {'gte': 400000, 'lt': 500000}}, 'Milliseconds >= ? AND Milliseconds < ?', (400000, 500000)),
+    ({'GenreId': {'in': [3, 5, 9]}}, 'GenreId IN (3, 5, 9)', ()),
+    ({'GenreId': {'ne': 1}, 'AlbumId': {'lte': 10}}, 'GenreId != 1 AND AlbumId <= 10', ()),
+    ({'Name': {'startswith': 'The'}}, "Name >= 'The' AND Name < 'Thf'", ()),
+    ({'Composer': {'is_null': True}}, 'Composer IS NULL', ()),
+    ({'Composer': {'is_null': False}, 'MediaTypeId': 2}, 'Composer IS NOT NULL AND MediaTypeId = 2', ()),
+    ({'Composer': None}, 'Composer IS NULL', ()),
+    ({'Composer': {'eq': None}}, 'Composer IS NULL', ()),
+    ({'Composer': {'ne': None}, 'GenreId': 2}, 'Composer IS NOT NULL AND GenreId = 2', ()),
+])
+def test_filter_operators(filters: dict, where: str, params: tuple) -> None:
+    """
+    Test that each operator selects the same rows as the equivalent SQL.
+    """
+    request = models.QueryRequest(table='Track', fields=['TrackId'], filters=filters, limit=1000)
+    result = DB_INTERFACE.query(DB_INTERFACE.metadata, request)
+    assert 'error' not in result
+    assert len(result['result']) == count_rows(f'SELECT count(*) FROM Track WHERE {where}', params)
+
+
+def test_between_parses_datetime_strings() -> None:
+    """
+    Test that ISO strings are accepted as bounds on DATETIME columns.
+    """
+    filters = {'InvoiceDate': {'between': ['2010-01-01', '2010-01-31T23:59:59']}}
+    request = models.QueryRequest(table='Invoice', fields=['InvoiceId', 'InvoiceDate'], filters=filters)
+    result = DB_INTERFACE.query(DB_INTERFACE.metadata, request)
+    assert len(result['result']) == count_rows(
+        "SELECT count(*) FROM Invoice WHERE InvoiceDate BETWEEN '2010-01-01' AND '2010-01-31 23:59:59'"
+    )
+    assert all((row['InvoiceDate'].year, row['InvoiceDate'].month) == (2010, 1) for row in result['result'])
+
+
+@pytest.mark.parametrize('filters, where', [
+    ({'InvoiceDate': '2009-01-01 00:00:00'}, "InvoiceDate = '2009-01-01 00:00:00'"),
+    ({'InvoiceDate': {'eq': '2009-01-01T00:00:00'}}, "InvoiceDate = '2009-01-01 00:00:00'"),
+    ({'InvoiceDate': {'between': ['2009-01-01', '2009-01-02']}}, "InvoiceDate BETWEEN '2009-01-01 00:00:00' AND '2009-01-02 00:00:00'"),
+    ({'InvoiceDate': {'gte': '2013-12-22', 'lte': '2013-12-22'}}, "InvoiceDate = '2013-12-22 00:00:00'"),
+    ({'InvoiceDate': {'in': ['2009-01-01', '2009-01-02']}}, "InvoiceDate IN ('2009-01-01 00:00:00', '2009-01-02 00:00:00')"),
+])
+def test_datetime_filters_include_stored_boundaries(filters: dict, where: str) -> None:
+    """
+    Test that datetime filters match rows stored exactly on their bounds.
+    """
+    request = models.QueryRequest(table='Invoice', fields=['InvoiceId'], filters=filters)
+    result = DB_INTERFACE.query(DB_INTERFACE.metadata, request)
+    expected = count_rows(f'SELECT count(*) FROM Invoice WHERE {where}')
+    assert expected > 0
+    assert len(result['result']) == expected
+
+
+def test_filter_shape_ignores_bound_values() -> None:
+    """
+    Test that requests differing only in bound values share a statement shape.
+    """
+    first = filter_shape(normalize_filters({'A': {'lt': 1}, 'B': 2}))
+    second = filter_shape(normalize_filters({'B': 3, 'A': {'lt': 9}}))
+    assert first == second
+    assert filter_shape(normalize_filters({'A': {'is_null': True}})) != filter_shape(normalize_filters({'A': {'is_null': False}}))
+    assert filter_shape(normalize_filters({'A': None})) == filter_shape(normalize_filters({'A': {'is_null': True}}))
+
+
+@pytest.mark.parametrize('filters', [
+    {'GenreId': {'like': 'x'}},
+    {'GenreId': {}},
+    {'GenreId': {'in': 1}},
+    {'GenreId': {'between': [1]}},
+    {'Name': {'startswith': ''}},
+])
+def test_invalid_filters(filters: dict) -> None:
+    """
+    Test that unknown operators and unsuitable values are reported as errors.
+    """
+    result = DB_INTERFACE.query(DB_INTERFACE.metadata, models.QueryRequest(table='Track', filters=filters))
+    assert 'error' in result
@@ -0,0 +1,102 @@
+"""
+Test module for the hot_views.py precomputed views
+"""
+import json
+import threading
+import pytest
+import models
+from hot_views import HotView, HotViews, view_key
+
+
+def make_views(versions: list, results: list, interval: float = 0) -> HotViews:
+    request = models.QueryRequest(table='Genre', limit=5)
+    view = HotView('genres', 'query', request)
+
+    def compute(view: HotView) -> dict:
+        outcome = results.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return {'query': 'SELECT', 'result': outcome, 'next_cursor': None}
+
+    return HotViews([view], compute, lambda view: versions[-1], interval)
+
+
+def test_view_key_ignores_order_and_defaults() -> None:
+    """
+    Test that requests match a view whatever their field order and omitted defaults.
+    """
+    configured = models.QueryRequest.model_validate_json('{"limit": 5, "table": "Genre"}')
+    requested = models.QueryRequest(table='Genre', limit=5, fields=None)
+    assert view_key('query', configured) == view_key('query', requested)
+    assert view_key('query', configured) != view_key('query', models.QueryRequest(table='Genre', limit=6))
+    assert view_key('query', configured) != view_key('aggregate', configured)
+
+
+def test_refresh_on_version_change() -> None:
+    """
+    Test that a view is only computed again when its data version changes.
+    """
+    versions = [1]
+    views = make_views(versions, [[{'GenreId': 1}], [{'GenreId': 2}]])
+    assert views.refresh_all(force=True) == 1
+    snapshot = views.match('query', models.QueryRequest(table='Genre', limit=5))
+    assert snapshot.result['result'] == [{'GenreId': 1}]
+    assert json.loads(snapshot.body) == snapshot.result
+    assert views.refresh_all() == 0
+
+    versions.append(2)
+    assert views.refresh_all() == 1
+    new_snapshot = views.get('genres').snapshot
+    assert new_snapshot.result['result'] == [{'GenreId': 2}]
+    assert new_snapshot.etag != snapshot.etag
+    assert views.match('query', models.QueryRequest(table='Genre')) is None
+
+
+def test_failed_refresh_keeps_snapshot() -> None:
+    """
+    Test that a failing refresh is counted and the previous result is still served.
+    """
+    versions = [1]
+    views = make_views(versions, [[{'GenreId': 1}], RuntimeError('database is locked')])
+    views.refresh_all(force=True)
+    versions.append(2)
+    assert views.refresh_all() == 0
+    stats = views.stats()['genres']
+    assert stats['failures'] == 1
+    assert stats['error'] == 'database is locked'
+    assert stats['rows'] == 1
+    assert views.get('genres').snapshot.result['result'] == [{'GenreId': 1}]
+
+
+def test_background_refresh() -> None:
+    """
+    Test that the background thread refreshes a view after the data version changes.
+    """
+    versions = [1]
+    refreshed = threading.Event()
+    views = make_views(versions, [[{'GenreId': 1}], [{'GenreId': 2}]], interval=0.01)
+    views.refresh_all(force=True)
+    original_refresh = views.refresh
+
+    def refresh(view, force=False):
+        stored = original_refresh(view, force)
+        if stored:
+            refreshed.set()
+        return stored
+
+    views.refresh = refresh
+    views.start()
+    try:
+        versions.append(2)
+        assert refreshed.wait(5)
+    finally:
+        views.close()
+    assert views.get('genres').snapshot.result['result'] == [{'GenreId': 2}]
+
+
+def test_unknown_view_type() -> None:
+    """
+    Test that only query and aggregate views can be declared.
+    """
+    with pytest.raises(ValueError, match='Unknown type'):
+        HotView('genres', 'stream', models.QueryRequest(table='Genre'))
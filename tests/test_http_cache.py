@@ -0,0 +1,39 @@
+"""
+Test module for the http_cache.py ETag and Cache-Control helpers
+"""
+import pytest
+from http_cache import cache_control, etag_matches, make_etag
+
+
+def test_make_etag() -> None:
+    """
+    Test that ETags are quoted and depend on every part, whatever the key order of dicts.
+    """
+    etag = make_etag(1, 2, {'table': 'Album', 'limit': 5})
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag(1, 2, {'limit': 5, 'table': 'Album'})
+    assert etag != make_etag(1, 3, {'table': 'Album', 'limit': 5})
+
+
+@pytest.mark.parametrize('if_none_match, expected', [
+    (None, False),
+    ('', False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ('"xyz"', False),
+    ('*', True),
+])
+def test_etag_matches(if_none_match, expected) -> None:
+    """
+    Test the weak comparison of If-None-Match headers.
+    """
+    assert etag_matches(if_none_match, '"abc"') is expected
+
+
+def test_cache_control() -> None:
+    """
+    Test that a max age lets shared caches keep responses and 0 requires revalidation.
+    """
+    assert cache_control(60) == 'public, max-age=60'
+    assert cache_control(0) == 'no-cache'
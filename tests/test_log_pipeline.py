@@ -0,0 +1,72 @@
+"""
+Test module for the log_pipeline.py asynchronous logging pipeline
+"""
+import logging
+import threading
+import pytest
+from log_pipeline import LogPipeline, LogSampler, parse_sample_rates
+
+
+class BlockingHandler(logging.Handler):
+    """
+    Handler that records formatted messages and their formatting threads,
+    and waits to be unblocked before writing.
+    """
+    def __init__(self):
+        super().__init__()
+        self.unblocked = threading.Event()
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.unblocked.wait()
+        self.messages.append((self.format(record), threading.current_thread()))
+
+
+@pytest.fixture
+def logger() -> logging.Logger:
+    logger = logging.getLogger('test_log_pipeline')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    yield logger
+    logger.handlers.clear()
+
+
+def test_records_formatted_by_writer_and_dropped_when_full(logger: logging.Logger) -> None:
+    """
+    Test that messages are formatted on the writer thread and that a full queue drops records without blocking.
+    """
+    handler = BlockingHandler()
+    logger.addHandler(handler)
+    pipeline = LogPipeline(logger, queue_size=2)
+    for i in range(10):
+        logger.info('record %d', i)
+    stats = pipeline.stats()
+    assert stats['dropped'] >= 7
+    assert stats['queued'] + stats['dropped'] == 10
+
+    handler.unblocked.set()
+    pipeline.close()
+    assert handler.messages
+    assert all(thread is not threading.current_thread() for _, thread in handler.messages)
+    assert handler.messages[0][0] == 'record 0'
+    assert logger.handlers == [handler]
+
+
+def test_sampler() -> None:
+    """
+    Test that routes are sampled at their configured rate and other routes are always logged.
+    """
+    sampler = LogSampler(parse_sample_rates('query:0, stream:1'))
+    assert not any(sampler.sample('query') for _ in range(100))
+    assert all(sampler.sample('stream') for _ in range(100))
+    assert all(sampler.sample('batch') for _ in range(100))
+    assert sampler.sampled_out == 100
+
+
+@pytest.mark.parametrize('value', ['query', 'query:2', 'query:-0.5'])
+def test_invalid_sample_rates(value: str) -> None:
+    """
+    Test that malformed sampling rates are rejected.
+    """
+    with pytest.raises(ValueError):
+        parse_sample_rates(value)
@@ -0,0 +1,52 @@
+"""
+Test module for the metrics.py Prometheus metrics
+"""
+import threading
+from metrics import Metrics
+
+
+def test_counters_summed_across_threads() -> None:
+    """
+    Test that counters recorded on several threads are summed when rendered.
+    """
+    metrics = Metrics()
+
+    def record() -> None:
+        for _ in range(1000):
+            metrics.inc('db_rows_returned_total', (('table', 'Album'),), 2)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 'db_rows_returned_total{table="Album"} 8000\n' in metrics.render()
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    """
+    Test that histogram buckets, sum and count follow the exposition format.
+    """
+    metrics = Metrics(buckets=(0.1, 1.0))
+    labels = (('route', '/query/'), ('method', 'POST'), ('status', '200'))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        metrics.observe('http_request_duration_seconds', labels, value)
+    lines = metrics.render().splitlines()
+    prefix = 'http_request_duration_seconds_bucket{route="/query/",method="POST",status="200"'
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert f'{prefix},le="0.1"}} 1' in lines
+    assert f'{prefix},le="1"}} 3' in lines
+    assert f'{prefix},le="+Inf"}} 4' in lines
+    assert 'http_request_duration_seconds_sum{route="/query/",method="POST",status="200"} 6.05' in lines
+    assert 'http_request_duration_seconds_count{route="/query/",method="POST",status="200"} 4' in lines
+
+
+def test_extra_samples_and_label_escaping() -> None:
+    """
+    Test that extra samples are rendered with their type and that label values are escaped.
+    """
+    metrics = Metrics()
+    metrics.inc('db_rows_returned_total', (('table', 'a"b'),), 1)
+    text = metrics.render([('db_pool_size', 'gauge', 'Connections kept in the pool.', (), 8)])
+    assert 'db_rows_returned_total{table="a\\"b"} 1' in text
+    assert '# TYPE db_pool_size gauge\ndb_pool_size 8\n' in text
@@ -0,0 +1,96 @@
+"""
+Test module for the result_cache.py ResultCache
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from result_cache import ResultCache
+
+
+def test_hits_until_version_changes() -> None:
+    """
+    Test that results are served from the cache until the data version changes.
+    """
+    cache = ResultCache()
+    calls = []
+    compute = lambda: calls.append(1) or {'result': [len(calls)]}
+    assert cache.get_or_compute('q', 1, compute) == {'result': [1]}
+    assert cache.get_or_compute('q', 1, compute) == {'result': [1]}
+    assert cache.get_or_compute('q', 2, compute) == {'result': [2]}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (1, 2, 1)
+
+
+def test_versions_are_kept_per_scope() -> None:
+    """
+    Test that a new data version of one scope only drops the entries of that scope.
+    """
+    cache = ResultCache()
+    for _ in range(3):
+        assert cache.get_or_compute('q', 1, lambda: 'first', scope='first') == 'first'
+        assert cache.get_or_compute('q2', 7, lambda: 'second', scope='second') == 'second'
+    assert cache.get_or_compute('q', 2, lambda: 'changed', scope='first') == 'changed'
+    assert cache.get_or_compute('q2', 7, lambda: 'recomputed', scope='second') == 'second'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (5, 3, 1)
+
+
+def test_evicts_by_entries_and_bytes() -> None:
+    """
+    Test that the least recently used entries are evicted when either bound is exceeded.
+    """
+    cache = ResultCache(max_entries=2, max_bytes=1000)
+    for key in ('a', 'b', 'c'):
+        cache.get_or_compute(key, 1, lambda: {'result': [key]})
+    assert len(cache) == 2
+    cache.get_or_compute('large', 1, lambda: {'result': ['x' * 970]})
+    assert len(cache) == 1
+    assert cache.bytes <= 1000
+    assert cache.stats()['evictions'] == 3
+
+
+def test_ttl_expires_entries() -> None:
+    """
+    Test that entries older than the TTL are computed again.
+    """
+    cache = ResultCache(ttl=0.01)
+    cache.get_or_compute('q', 1, lambda: 'old')
+    time.sleep(0.02)
+    assert cache.get_or_compute('q', 1, lambda: 'new') == 'new'
+
+
+def test_concurrent_misses_are_coalesced() -> None:
+    """
+    Test that identical concurrent misses run the computation once.
+    """
+    cache = ResultCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(cache.get_or_compute, 'q', 1, compute) for _ in range(4)]
+        time.sleep(0.05)
+        release.set()
+        assert [future.result() for future in futures] == ['value'] * 4
+    assert len(calls) == 1
+    assert cache.stats()['coalesced'] == 3
+
+
+def test_errors_are_not_cached() -> None:
+    """
+    Test that a failed computation is raised and not cached.
+    """
+    cache = ResultCache()
+
+    def compute():
+        raise KeyError('NoSuchField')
+
+    with pytest.raises(KeyError):
+        cache.get_or_compute('q', 1, compute)
+    assert len(cache) == 0
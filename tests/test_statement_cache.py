@@ -0,0 +1,46 @@
+"""
+Test module for the statement_cache.py StatementCache
+"""
+import pytest
+from statement_cache import StatementCache
+
+
+def test_get_or_build_counts_hits_and_misses() -> None:
+    """
+    Test that an entry is built once and then served from the cache.
+    """
+    cache = StatementCache(maxsize=2)
+    built = []
+    for _ in range(3):
+        entry = cache.get_or_build('shape', lambda: built.append(1) or 'statement')
+        assert entry == 'statement'
+    assert len(built) == 1
+    assert cache.stats() == {'size': 1, 'maxsize': 2, 'hits': 2, 'misses': 1}
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    """
+    Test that the cache evicts the least recently used shape once it is full.
+    """
+    cache = StatementCache(maxsize=2)
+    cache.get_or_build('a', lambda: 'a')
+    cache.get_or_build('b', lambda: 'b')
+    cache.get_or_build('a', lambda: 'a')
+    cache.get_or_build('c', lambda: 'c')
+    assert len(cache) == 2
+    cache.get_or_build('b', lambda: 'rebuilt')
+    assert cache.stats()['misses'] == 4
+
+
+def test_failed_build_is_not_cached() -> None:
+    """
+    Test that a shape whose statement cannot be built is not cached.
+    """
+    cache = StatementCache()
+
+    def build():
+        raise KeyError('NoSuchField')
+
+    with pytest.raises(KeyError):
+        cache.get_or_build('bad', build)
+    assert len(cache) == 0